@@ -0,0 +1,378 @@
+# Live advisor: the exact EV of every bet for the cards that are left in the shoe.
+# contunt_2.py estimates P(Tie | count) with a Monte Carlo over millions of hands, and a count only sees the
+# composition through a handful of weights. At a table we know the whole composition (13 numbers), and the
+# probability of every hand key (payouts.py) given the composition can be computed exactly:
+#   - the first four cards matter by rank (pairs), but rank sequences with the same values, totals and pair
+#     flags give the same hand, so the 13^4 rank sequences collapse into ~3000 "signatures",
+#   - the fifth and sixth cards only matter by value, and only when the third card rules draw them,
+# which leaves ~100k (signature, fifth, sixth) terms. Their hand keys never change, only their weights do, so
+# exact_key_probabilities is a few gathers and one bincount (a few milliseconds) for any composition.
+#
+# That is still too slow to redo on every card, so the Advisor keeps an anchor: the exact EVs at some
+# composition and their effect of removal (EOR) per rank, EV(composition - one card of rank r) - EV. After
+# every observed card the EVs are moved by the EOR of its rank (13 x bets numbers, microseconds), and
+# refresh() recomputes the anchor exactly at the current composition, for example between two hands.
+#
+#   advisor = Advisor(STANDARD)
+#   for card in ["K", "5", "8", "3", "9"]:
+#       advisor.observe(card)
+#   advisor.evs()          # {"Player": ..., "Banker": ..., "Tie": ..., side bets ...}
+#   advisor.counts()       # running and true count of every system in contunt_2.COUNTING_SYSTEMS
+#   advisor.refresh()      # exact again
+#
+# replay() does the same for whole recorded shoes at once and returns the EVs before every hand.
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from bacc import cards
+from batch_bacc import BANKER_DRAWS, NUM_RANKS, RANK_VALUES, count_weight_matrix, deal_shoes
+from counted_shoe import RANK_INDEX
+from payouts import NUM_KEYS
+from rules import STANDARD, compile_rules
+
+# One-hot rank -> value, to get the number of cards of every value from a composition.
+VALUE_OF_RANK = np.eye(10, dtype=np.int64)[RANK_VALUES]
+NO_CARD = 10
+
+
+# EXACT PROBABILITIES
+
+
+@lru_cache(maxsize=None)
+def _terms():
+    # The parts of the exact computation that don't depend on the composition, built once.
+    r = np.indices((NUM_RANKS,) * 4).reshape(4, -1)
+    v = RANK_VALUES[r].astype(np.int64)
+    # seen[i]: how many of the cards before card i have its rank (the i-th card is drawn from what they left).
+    seen = np.array([sum((r[j] == r[i] for j in range(i)), np.zeros(r.shape[1], dtype=np.int64))
+                     for i in range(4)])
+    # Rank sequences with the same values (in any order that gives the same two totals) and the same pair flags
+    # lead to the same hands and draw the fifth and sixth cards from the same leftovers: one "signature".
+    player2 = (v[0] + v[1]) % 10
+    banker2 = (v[2] + v[3]) % 10
+    multiset = np.sort(v, axis=0)
+    signature = (multiset[0] + 10 * multiset[1] + 100 * multiset[2] + 1000 * multiset[3] + 10000 * player2
+                 + 100000 * banker2 + 1000000 * (r[0] == r[1]) + 2000000 * (r[2] == r[3]))
+    _, first, combination_signature = np.unique(signature, return_index=True, return_inverse=True)
+
+    sv = v[:, first]
+    player2, banker2 = player2[first], banker2[first]
+    pairs = 800 * (r[0] == r[1])[first] + 1600 * (r[2] == r[3])[first]
+    used = np.array([(sv == value).sum(axis=0) for value in range(10)] + [np.zeros(len(first), dtype=np.int64)]).T
+
+    natural = (player2 >= 8) | (banker2 >= 8)
+    player_draws = ~natural & (player2 <= 5)
+    banker_draws = ~natural & ~player_draws & BANKER_DRAWS[banker2, NO_CARD]
+    index = np.arange(len(first))
+
+    # Every term: (signature, fifth card value, sixth card value, hand key); NO_CARD when the card isn't drawn.
+    terms = []
+    stand = ~player_draws & ~banker_draws
+    terms.append((index[stand], NO_CARD, NO_CARD, (player2 + 10 * banker2 + 100 * natural + pairs)[stand]))
+    for fifth in range(10):
+        # The Player stands on 6 or 7 and the Banker draws.
+        b = banker_draws
+        terms.append((index[b], fifth, NO_CARD, (player2 + 10 * ((banker2 + fifth) % 10) + 400 + pairs)[b]))
+        # The Player draws; the Banker's third card depends on it.
+        player_total = (player2 + fifth) % 10
+        p = player_draws & ~BANKER_DRAWS[banker2, fifth]
+        terms.append((index[p], fifth, NO_CARD, (player_total + 10 * banker2 + 200 + pairs)[p]))
+        p = player_draws & BANKER_DRAWS[banker2, fifth]
+        for sixth in range(10):
+            terms.append((index[p], fifth, sixth,
+                          (player_total + 10 * ((banker2 + sixth) % 10) + 600 + pairs)[p]))
+
+    sig = np.concatenate([t[0] for t in terms])
+    fifth = np.concatenate([np.full(len(t[0]), t[1]) for t in terms])
+    sixth = np.concatenate([np.full(len(t[0]), t[2]) for t in terms])
+    key = np.concatenate([t[3] for t in terms])
+    return {
+        "ranks": r,
+        "seen": seen,
+        "combination_signature": combination_signature,
+        "signatures": len(first),
+        "sig": sig,
+        # Index into the factor tables of exact_key_probabilities: (card value, cards of that value used before).
+        "fifth": fifth * 6 + used[sig, fifth],
+        "sixth": sixth * 6 + used[sig, sixth] + ((fifth == sixth) & (sixth != NO_CARD)),
+        "key": key,
+    }
+
+
+def exact_key_probabilities(compositions):
+    # Probability of every hand key for the next hand, for one composition (13 counts per rank, in the order
+    # of bacc.cards) or a (compositions, 13) array of them. Returns (NUM_KEYS,) or (compositions, NUM_KEYS).
+    compositions = np.asarray(compositions, dtype=np.int64)
+    single = compositions.ndim == 1
+    c = np.atleast_2d(compositions)
+    t = _terms()
+    n = c.sum(axis=1, keepdims=True).astype(float)
+    if (n < 6).any():
+        raise ValueError("A hand can need 6 cards; the composition has fewer")
+
+    weight = np.ones((len(c), t["ranks"].shape[1]))
+    for i in range(4):
+        weight *= (c[:, t["ranks"][i]] - t["seen"][i]) / (n - i)
+    rows = np.arange(len(c))[:, None]
+    by_signature = np.bincount((rows * t["signatures"] + t["combination_signature"]).ravel(), weight.ravel(),
+                               minlength=len(c) * t["signatures"]).reshape(len(c), t["signatures"])
+
+    # factor[:, value * 6 + used]: chance that the next card has the given value when `used` cards of that value
+    # were among the cards before it. The NO_CARD rows are 1, so a card that isn't drawn changes nothing.
+    left = (c @ VALUE_OF_RANK)[:, :, None] - np.arange(6)
+    fifth = np.c_[left.reshape(len(c), -1) / (n - 4), np.ones((len(c), 6))]
+    sixth = np.c_[left.reshape(len(c), -1) / (n - 5), np.ones((len(c), 6))]
+    weight = by_signature[:, t["sig"]] * fifth[:, t["fifth"]] * sixth[:, t["sixth"]]
+    probabilities = np.bincount((rows * NUM_KEYS + t["key"]).ravel(), weight.ravel(),
+                                minlength=len(c) * NUM_KEYS).reshape(len(c), NUM_KEYS)
+    return probabilities[0] if single else probabilities
+
+
+def exact_evs(compositions, rules=STANDARD, chunk=8):
+    # EV of every bet type of the table (compile_rules(rules).bet_types) for the next hand, per composition.
+    # Compositions are evaluated a few at a time, so the temporary arrays stay small.
+    payouts = compile_rules(rules).payout_matrix
+    compositions = np.asarray(compositions, dtype=np.int64)
+    if compositions.ndim == 1:
+        return payouts @ exact_key_probabilities(compositions)
+    evs = np.zeros((len(compositions), len(payouts)))
+    for i in range(0, len(compositions), chunk):
+        evs[i:i + chunk] = exact_key_probabilities(compositions[i:i + chunk]) @ payouts.T
+    return evs
+
+
+def exact_eor(composition, rules=STANDARD):
+    # The EVs at a composition and the effect of removal of every rank: eor[:, r] is the change of the EVs
+    # when one more card of rank r leaves the shoe. Returns (evs, eor) with shapes (bets,) and (bets, 13).
+    composition = np.asarray(composition, dtype=np.int64)
+    removed = composition - np.eye(NUM_RANKS, dtype=np.int64)
+    # A rank that is gone can't be removed, and with 6 cards left nothing can (a hand may need all 6); those
+    # columns stay 0.
+    present = (composition > 0) & (composition.sum() > 6)
+    evs = exact_evs(np.vstack([composition, removed[present]]), rules)
+    eor = np.zeros((evs.shape[1], NUM_RANKS))
+    eor[:, present] = (evs[1:] - evs[0]).T
+    return evs[0], eor
+
+
+@lru_cache(maxsize=None)
+def full_shoe_eor(rules=STANDARD):
+    # The precomputed table: EVs and EOR of a full shoe (computed once per rules).
+    evs, eor = exact_eor(np.full(NUM_RANKS, 4 * rules.number_of_decks), rules)
+    evs.setflags(write=False)
+    eor.setflags(write=False)
+    return evs, eor
+
+
+# THE LINEAR UPDATE
+# Near an anchor composition a (n_a cards) with EVs E_a and EOR G, the EVs at a composition c (n cards) are
+#   EV(c) ~ E_a + (n_a - 1) / n * G @ (a - c).
+# The EVs depend on the shares of the ranks, and removing the cards a - c moves the shares by (n_a - 1) / n
+# times as much as the single-card removals G was measured with. The EOR of a full shoe carries over to an
+# anchor with n_a cards as G = EOR_full * (N - 1) / (n_a - 1), so with the precomputed table the update is
+# EV(c) ~ E_a + (N - 1) / n * EOR_full @ (a - c).
+
+
+class Advisor:
+    # Counts and EVs of a live shoe, one observed card at a time.
+    #   exact_every - the EVs are recomputed exactly (a few ms) after every `exact_every` completed hands;
+    #                 None keeps the linear update from the last anchor (every card is then microseconds)
+    #   local_eor   - at every exact anchor also recompute the EOR there (13 more exact evaluations); otherwise
+    #                 the precomputed full-shoe EOR is used, which gets less accurate deep in the shoe
+
+    def __init__(self, rules=STANDARD, systems=None, exact_every=1, local_eor=False, min_decks=1.5):
+        from contunt_2 import COUNTING_SYSTEMS
+
+        compiled = compile_rules(rules)
+        self.rules = rules
+        self.bet_types = compiled.bet_types
+        self.burn = compiled.burn
+        self.size = compiled.shoe_size
+        systems = COUNTING_SYSTEMS if systems is None else systems
+        self.systems = list(systems)
+        self.weights = count_weight_matrix([systems[name] for name in self.systems])
+        self.exact_every = exact_every
+        self.local_eor = local_eor
+        self.min_decks = min_decks
+        self.full = np.full(NUM_RANKS, 4 * rules.number_of_decks, dtype=np.int64)
+        self.reset()
+
+    def reset(self):
+        # A new shoe: the full composition is the first anchor.
+        self.composition = self.full.copy()
+        self.running = np.zeros(len(self.systems), dtype=np.int64)
+        self.remaining = self.size - self.burn
+        self.hand = []
+        self.hands = 0
+        self._set_anchor(*full_shoe_eor(self.rules), self.size - 1)
+
+    def _set_anchor(self, evs, eor, scale):
+        # scale: (n_a - 1) for an EOR measured at the anchor, N - 1 for the full-shoe EOR.
+        self.anchor = self.composition.copy()
+        self.anchor_evs = evs
+        self.anchor_eor = eor
+        self.anchor_scale = scale
+        self.since_anchor = np.zeros(NUM_RANKS, dtype=np.int64)  # a - c
+
+    def observe(self, card):
+        # A dealt card, as a rank 0..12 or a card name like "K".
+        rank = RANK_INDEX[card] if isinstance(card, str) else int(card)
+        if self.composition[rank] == 0:
+            raise ValueError(f"No {cards[rank]} left in the shoe")
+        self.composition[rank] -= 1
+        self.since_anchor[rank] += 1
+        self.running += self.weights[:, rank]
+        self.remaining -= 1
+        self.hand.append(rank)
+        if len(self.hand) == cards_in_hand(self.hand):
+            self.hand = []
+            self.hands += 1
+            if self.exact_every and self.hands % self.exact_every == 0 and self.composition.sum() >= 6:
+                self.refresh()
+        return self
+
+    def observe_many(self, observed):
+        for card in observed:
+            self.observe(card)
+        return self
+
+    def refresh(self):
+        # Exact EVs (and with local_eor the EOR) at the current composition, which becomes the new anchor.
+        if self.local_eor:
+            evs, eor = exact_eor(self.composition, self.rules)
+            self._set_anchor(evs, eor, self.composition.sum() - 1)
+        else:
+            self._set_anchor(exact_evs(self.composition, self.rules), full_shoe_eor(self.rules)[1], self.size - 1)
+        return self
+
+    def ev_vector(self):
+        n = self.composition.sum()
+        return self.anchor_evs + self.anchor_scale / n * (self.anchor_eor @ self.since_anchor)
+
+    def evs(self):
+        return dict(zip(self.bet_types, self.ev_vector().tolist()))
+
+    def counts(self):
+        # Running and true count of every system, {system: (running, true)}.
+        decks = max(self.remaining / 52, self.min_decks)
+        return {name: (int(running), float(running) / decks) for name, running in zip(self.systems, self.running)}
+
+    def state(self):
+        # Everything at once, as one flat row (handy for a DataFrame of snapshots).
+        row = {"hands": self.hands, "remaining": self.remaining}
+        for name, (running, true) in self.counts().items():
+            row[f"{name} running"] = running
+            row[f"{name} true"] = true
+        for bet, ev in self.evs().items():
+            row[f"EV {bet}"] = ev
+        return row
+
+    # As a dealer.Dealer observer.
+
+    def on_card(self, card, shoe):
+        self.observe(card)
+
+    def on_reshuffle(self, shoe):
+        self.reset()
+
+
+def cards_in_hand(hand):
+    # How many cards a hand needs, as far as its first cards tell (the third card rules of bacc.py).
+    if len(hand) < 4:
+        return 4
+    player2 = (RANK_VALUES[hand[0]] + RANK_VALUES[hand[1]]) % 10
+    banker2 = (RANK_VALUES[hand[2]] + RANK_VALUES[hand[3]]) % 10
+    if player2 >= 8 or banker2 >= 8:
+        return 4
+    if player2 <= 5:
+        if len(hand) < 5:
+            return 5
+        return 6 if BANKER_DRAWS[banker2, RANK_VALUES[hand[4]]] else 5
+    return 5 if banker2 <= 5 else 4
+
+
+# REPLAY
+
+
+def replay(shoes, rules=STANDARD, systems=None, exact_every=None, local_eor=False, min_decks=1.5):
+    # The Advisor over whole shoes at once. shoes: (shoes, cards) array of ranks, dealt from index 0 like
+    # batch_bacc. The hands are reconstructed with the third card rules (batch_bacc.deal_shoes) and every hand
+    # gets the counts and EVs from before it was dealt, one row per hand:
+    #   shoe, hand (index within the shoe), remaining, outcome, key, "<system> running", "<system> true",
+    #   "EV <bet>" for every bet type of the rules.
+    # exact_every=None uses only the precomputed full-shoe EOR (millions of hands per second); exact_every=k
+    # anchors exactly at every k-th hand of a shoe (a few ms per anchor, about 50 ms with local_eor).
+    from contunt_2 import COUNTING_SYSTEMS
+
+    compiled = compile_rules(rules)
+    systems = COUNTING_SYSTEMS if systems is None else systems
+    names = list(systems)
+    weights = count_weight_matrix([systems[name] for name in names])
+    shoes = np.asarray(shoes, dtype=np.int8)
+    dealt = deal_shoes(shoes, compiled.reshuffle_at, compiled.burn)
+    shoe, start = dealt["shoe"], dealt["start"].astype(np.int64)
+    first = np.r_[0, np.flatnonzero(np.diff(shoe)) + 1]
+    hand = np.arange(len(shoe)) - np.repeat(first, np.diff(np.r_[first, len(shoe)]))
+
+    # Cards of every rank seen before each hand (burned cards are never seen).
+    seen = np.zeros((shoes.shape[0], shoes.shape[1] + 1, NUM_RANKS), dtype=np.int16)
+    np.cumsum(np.eye(NUM_RANKS, dtype=np.int16)[shoes], axis=1, out=seen[:, 1:])
+    seen = seen[shoe, start] - seen[shoe, compiled.burn]
+    full = np.full(NUM_RANKS, 4 * rules.number_of_decks, dtype=np.int64)
+    composition = full - seen
+    n = composition.sum(axis=1)
+
+    # Every hand's anchor: the full shoe, or the last exact anchor hand of its shoe.
+    evs_full, eor_full = full_shoe_eor(rules)
+    if not exact_every:
+        evs = evs_full + ((compiled.shoe_size - 1.0) / n)[:, None] * ((full - composition) @ eor_full.T)
+    else:
+        anchors = np.flatnonzero(hand % exact_every == 0)
+        anchor_of = np.searchsorted(anchors, np.arange(len(shoe)), side="right") - 1
+        difference = composition[anchors][anchor_of] - composition
+        if local_eor:
+            exact = [exact_eor(composition[a], rules) for a in anchors]
+            at_anchor = np.array([e for e, _ in exact])
+            eor = np.array([g for _, g in exact])
+            step = np.einsum("hbr,hr->hb", eor[anchor_of], difference)
+            scale = n[anchors][anchor_of] - 1.0
+        else:
+            at_anchor = exact_evs(composition[anchors], rules)
+            step = difference @ eor_full.T
+            scale = compiled.shoe_size - 1.0
+        evs = at_anchor[anchor_of] + (scale / n)[:, None] * step
+
+    remaining = shoes.shape[1] - start
+    running = seen @ weights.T
+    true = running / np.maximum(remaining / 52, min_decks)[:, None]
+    table = {"shoe": shoe, "hand": hand, "remaining": remaining, "outcome": dealt["outcome"], "key": dealt["key"]}
+    for i, name in enumerate(names):
+        table[f"{name} running"] = running[:, i]
+        table[f"{name} true"] = true[:, i]
+    for i, bet in enumerate(compiled.bet_types):
+        table[f"EV {bet}"] = evs[:, i]
+    return pd.DataFrame(table)
+
+
+if __name__ == "__main__":
+    import time
+
+    from batch_bacc import build_shoes
+
+    advisor = Advisor(STANDARD, exact_every=None)
+    shoe = build_shoes(1, 8, np.random.default_rng(0))[0]
+    started = time.perf_counter()
+    for card in shoe[:300]:
+        advisor.observe(int(card))
+        advisor.ev_vector()
+    print(f"Live advisor: {(time.perf_counter() - started) / 300 * 1e6:.1f} microseconds per card")
+    print(advisor.state())
+
+    started = time.perf_counter()
+    trace = replay(build_shoes(2000, 8, np.random.default_rng(1)), STANDARD)
+    elapsed = time.perf_counter() - started
+    print(f"\nReplay: {len(trace):,} hands in {elapsed:.2f}s ({len(trace) / elapsed:,.0f} hands per second)")
+    print("Hands with a positive Tie EV:", int((trace["EV Tie"] > 0).sum()))
@@ -1,17 +1,28 @@
 import random
+from array import array
 
 cards = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K']
 values = {'A': 1, '2': 2, '3': 3, '4': 4, '5': 5, '6': 6, '7': 7, '8': 8, '9': 9, '10': 0, 'J': 0, 'Q': 0, 'K': 0}
 
+# Outcomes are stored as small integer codes (one byte each in an array('b') or an int8 NumPy array).
+# We only turn them into the strings 'Player'/'Banker'/'Tie' when we report results.
+PLAYER, BANKER, TIE = 0, 1, 2
+OUTCOMES = ['Player', 'Banker', 'Tie']
+OUTCOME_CODES = {'Player': PLAYER, 'Banker': BANKER, 'Tie': TIE}
+
 # Building the dealer's shoe. Since we only care about card values and not their suits, we append 4 same cards for each deck.
-# We then shuffle the shoe.
-def build_shoe(number_of_decks = 8):
+# We then shuffle the shoe. shuffle can be a shuffle model from shuffles.py (riffles, strips, ...) instead of
+# the perfectly uniform random.shuffle.
+def build_shoe(number_of_decks = 8, shuffle=None):
     shoe = []
     for i in range(number_of_decks):
         for card in cards:
             for suit in range(4):
                 shoe.append(card)
-    random.shuffle(shoe)
+    if shuffle is None:
+        random.shuffle(shoe)
+    else:
+        shuffle(shoe)
     return shoe
 
 # We then define drawing cards from a shoe.
@@ -53,51 +64,88 @@ def decide_outcome(player_total, banker_total):
         return 'Banker'
     else:
         return 'Tie'
-    
-def play_bacc(shoe):
 
-    # Ensure enough cards before the hand starts.
-    if len(shoe) < 6:
-        shoe[:] = build_shoe(8)
-    # We first deal the initial two hands.
-    player, banker = first_deal(shoe)
-
-    # Computing the initial values of each hand.
-    player_total = hand_value(player)
-    banker_total = hand_value(banker)
-
-    # Natural wins:
-    if player_total in {8, 9} or banker_total in {8, 9}:
-        return decide_outcome(player_total, banker_total) # tuki bi lahko mogoče returnala use statse po koncu igre?
-    
+def decide_outcome_code(player_total, banker_total):
+    if player_total > banker_total:
+        return PLAYER
+    elif banker_total > player_total:
+        return BANKER
     else:
-        player_third = None
+        return TIE
+    
+# Replacing an exhausted shoe in place with a fresh one, burning the given number of cards.
+# The table rules (decks, cut card, burn) are described in rules.py.
+def new_shoe(shoe, number_of_decks=8, burn=0, shuffle=None):
+    shoe[:] = build_shoe(number_of_decks, shuffle)
+    if burn:
+        del shoe[-burn:]
+
+# BANKER_DRAWS[banker_total][player_third_value], a lookup table of banker_draws_third for the hand engine.
+BANKER_DRAWS = tuple(tuple(banker_draws_third(total, third) for third in range(10)) for total in range(10))
+
+# The hand engine: the third card rules, played on any source of cards.
+# draw() returns the next card and value[card] its points, so the same code deals the strings of a list shoe
+# (draw=shoe.pop, value=values) and the ranks 0..12 of a CountedShoe (draw=shoe.draw, value=RANK_VALUES),
+# and observers can wrap draw. Returns the outcome code and the cards of both hands.
+def play_hand(draw, value=values):
+    player = [draw(), draw()]
+    banker = [draw(), draw()]
+    player_total = (value[player[0]] + value[player[1]]) % 10
+    banker_total = (value[banker[0]] + value[banker[1]]) % 10
+
+    # Naturals (8 or 9) end the hand straight away.
+    if player_total < 8 and banker_total < 8:
         if player_total <= 5:
-            player_third = draw(shoe)
-            player.append(player_third)
-            player_total = hand_value(player)
-
-        banker_third = None
-
-        if player_third is None:
-            # Player didn't draw a third card
-            # Banker draws on 0–5, stands on 6–7
-            if banker_total <= 5:
-                banker_third = draw(shoe)
-                banker.append(banker_third)
-                banker_total = hand_value(banker)
-        
-        else:
-            # Player drew a third card
-            player_third_value = values[player_third]
-            if banker_draws_third(banker_total, player_third_value):
-                banker_third = draw(shoe)
-                banker.append(banker_third)
-                banker_total = hand_value(banker)
+            card = draw()
+            player.append(card)
+            player_third_value = value[card]
+            player_total = (player_total + player_third_value) % 10
+            if BANKER_DRAWS[banker_total][player_third_value]:
+                card = draw()
+                banker.append(card)
+                banker_total = (banker_total + value[card]) % 10
+        # Player stood, so the Banker draws on 0–5 and stands on 6–7.
+        elif banker_total <= 5:
+            card = draw()
+            banker.append(card)
+            banker_total = (banker_total + value[card]) % 10
+
+    # decide_outcome_code, inlined: this runs for every hand of the counting simulations.
+    if player_total > banker_total:
+        return PLAYER, player, banker
+    if banker_total > player_total:
+        return BANKER, player, banker
+    return TIE, player, banker
 
-        return decide_outcome(player_total, banker_total)  
+# Dealing a whole hand from a list shoe and returning the cards of both hands (needed for side bets).
+def deal_bacc(shoe, number_of_decks=8, cut_cards=6, burn=0, shuffle=None):
 
-        
+    if len(shoe) < cut_cards:
+        new_shoe(shoe, number_of_decks, burn, shuffle)
+    _, player, banker = play_hand(shoe.pop)
+    return player, banker
 
+# The same hand, returning only the outcome code.
+def play_bacc_code(shoe, number_of_decks=8, cut_cards=6, burn=0, shuffle=None):
 
+    # Ensure enough cards before the hand starts.
+    if len(shoe) < cut_cards:
+        new_shoe(shoe, number_of_decks, burn, shuffle)
+    return play_hand(shoe.pop)[0]
 
+def play_bacc(shoe):
+    return OUTCOMES[play_bacc_code(shoe)]
+
+# Playing many hands and storing the outcome codes in a compact array (1 byte per hand).
+# np.frombuffer(outcomes, dtype=np.int8) gives a NumPy view of it without copying.
+def generate_outcomes(hands_number, shoe=None, number_of_decks=8, cut_cards=6, burn=0, shuffle=None):
+    if shoe is None:
+        shoe = build_shoe(number_of_decks, shuffle)
+    outcomes = array('b', bytes(hands_number))
+    for i in range(hands_number):
+        outcomes[i] = play_bacc_code(shoe, number_of_decks, cut_cards, burn, shuffle)
+    return outcomes
+
+# Turning codes back into strings, for reports and CSV files.
+def outcome_names(outcomes):
+    return [OUTCOMES[o] for o in outcomes]
@@ -0,0 +1,327 @@
+# Simulations that run in the background.
+# A long cell like compare_methods with 1M hands blocks the notebook kernel until it is done, so the notebook
+# keeps runs small. Here a run is split into chunks that are dealt on a process (or thread) pool, while a
+# small driver thread merges every finished chunk into the partial result. start_* returns immediately with
+# a BackgroundRun handle:
+#   run.progress()   - chunks and hands done, elapsed time, rate and ETA
+#   run.partial()    - the result merged so far (the same tables the blocking functions return)
+#   run.cancel()     - stop early; the chunks merged so far stay available
+#   run.result()     - block until the run is finished (or cancelled)
+#   await run        - the same in asyncio (a notebook cell can `await run`)
+#   run.watch(2.0)   - async generator of partial results, for watching estimates converge
+# With a stopping rule (stop_when, or target_se of start_counting / start_ev) the run also ends by itself, in
+# state "converged", as soon as the merged result is precise enough - long runs only go on where the
+# batch-means standard errors (see batch_means.py) are still too large.
+#
+#   run = start_counting("Even-Good", "true", hands=50_000_000)
+#   run.progress()
+#   analyze_results(run.partial(), "TRUE COUNT", "Even-Good")
+#   run.cancel()
+
+import asyncio
+import math
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from bacc import TIE
+from batch_means import ratio_se, shoe_sums
+from corpus import deal_chunk, bin_counts, count_bins, shoe_numbers
+from payouts import NUM_KEYS
+from rules import COUNTING, STANDARD, compile_rules, deal_batch
+
+CHUNK_HANDS = 200_000
+
+
+class BackgroundRun:
+
+    def __init__(self, chunk_fn, chunks, accumulator, executor="process", workers=None, on_update=None,
+                 stop_when=None):
+        # chunks: list of (hands, args) - chunk_fn(*args) runs in the pool and accumulator.add merges its result.
+        # stop_when(accumulator) -> bool is checked after every merged chunk.
+        self.chunks = chunks
+        self.accumulator = accumulator
+        self.on_update = on_update
+        self.stop_when = stop_when
+        self.converged = False
+        self.hands = sum(hands for hands, _ in chunks)
+        self.chunks_done = 0
+        self.hands_done = 0
+        self.started = time.time()
+        self.finished = None
+        self.state = "running"
+        self.lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._done = Future()
+
+        workers = workers or os.cpu_count()
+        pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+        self.pool = pool_class(max_workers=workers)
+        self.thread = threading.Thread(target=self._drive, args=(chunk_fn, workers), daemon=True)
+        self.thread.start()
+
+    def _drive(self, chunk_fn, workers):
+        # Only a couple of chunks per worker are submitted at a time, so a cancelled run doesn't leave a long
+        # queue of chunks behind, and the partial result grows evenly.
+        pending = iter(self.chunks)
+        in_flight = {}
+        try:
+            while True:
+                while not self._cancel.is_set() and len(in_flight) < 2 * workers:
+                    chunk = next(pending, None)
+                    if chunk is None:
+                        break
+                    in_flight[self.pool.submit(chunk_fn, *chunk[1])] = chunk[0]
+                if not in_flight or self._cancel.is_set():
+                    break
+                done, _ = wait(in_flight, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    hands = in_flight.pop(future)
+                    result = future.result()
+                    with self.lock:
+                        self.accumulator.add(result)
+                        self.chunks_done += 1
+                        self.hands_done += hands
+                        if self.stop_when is not None and not self.converged and self.stop_when(self.accumulator):
+                            self.converged = True
+                            self._cancel.set()
+                    if self.on_update is not None:
+                        self.on_update(self)
+        except Exception as e:
+            self._finish("failed")
+            self._done.set_exception(e)
+            return
+        self._finish("converged" if self.converged else "cancelled" if self._cancel.is_set() else "finished")
+        self._done.set_result(self.partial())
+
+    def _finish(self, state):
+        # Chunks still running in a worker process can't be interrupted; we just stop waiting for them.
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            self.state = state
+            self.finished = time.time()
+
+    def cancel(self):
+        self._cancel.set()
+        return self
+
+    def done(self):
+        return self._done.done()
+
+    def progress(self):
+        with self.lock:
+            elapsed = (self.finished or time.time()) - self.started
+            rate = self.hands_done / elapsed if elapsed > 0 else 0.0
+            left = self.hands - self.hands_done
+            return {
+                "state": self.state,
+                "chunks_done": self.chunks_done,
+                "chunks": len(self.chunks),
+                "hands_done": self.hands_done,
+                "hands": self.hands,
+                "fraction": self.hands_done / self.hands if self.hands else 1.0,
+                "elapsed": elapsed,
+                "hands_per_second": rate,
+                "eta": 0.0 if self.state != "running" else (left / rate if rate > 0 else math.inf),
+            }
+
+    def partial(self):
+        with self.lock:
+            return self.accumulator.result()
+
+    def result(self, timeout=None):
+        return self._done.result(timeout)
+
+    def __await__(self):
+        return asyncio.wrap_future(self._done).__await__()
+
+    async def watch(self, interval=1.0):
+        # Yields (progress, partial result) every `interval` seconds, and once more when the run has ended.
+        while not self.done():
+            yield self.progress(), self.partial()
+            await asyncio.sleep(interval)
+        yield self.progress(), self.partial()
+
+    def __repr__(self):
+        p = self.progress()
+        return (f"BackgroundRun({p['state']}, {p['hands_done']:,}/{p['hands']:,} hands, "
+                f"{p['elapsed']:.1f}s elapsed, ETA {p['eta']:.1f}s)")
+
+
+def split_hands(hands, chunk_hands):
+    return [min(chunk_hands, hands - begin) for begin in range(0, hands, chunk_hands)]
+
+
+# EV PER BET
+
+
+def _ev_chunk(hands, rules, seed, chunk_index):
+    # Histogram of the hand keys of `hands` freshly dealt hands; every bet settles from it. The per-shoe sums
+    # of every bet's profit give the batch-means standard errors.
+    rng = np.random.default_rng([seed, chunk_index])
+    compiled = compile_rules(rules)
+    hands_per_shoe = max(1, (compiled.shoe_size - compiled.reshuffle_at - compiled.burn) / 5)
+    histogram = np.zeros(NUM_KEYS, dtype=np.int64)
+    sums = None
+    shoes = 0
+    dealt = 0
+    while dealt < hands:
+        batch = deal_batch(math.ceil((hands - dealt) / hands_per_shoe) + 1, rules, rng)
+        keys = batch["key"][:hands - dealt]
+        histogram += np.bincount(keys, minlength=NUM_KEYS)
+        part = shoe_sums(batch["shoe"][:len(keys)], compiled.payout_matrix[:, keys])
+        sums = part if sums is None else tuple(a + b for a, b in zip(sums, part))
+        shoes += len(np.unique(batch["shoe"][:len(keys)]))
+        dealt += len(keys)
+    return histogram, sums, shoes
+
+
+class EVAccumulator:
+
+    def __init__(self, rules):
+        self.compiled = compile_rules(rules)
+        self.histogram = np.zeros(NUM_KEYS, dtype=np.int64)
+        self.sums = None
+        self.shoes = 0
+
+    def add(self, chunk):
+        histogram, sums, shoes = chunk
+        self.histogram += histogram
+        self.sums = sums if self.sums is None else tuple(a + b for a, b in zip(self.sums, sums))
+        self.shoes += shoes
+
+    def merge(self, other):
+        # Adding another accumulator of the same rules (a worker's, see threads.py).
+        if other.sums is not None:
+            self.add((other.histogram, other.sums, other.shoes))
+        return self
+
+    def standard_errors(self):
+        # Batch-means standard error of every bet's EV, with the shoes as batches.
+        if self.sums is None or self.shoes < 2:
+            return np.full(len(self.compiled.bet_types), np.nan)
+        return ratio_se(self.shoes, *self.sums)
+
+    def result(self):
+        # EV and its standard error for every bet type of the table: se from the shoe batches, se_iid as if
+        # every hand were independent, and the effective sample size.
+        hands = int(self.histogram.sum())
+        rows = []
+        for bet, payouts, se in zip(self.compiled.bet_types, self.compiled.payout_matrix, self.standard_errors()):
+            ev = float(payouts @ self.histogram / hands) if hands else float("nan")
+            second = float(payouts ** 2 @ self.histogram / hands) if hands else float("nan")
+            variance = max(second - ev ** 2, 0.0) if hands else float("nan")
+            se_iid = math.sqrt(variance / hands) if hands else float("nan")
+            rows.append({"bet_type": bet, "hands": hands, "ev": ev, "se": float(se), "se_iid": se_iid,
+                         "ess": float(variance / se ** 2) if se > 0 else float(hands)})
+        return rows
+
+    def converged(self, target_se):
+        return self.shoes >= 2 and bool((self.standard_errors() <= target_se).all())
+
+
+def start_ev(hands=10_000_000, rules=STANDARD, seed=0, chunk_hands=CHUNK_HANDS, executor="process",
+             workers=None, on_update=None, target_se=None):
+    # target_se: stop as soon as the batch-means standard error of every bet's EV is below it; hands is then
+    # the most the run will deal.
+    chunks = [(size, (size, rules, seed, i)) for i, size in enumerate(split_hands(hands, chunk_hands))]
+    stop_when = None if target_se is None else (lambda accumulator: accumulator.converged(target_se))
+    return BackgroundRun(_ev_chunk, chunks, EVAccumulator(rules), executor, workers, on_update, stop_when)
+
+
+# COUNT BINS
+
+
+def _counting_chunk(hands, rules, weights, seed, chunk_index, method, bin_width, min_count, max_count):
+    from contunt_2 import BinBatchMeans
+
+    dealt = deal_chunk(hands, rules, seed, chunk_index, weights)
+    count, remaining, outcome = dealt["count"][:, 0], dealt["remaining"], dealt["outcome"]
+    total, ties = bin_counts(count, remaining, outcome, method, bin_width, min_count, max_count)
+    # The shoe batches of the chunk, for the batch-means standard errors.
+    keep, bins = count_bins(count, remaining, method, bin_width, min_count, max_count)
+    shoes = shoe_numbers(dealt["start"])
+    batch_means = BinBatchMeans().add_hands(bins, outcome[keep] == TIE, shoes[keep], int(shoes[-1]) + 1)
+    return total, ties, batch_means
+
+
+class BinAccumulator:
+    # Hands, ties, the online bootstrap counters and the shoe batch sums per bin (see contunt_2.BinBootstrap
+    # and contunt_2.BinBatchMeans).
+
+    def __init__(self, bin_width, min_count, replicates, seed):
+        from contunt_2 import BinBatchMeans, BinBootstrap
+
+        self.bin_width = bin_width
+        self.offset = int(np.floor(min_count / bin_width))
+        self.total = None
+        self.ties = None
+        self.bootstrap = BinBootstrap(replicates, seed) if replicates else None
+        self.batch_means = BinBatchMeans()
+
+    def add(self, counts):
+        total, ties, batch_means = counts
+        if self.total is None:
+            self.total, self.ties = np.zeros_like(total), np.zeros_like(ties)
+        self.total += total
+        self.ties += ties
+        if self.bootstrap is not None:
+            self.bootstrap.update(total, ties, self.offset)
+        self.batch_means.merge(batch_means)
+
+    def merge(self, other):
+        # Adding another accumulator with the same bins; the bootstrap counters simply add up.
+        if other.total is None:
+            return self
+        if self.total is None:
+            self.total, self.ties = np.zeros_like(other.total), np.zeros_like(other.ties)
+        self.total += other.total
+        self.ties += other.ties
+        if self.bootstrap is not None and other.bootstrap is not None:
+            self.bootstrap.merge(other.bootstrap)
+        self.batch_means.merge(other.batch_means)
+        return self
+
+    def result(self):
+        from contunt_2 import bin_table
+
+        if self.total is None:
+            return []
+        return bin_table(self.total, self.ties, self.offset, self.bin_width, self.bootstrap, self.batch_means)
+
+
+def start_counting(system="Even-Good", method="true", hands=10_000_000, bin_width=None, count_range=None,
+                   rules=COUNTING, seed=0, chunk_hands=CHUNK_HANDS, replicates=200, executor="process",
+                   workers=None, on_update=None, target_se=None, min_share=0.01):
+    # The per-bin Tie table of contunt_2.compare_methods, in the background.
+    # target_se: stop once every bin with at least min_share of the hands either has a batch-means standard
+    # error of its EV below target_se or is clearly above or below 0 (contunt_2.BinBatchMeans.converged);
+    # hands is then the most the run will deal.
+    from batch_bacc import count_weight_matrix
+    from contunt_2 import COUNTING_SYSTEMS
+
+    if method not in ("true", "running"):
+        raise ValueError(f"Unknown counting method: {method}")
+    bin_width = bin_width or (1.0 if method == "true" else 5)
+    min_count, max_count = count_range or ((-10, 10) if method == "true" else (-60, 60))
+    weights = count_weight_matrix([COUNTING_SYSTEMS[system]])
+    chunks = [(size, (size, rules, weights, seed, i, method, bin_width, min_count, max_count))
+              for i, size in enumerate(split_hands(hands, chunk_hands))]
+    accumulator = BinAccumulator(bin_width, min_count, replicates, seed)
+    stop_when = None
+    if target_se is not None:
+        stop_when = lambda accumulator: accumulator.batch_means.converged(target_se, min_share=min_share)
+    return BackgroundRun(_counting_chunk, chunks, accumulator, executor, workers, on_update, stop_when)
+
+
+if __name__ == "__main__":
+    from contunt_2 import analyze_results
+
+    run = start_counting("Even-Good", "running", hands=20_000_000)
+    while not run.done():
+        time.sleep(2)
+        print(run)
+    analyze_results(run.result(), "RUNNING COUNT", "Even-Good")
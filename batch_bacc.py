@@ -0,0 +1,128 @@
+# Vectorized Baccarat engine.
+# bacc.play_bacc deals one hand at a time from a list of strings. Here a shoe is a row of small integers
+# (card ranks), and we deal many shoes side by side: every step of the loop deals the next hand of every
+# shoe at once with NumPy. A shoe has about 80 hands, so dealing thousands of shoes takes only ~80 steps.
+#
+# Cards are stored as ranks 0..12 in the order of bacc.cards ('A', '2', ..., 'K'); RANK_VALUES gives their
+# Baccarat values. Cards are dealt from the front of the row (index 0 first), which is the same order as
+# bacc.draw pops them from the end of a list shoe.
+# The results use the same outcome codes as bacc.py and the same hand keys as payouts.py.
+
+import numpy as np
+
+from bacc import cards, values, banker_draws_third, PLAYER, BANKER, TIE
+
+RANK_VALUES = np.array([values[c] for c in cards], dtype=np.int8)
+NUM_RANKS = len(cards)
+
+# BANKER_DRAWS[banker_total, player_third_value] from the reference third card rules; the last column (10)
+# is used when the Player stood, in which case the Banker draws on 0-5.
+BANKER_DRAWS = np.zeros((10, 11), dtype=bool)
+for _total in range(10):
+    for _third in range(10):
+        BANKER_DRAWS[_total, _third] = banker_draws_third(_total, _third)
+    BANKER_DRAWS[_total, 10] = _total <= 5
+
+# Extra padding at the end of every row, so that we can always read the next 6 cards without bounds checks.
+PAD = 6
+
+
+def ranks_from_cards(shoe):
+    # Converting a list shoe of strings (like bacc.build_shoe returns) to the rank row used here.
+    # The list is reversed because bacc.draw takes cards from the end.
+    index = {card: i for i, card in enumerate(cards)}
+    return np.array([index[c] for c in reversed(shoe)], dtype=np.int8)
+
+
+def build_shoes(n_shoes, number_of_decks=8, rng=None, shuffle=None):
+    # n_shoes independently shuffled shoes, shape (n_shoes, 52 * number_of_decks), dtype int8.
+    # shuffle: a shuffle model from shuffles.py; None is a perfectly uniform shuffle.
+    rng = np.random.default_rng() if rng is None else rng
+    if shuffle is not None:
+        return shuffle.build_shoes(n_shoes, number_of_decks, rng)
+    ordered = np.tile(np.repeat(np.arange(NUM_RANKS, dtype=np.int8), 4), number_of_decks)
+    return rng.permuted(np.broadcast_to(ordered, (n_shoes, len(ordered))), axis=1)
+
+
+def deal_shoes(shoes, cut_cards=6, burn=0, lengths=None):
+    # Playing every shoe until fewer than `cut_cards` cards are left (the same rule as play_bacc).
+    # lengths: the number of cards in every row, for rows of different length padded at the end (recorded
+    # shoes, see recorded.py); by default every row is a whole shoe.
+    # Returns a dict of flat arrays with one entry per hand, ordered shoe by shoe and hand by hand:
+    #   outcome  - outcome code (PLAYER, BANKER, TIE)
+    #   key      - hand key as in payouts.py
+    #   shoe     - index of the shoe the hand was dealt from
+    #   start    - position of the hand's first card in the shoe
+    #   ncards   - number of cards used by the hand (4, 5 or 6)
+    shoes = np.asarray(shoes, dtype=np.int8)
+    n_shoes, size = shoes.shape
+    padded = np.zeros((n_shoes, size + PAD), dtype=np.int8)
+    padded[:, :size] = shoes
+    values_of = RANK_VALUES[padded]
+
+    max_hands = (size - burn) // 4 + 1
+    outcome = np.zeros((n_shoes, max_hands), dtype=np.int8)
+    key = np.zeros((n_shoes, max_hands), dtype=np.int16)
+    start = np.zeros((n_shoes, max_hands), dtype=np.int16)
+    ncards = np.zeros((n_shoes, max_hands), dtype=np.int8)
+    valid = np.zeros((n_shoes, max_hands), dtype=bool)
+
+    lengths = np.full(n_shoes, size, dtype=np.int64) if lengths is None else np.asarray(lengths, dtype=np.int64)
+    pos = np.full(n_shoes, burn, dtype=np.int64)
+    rows = np.arange(n_shoes)
+    for h in range(max_hands):
+        active = lengths - pos >= cut_cards
+        if not active.any():
+            break
+        r = rows[active]
+        p = pos[active]
+        v = values_of[r[:, None], p[:, None] + np.arange(6)]
+        k = padded[r[:, None], p[:, None] + np.arange(4)]
+
+        player2 = (v[:, 0] + v[:, 1]) % 10
+        banker2 = (v[:, 2] + v[:, 3]) % 10
+        natural = (player2 >= 8) | (banker2 >= 8)
+
+        player_third = ~natural & (player2 <= 5)
+        third_value = np.where(player_third, v[:, 4], 10)
+        banker_third = ~natural & BANKER_DRAWS[banker2, third_value]
+        banker_card = np.where(player_third, v[:, 5], v[:, 4])
+
+        player_total = np.where(player_third, (player2 + v[:, 4]) % 10, player2)
+        banker_total = np.where(banker_third, (banker2 + banker_card) % 10, banker2)
+
+        outcome[r, h] = np.where(player_total > banker_total, PLAYER,
+                                 np.where(banker_total > player_total, BANKER, TIE))
+        key[r, h] = (player_total + 10 * banker_total + 100 * natural + 200 * player_third
+                     + 400 * banker_third + 800 * (k[:, 0] == k[:, 1]) + 1600 * (k[:, 2] == k[:, 3]))
+        start[r, h] = p
+        used = 4 + player_third + banker_third
+        ncards[r, h] = used
+        valid[r, h] = True
+        pos[active] = p + used
+
+    shoe_index = np.broadcast_to(rows[:, None], valid.shape)
+    return {
+        "outcome": outcome[valid],
+        "key": key[valid],
+        "shoe": shoe_index[valid].astype(np.int32),
+        "start": start[valid],
+        "ncards": ncards[valid],
+    }
+
+
+def running_counts(shoes, starts, shoe_index, weights, burn=0):
+    # Running count before each hand for one or more counting systems.
+    # weights is a (systems, 13) array of weights per rank (see count_weight_matrix); returns (hands, systems).
+    # The first `burn` cards of every shoe were burned face down, so like CountedShoe.burn they don't count.
+    weights = np.atleast_2d(np.asarray(weights))
+    per_card = weights[:, np.asarray(shoes, dtype=np.int64)]  # (systems, shoes, cards)
+    per_card[:, :, :burn] = 0
+    cumulative = np.zeros(per_card.shape[:2] + (per_card.shape[2] + 1,), dtype=np.int32)
+    np.cumsum(per_card, axis=2, out=cumulative[:, :, 1:])
+    return cumulative[:, shoe_index, starts].T
+
+
+def count_weight_matrix(systems):
+    # Turning counting systems (dicts card -> weight, like contunt_2.COUNTING_SYSTEMS) into a (systems, 13) array.
+    return np.array([[system.get(card, 0) for card in cards] for system in systems], dtype=np.int32)
@@ -0,0 +1,58 @@
+# Standard errors for correlated simulation output: batch means.
+# Hands dealt from the same shoe are not independent. They share the composition of the shoe, so a Tie-rich
+# stretch of cards gives several Ties in a row, and a count bin is usually reached by several hands of the same
+# shoe. The textbook standard error sqrt(variance / n) counts every hand as a new draw and is too small.
+# Batch means: cut the output into batches that are (nearly) independent of each other - whole shoes, or runs
+# of hands much longer than the correlation - and estimate the variance of the mean from the spread of the
+# batch means instead. The effective sample size (variance per hand / squared standard error) is the number of
+# independent hands the run is worth.
+
+import math
+
+import numpy as np
+
+
+def batch_means(values, batch_size=None):
+    # Mean of a series and its batch-means standard error, from non-overlapping batches of batch_size values
+    # (by default sqrt(n), so both the batches and their number grow with the run).
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    batch_size = int(batch_size or max(1, math.isqrt(n)))
+    batches = n // batch_size
+    mean = float(values.mean()) if n else float("nan")
+    variance = float(values.var(ddof=1)) if n > 1 else float("nan")
+    se = float("nan")
+    if batches > 1:
+        means = values[:batches * batch_size].reshape(batches, batch_size).mean(axis=1)
+        se = float(means.std(ddof=1) / math.sqrt(batches))
+    return {
+        "mean": mean,
+        "se": se,
+        "se_iid": math.sqrt(variance / n) if n > 1 else float("nan"),
+        "ess": variance / se ** 2 if se > 0 else float(n),
+        "batches": batches,
+        "batch_size": batch_size,
+    }
+
+
+def ratio_se(shoes, hands, total, hands_sq, total_sq, cross):
+    # Standard error of a per-hand average total / hands whose batches are shoes of different length.
+    # The arguments are sums over shoes of N (hands of the shoe), X (its total), N^2, X^2 and N * X; shoes is
+    # the number of shoes dealt, including shoes that added nothing. Works elementwise on arrays.
+    #   var = S / (S - 1) * sum over shoes of (X - mean * N)^2 / (sum N)^2
+    hands = np.asarray(hands, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / hands
+        variance = shoes / (shoes - 1) * (total_sq - 2 * mean * cross + mean ** 2 * hands_sq) / hands ** 2
+    return np.sqrt(np.maximum(variance, 0.0))
+
+
+def shoe_sums(shoe, values):
+    # The sums ratio_se needs, from per-hand values (shape (hands,) or (k, hands)) and the shoe index of every
+    # hand: (hands, total, hands_sq, total_sq, cross), each summed over the shoes.
+    shoe = np.asarray(shoe)
+    _, index = np.unique(shoe, return_inverse=True)
+    n = np.bincount(index).astype(float)
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    x = np.array([np.bincount(index, weights=row, minlength=len(n)) for row in values])
+    return n.sum(), x.sum(axis=1), (n * n).sum(), (x * x).sum(axis=1), (x * n).sum(axis=1)
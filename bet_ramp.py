@@ -0,0 +1,180 @@
+# Count-driven betting on the Tie: thresholds, bet ramps and Kelly sizing.
+# contunt_2.py tells us P(Tie) per count bin, but not what a player would actually earn by betting on it.
+# Here we:
+#   1. build a table of Tie EV per (count bin, decks remaining bin) for a system from COUNTING_SYSTEMS, from a
+#      large dealt sample (cached on disk, see cache.py, so it is built once),
+#   2. turn every betting policy into a bet per table cell (how many units to bet on the Tie in that situation),
+#   3. deal a separate test sample and settle all policies on it at once.
+# Because a policy's bet only depends on the table cell, the test sample is reduced to one count per
+# (cell, tie or not) with a bincount, and every policy's win rate, standard deviation, N0 and risk of ruin
+# follow from a few matrix products, however many policies and hands there are.
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from bacc import TIE
+from batch_bacc import count_weight_matrix
+from cache import cached_call, module_dependencies
+from corpus import deal_chunk
+from rules import COUNTING
+
+TIE_PAYS = 8
+CHUNK_HANDS = 1_000_000
+BET_RAMP_MODULES = module_dependencies("bet_ramp.py")
+
+
+# DEALING
+
+
+def dealt_counts(system, hands, seed, rules=COUNTING, chunk_hands=CHUNK_HANDS):
+    # Yields chunks of (running count before the hand, cards remaining, outcome) dealt with the vectorized engine.
+    from contunt_2 import COUNTING_SYSTEMS
+
+    weights = count_weight_matrix([COUNTING_SYSTEMS[system]])
+    for chunk_index, begin in enumerate(range(0, hands, chunk_hands)):
+        dealt = deal_chunk(min(chunk_hands, hands - begin), rules, seed, chunk_index, weights)
+        yield dealt["count"][:, 0], dealt["remaining"], dealt["outcome"]
+
+
+def cell_index(count, remaining, method, count_edges, depth_edges, min_decks=1.5):
+    # The (count bin, depth bin) cell of every hand, as one flat index; hands outside the count range get -1.
+    decks = remaining / 52
+    value = count / np.maximum(decks, min_decks) if method == "true" else count
+    count_bin = np.searchsorted(count_edges, value, side="right") - 1
+    depth_bin = np.clip(np.searchsorted(depth_edges, decks, side="right") - 1, 0, len(depth_edges) - 2)
+    inside = (count_bin >= 0) & (count_bin < len(count_edges) - 1)
+    return np.where(inside, count_bin * (len(depth_edges) - 1) + depth_bin, -1)
+
+
+def cell_counts(system, method, hands, seed, count_edges, depth_edges, rules=COUNTING):
+    # Hands and ties per cell, shape (cells, 2): column 0 hands that were not a tie, column 1 ties.
+    cells = (len(count_edges) - 1) * (len(depth_edges) - 1)
+    counts = np.zeros(cells * 2, dtype=np.int64)
+    for count, remaining, outcome in dealt_counts(system, hands, seed, rules):
+        cell = cell_index(count, remaining, method, count_edges, depth_edges)
+        keep = cell >= 0
+        counts += np.bincount(cell[keep] * 2 + (outcome[keep] == TIE), minlength=cells * 2)
+    return counts.reshape(cells, 2)
+
+
+# THE EV TABLE
+
+
+def _build_ev_table(system, method, hands, seed, count_edges, depth_edges, rules):
+    counts = cell_counts(system, method, hands, seed, np.asarray(count_edges), np.asarray(depth_edges), rules)
+    return {"system": system, "method": method, "count_edges": list(count_edges),
+            "depth_edges": list(depth_edges), "hands": counts.sum(axis=1), "ties": counts[:, 1]}
+
+
+def ev_table(system="Even-Good", method="true", hands=20_000_000, seed=0, bin_width=None, count_range=None,
+             depth_edges=(0, 2, 4, 6, 9), rules=COUNTING, use_cache=True):
+    # Tie EV per (count bin, depth bin), built from `hands` dealt hands. Stored in the result cache, so the
+    # same table is only ever built once.
+    bin_width = bin_width or (1.0 if method == "true" else 5)
+    count_range = count_range or ((-10, 10) if method == "true" else (-60, 60))
+    count_edges = list(np.arange(count_range[0], count_range[1] + bin_width, bin_width).round(10))
+    params = {"system": system, "method": method, "hands": hands, "seed": seed, "count_edges": count_edges,
+              "depth_edges": list(depth_edges), "rules": rules}
+    table, _ = cached_call("bet_ramp_ev_table", _build_ev_table, params, modules=BET_RAMP_MODULES,
+                           enabled=use_cache)
+    hands_in_cell = table["hands"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        p_tie = np.where(hands_in_cell > 0, table["ties"] / hands_in_cell, 0.0)
+    table["p_tie"] = p_tie
+    table["ev"] = np.where(hands_in_cell > 0, (TIE_PAYS + 1) * p_tie - 1, -1.0)
+    # Variance of a 1 unit Tie bet: it pays 8 with probability p and loses 1 otherwise.
+    table["variance"] = TIE_PAYS ** 2 * p_tie + (1 - p_tie) - table["ev"] ** 2
+    return table
+
+
+# POLICIES
+# A policy gets the EV table and returns the number of units to bet on the Tie in every cell (0 = sit out).
+
+
+def threshold(min_ev=0.0, units=1, min_hands=200):
+    # Bet a fixed amount whenever the table says the Tie is worth more than min_ev (and the cell isn't noise).
+    def policy(table):
+        return np.where((table["ev"] > min_ev) & (table["hands"] >= min_hands), float(units), 0.0)
+    return policy
+
+
+def ramp(steps, min_hands=200):
+    # A bet ramp: steps is a list of (min_ev, units), for example [(0.0, 1), (0.05, 2), (0.1, 4)].
+    def policy(table):
+        bets = np.zeros(len(table["ev"]))
+        for min_ev, units in sorted(steps):
+            bets[(table["ev"] > min_ev) & (table["hands"] >= min_hands)] = units
+        return bets
+    return policy
+
+
+def kelly(fraction=0.5, bankroll=1000, max_units=None, min_hands=200):
+    # (Fractional) Kelly: bet fraction * EV / variance of the bankroll in favourable cells, in units.
+    def policy(table):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            bets = fraction * bankroll * np.maximum(table["ev"], 0) / table["variance"]
+        bets = np.where((table["hands"] >= min_hands) & np.isfinite(bets), bets, 0.0)
+        return bets if max_units is None else np.minimum(bets, max_units)
+    return policy
+
+
+POLICIES = {
+    "Tie when +EV": threshold(0.0),
+    "Tie when EV > 5%": threshold(0.05),
+    "Ramp 1-2-4": ramp([(0.0, 1), (0.05, 2), (0.10, 4)]),
+    "Half Kelly": kelly(0.5),
+    "Full Kelly": kelly(1.0),
+}
+
+
+# BACKTEST
+
+
+def backtest(system="Even-Good", method="true", policies=None, hands=10_000_000, seed=1, table=None,
+             bankroll=1000, rules=COUNTING, **table_options):
+    # Settles every policy on `hands` freshly dealt hands (a different seed than the table, so the table isn't
+    # judged on the hands it was estimated from). Returns one row per policy:
+    #   win_rate      - average profit per hand dealt, in units
+    #   sd            - standard deviation of the profit per hand dealt
+    #   ev_per_unit   - profit per unit wagered
+    #   n0            - hands needed before the expected profit equals one standard deviation, (sd / win_rate)^2
+    #   risk_of_ruin  - chance of ever losing `bankroll` units (diffusion approximation exp(-2 wr B / sd^2))
+    policies = POLICIES if policies is None else policies
+    table = ev_table(system, method, rules=rules, **table_options) if table is None else table
+    bets = np.array([policy(table) for policy in policies.values()])  # (policies, cells)
+
+    counts = cell_counts(system, method, hands, seed, np.asarray(table["count_edges"]),
+                         np.asarray(table["depth_edges"]), rules)
+    not_tie, tie = counts[:, 0], counts[:, 1]
+
+    profit = bets @ (TIE_PAYS * tie - not_tie)
+    square = (bets ** 2) @ (TIE_PAYS ** 2 * tie + not_tie)
+    wagered = bets @ (tie + not_tie)
+    hands_bet = (bets > 0) @ (tie + not_tie)
+
+    rows = []
+    for name, total, sq, w, played in zip(policies, profit, square, wagered, hands_bet):
+        win_rate = total / hands
+        sd = math.sqrt(max(sq / hands - win_rate ** 2, 0.0))
+        rows.append({
+            "policy": name,
+            "hands": hands,
+            "hands_bet": int(played),
+            "wagered": float(w),
+            "win_rate": win_rate,
+            "sd": sd,
+            "ev_per_unit": total / w if w else 0.0,
+            "n0": (sd / win_rate) ** 2 if win_rate else math.inf,
+            "risk_of_ruin": math.exp(-2 * win_rate * bankroll / sd ** 2) if win_rate > 0 and sd > 0 else 1.0,
+        })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    from contunt_2 import COUNTING_SYSTEMS
+
+    for system in COUNTING_SYSTEMS:
+        print(f"\n{system}")
+        print(backtest(system, "true", hands=5_000_000).to_string(index=False))
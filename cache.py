@@ -0,0 +1,160 @@
+# Content-addressed on-disk result cache for the experiment scripts.
+# A result is stored under a hash of everything that determines it: the kind of experiment, its parameters
+# (hands, decks, seed, bet type, strategy, count weights, ...) and the source code of the modules that compute it.
+# Running the same experiment again returns the stored result instantly; changing any parameter or editing
+# any of those modules gives a new key, so stale results are never returned.
+# The cache has a size limit and evicts the least recently used results first.
+
+import ast
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import tempfile
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bacc_cache")
+MAX_BYTES = 512 * 1024 * 1024
+MAX_ENTRIES = 2000
+
+MISSING = object()
+
+
+def code_version(modules):
+    # Hash of the source files of the given modules (file names relative to this folder, or module objects).
+    digest = hashlib.sha256()
+    for module in modules:
+        path = module if isinstance(module, str) else inspect.getsourcefile(module)
+        if not os.path.isabs(path):
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        with open(path, "rb") as f:
+            digest.update(os.path.basename(path).encode())
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def module_dependencies(*modules):
+    # The given module files plus every module of this folder they import, directly or through each other,
+    # including the imports inside functions. Listing modules by hand always forgets one of them, and then an
+    # edit to it keeps returning results computed by the old code.
+    folder = os.path.dirname(os.path.abspath(__file__))
+    found = []
+    pending = list(modules)
+    while pending:
+        name = pending.pop()
+        if name in found:
+            continue
+        found.append(name)
+        with open(os.path.join(folder, name), "rb") as f:
+            tree = ast.parse(f.read(), filename=name)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                imported = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                imported = [node.module]
+            else:
+                continue
+            for module in imported:
+                path = module.split(".")[0] + ".py"
+                if os.path.exists(os.path.join(folder, path)):
+                    pending.append(path)
+    return sorted(found)
+
+
+def cache_key(kind, params, modules=()):
+    payload = json.dumps([kind, params, code_version(modules)], sort_keys=True, default=repr)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES, max_entries=MAX_ENTRIES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".pkl")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return MISSING
+        # Touching the file marks it as recently used for eviction.
+        os.utime(path)
+        return value
+
+    def put(self, key, value):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Writing to a temporary file first, so a crash never leaves a half-written result behind.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict()
+
+    def entries(self):
+        found = []
+        if not os.path.isdir(self.directory):
+            return found
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".pkl"):
+                    stat = os.stat(os.path.join(root, name))
+                    found.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        return found
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        while entries and (total > self.max_bytes or len(entries) > self.max_entries):
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+
+
+default_cache = ResultCache()
+
+
+def cached_call(kind, fn, params, modules=(), cache=None, enabled=True):
+    # Returns (result, from_cache). fn is called with **params only when the result isn't stored yet.
+    # enabled=False always recomputes (for example for unseeded, i.e. deliberately random, runs).
+    if not enabled:
+        return fn(**params), False
+    cache = default_cache if cache is None else cache
+    key = cache_key(kind, params, modules)
+    value = cache.get(key)
+    if value is not MISSING:
+        return value, True
+    value = fn(**params)
+    cache.put(key, value)
+    return value, False
+
+
+def cached(kind, modules=(), cache=None):
+    # Decorator version of cached_call; the key uses all arguments, including the default ones.
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return cached_call(kind, fn, dict(bound.arguments), modules, cache)[0]
+
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        wrapper.uncached = fn
+        return wrapper
+
+    return decorator
@@ -13,9 +13,14 @@ True count becomes unstable in Baccarat due to:
 Running count may be more practical for Baccarat analysis.
 """
 
-from bacc import build_shoe, hand_value, decide_outcome, banker_draws_third
+from bacc import TIE
+from counted_shoe import CountedShoe, play_counted_hand
+from rules import COUNTING, rules_dealer
+from batch_means import ratio_se
+from array import array
+import numpy as np
 import math
-from collections import defaultdict
+import random
 import matplotlib.pyplot as plt
 import time
 import pandas as pd
@@ -89,77 +94,279 @@ COUNTING_SYSTEMS = {
 }
 
 
-# COUNTED SHOE CLASS
+# COUNTED SHOE CLASS AND GAME LOGIC
+# Both live in counted_shoe.py, which is shared with counting.py. The simulations deal through a Dealer
+# (dealer.py), so recording or extra counts can be plugged in as observers without copying the hand logic.
 
 
-class CountedShoe:
-    
-    def __init__(self, number_of_decks=8, count_weights=None):
-        self.cards = build_shoe(number_of_decks)
-        self.count = 0
-        self.count_weights = count_weights or {}
-        self.initial_decks = number_of_decks
-        
-    def draw(self):
-        if len(self.cards) == 0:
-            raise ValueError("Cannot draw from empty shoe")
+def play_hand_counted(shoe):
+    return play_counted_hand(shoe)
+
+
+# BINNING
+
+BOOTSTRAP_REPLICATES = 200
+
+
+# Turning the recorded bin indexes and Tie flags into the per-bin result table.
+# Both are compact arrays, so counting the hands and ties per bin is a single bincount each.
+# shoes: the shoe number of every recorded hand, and n_shoes the number of shoes dealt; with them every bin
+# also gets batch-means standard errors (see BinBatchMeans).
+def bin_results(bins, ties, bin_width, replicates=BOOTSTRAP_REPLICATES, seed=None, shoes=None, n_shoes=None):
+    if len(bins) == 0:
+        return []
+    bins = np.frombuffer(bins, dtype=np.int64) if isinstance(bins, array) else np.asarray(bins, dtype=np.int64)
+    ties = np.frombuffer(ties, dtype=np.int8) if isinstance(ties, array) else np.asarray(ties, dtype=np.int8)
+    
+    offset = int(bins.min())
+    total_counts = np.bincount(bins - offset)
+    tie_counts = np.bincount(bins - offset, weights=ties, minlength=len(total_counts))
+    bootstrap = None
+    if replicates:
+        bootstrap = BinBootstrap(replicates, seed)
+        bootstrap.update(total_counts, tie_counts, offset)
+    batch_means = None
+    if shoes is not None:
+        shoes = np.frombuffer(shoes, dtype=np.int64) if isinstance(shoes, array) else np.asarray(shoes)
+        batch_means = BinBatchMeans().add_hands(bins, ties, shoes, n_shoes)
+    return bin_table(total_counts, tie_counts, offset, bin_width, bootstrap, batch_means)
+
+
+# The result table from per-bin hand and tie counts; total_counts[i] belongs to bin index i + offset.
+# With a BinBootstrap, every bin also gets a confidence interval for its EV and a flag telling whether the
+# whole interval is above 0 (significantly +EV). With a BinBatchMeans it gets the standard error of its EV
+# from the shoe batches, the binomial one and the effective sample size.
+def bin_table(total_counts, tie_counts, offset, bin_width, bootstrap=None, batch_means=None):
+    intervals = bootstrap.intervals() if bootstrap is not None else {}
+    errors = batch_means.errors() if batch_means is not None else {}
+    results = []
+    for i in np.flatnonzero(total_counts):
+        bin_index = int(i + offset)
+        n = int(total_counts[i])
+        ties_in_bin = int(tie_counts[i])
+        p_hat = ties_in_bin / n
+        tie_ev = 8 * p_hat - (1 - p_hat)
         
-        card = self.cards.pop()
-        if card in self.count_weights:
-            self.count += self.count_weights[card]
-        return card
-    
-    def cards_remaining(self):
-        return len(self.cards)
-    
-    def decks_remaining(self):
-        return len(self.cards) / 52
-    
-    def true_count(self, min_decks=1.5):
+        bin_left = bin_index * bin_width
+        bin_right = bin_left + bin_width
         
-        decks = max(self.decks_remaining(), min_decks)
-        return self.count / decks
+        row = {
+            "bin_index": bin_index,
+            "bin_left": bin_left,
+            "bin_right": bin_right,
+            "hands": n,
+            "ties": ties_in_bin,
+            "p_tie": p_hat,
+            "ev_tie": tie_ev,
+        }
+        if bin_index in intervals:
+            low, high = intervals[bin_index]
+            row["ev_low"] = low
+            row["ev_high"] = high
+            row["significant"] = low > 0
+        if bin_index in errors:
+            row.update(errors[bin_index])
+        results.append(row)
     
-    def reset(self):
-        self.cards = build_shoe(self.initial_decks)
-        self.count = 0
-
-
-# GAME LOGIC
+    return results
 
 
-def play_hand_counted(shoe):
-    
-    # Deal initial cards; in reality the dealer alternates between them but it doesnt matter here
-    player = [shoe.draw(), shoe.draw()]
-    banker = [shoe.draw(), shoe.draw()]
-    
-    player_total = hand_value(player)
-    banker_total = hand_value(banker)
-    
-    # Natural 8 or 9
-    if player_total in {8, 9} or banker_total in {8, 9}:
-        return decide_outcome(player_total, banker_total)
-    
-    # Player draws third card rule
-    player_third = None
-    if player_total <= 5:
-        player_third = shoe.draw()
-        player.append(player_third)
-        player_total = hand_value(player)
-    
-    # Banker draws third card rule
-    if player_third is None:
-        if banker_total <= 5:
-            banker.append(shoe.draw())
-            banker_total = hand_value(banker)
-    else:
-        player_third_value = values[player_third]
-        if banker_draws_third(banker_total, player_third_value):
-            banker.append(shoe.draw())
-            banker_total = hand_value(banker)
-    
-    return decide_outcome(player_total, banker_total)
+# CONFIDENCE INTERVALS: ONLINE POISSON BOOTSTRAP
+# Instead of resampling the hands after the simulation, every hand gets a random Poisson(1) weight in each of
+# `replicates` bootstrap replicates, and every replicate keeps its own hand and tie counter per bin.
+# The sum of independent Poisson(1) weights over m hands is Poisson(m), so a batch of hands can be added in
+# one step: for each bin we draw the replicates' increments of the tie counter from Poisson(ties in the batch)
+# and of the other hands from Poisson(other hands in the batch). That's exactly the online bootstrap, but the
+# cost is per bin and batch, not per hand. The counters of different batches, runs or workers simply add up.
+
+
+class BinBootstrap:
+
+    def __init__(self, replicates=BOOTSTRAP_REPLICATES, seed=None, confidence=0.95):
+        self.replicates = replicates
+        self.confidence = confidence
+        self.rng = np.random.default_rng(seed)
+        self.offset = 0
+        self.hands = np.zeros((replicates, 0), dtype=np.int64)
+        self.ties = np.zeros((replicates, 0), dtype=np.int64)
+
+    def _cover(self, offset, size):
+        # Growing the counters so that they cover bin indexes offset .. offset + size - 1.
+        if self.hands.shape[1] == 0:
+            self.offset = offset
+        low = min(self.offset, offset)
+        high = max(self.offset + self.hands.shape[1], offset + size)
+        if low == self.offset and high == self.offset + self.hands.shape[1]:
+            return
+        hands = np.zeros((self.replicates, high - low), dtype=np.int64)
+        ties = np.zeros((self.replicates, high - low), dtype=np.int64)
+        begin = self.offset - low
+        hands[:, begin:begin + self.hands.shape[1]] = self.hands
+        ties[:, begin:begin + self.ties.shape[1]] = self.ties
+        self.offset, self.hands, self.ties = low, hands, ties
+
+    def update(self, total_counts, tie_counts, offset):
+        # Adding a batch of hands given as per-bin counts (total_counts[i] belongs to bin index i + offset).
+        total_counts = np.asarray(total_counts, dtype=np.int64)
+        tie_counts = np.asarray(tie_counts, dtype=np.int64)
+        self._cover(offset, len(total_counts))
+        begin = offset - self.offset
+        size = (self.replicates, len(total_counts))
+        ties = self.rng.poisson(tie_counts, size)
+        self.ties[:, begin:begin + len(total_counts)] += ties
+        self.hands[:, begin:begin + len(total_counts)] += ties + self.rng.poisson(total_counts - tie_counts, size)
+
+    def add_hands(self, bins, ties):
+        # Adding a batch of recorded hands (bin indexes and Tie flags), for example a chunk of a corpus.
+        bins = np.asarray(bins, dtype=np.int64)
+        if len(bins) == 0:
+            return
+        offset = int(bins.min())
+        total_counts = np.bincount(bins - offset)
+        self.update(total_counts, np.bincount(bins - offset, weights=ties, minlength=len(total_counts)), offset)
+
+    def merge(self, other):
+        self._cover(other.offset, other.hands.shape[1])
+        begin = other.offset - self.offset
+        self.hands[:, begin:begin + other.hands.shape[1]] += other.hands
+        self.ties[:, begin:begin + other.ties.shape[1]] += other.ties
+        return self
+
+    def intervals(self):
+        # Percentile interval of the Tie EV (9 * P(Tie) - 1) per bin index.
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ev = 9 * self.ties / self.hands - 1
+        tail = (1 - self.confidence) / 2 * 100
+        result = {}
+        for j in np.flatnonzero(self.hands.any(axis=0)):
+            column = ev[:, j][np.isfinite(ev[:, j])]
+            low, high = np.percentile(column, [tail, 100 - tail])
+            result[int(j + self.offset)] = (float(low), float(high))
+        return result
+
+
+def bootstrap_seed(seed=None):
+    # The seed of a run's bootstrap. Without one we draw it from the random module, which also shuffled the
+    # shoes, so a run after random.seed(...) gets the same intervals every time.
+    return random.getrandbits(64) if seed is None else seed
+
+
+def bootstrap_interval(hands, ties, replicates=BOOTSTRAP_REPLICATES, seed=None, confidence=0.95):
+    # The same interval for a single pooled bin (used when neighbouring bins are merged for plotting).
+    bootstrap = BinBootstrap(replicates, seed, confidence)
+    bootstrap.update([hands], [ties], 0)
+    return bootstrap.intervals().get(0, (float("nan"), float("nan")))
+
+
+# STANDARD ERRORS: BATCH MEANS OVER SHOES
+# The hands of one shoe are not independent draws: they share the composition of the shoe, and the count that
+# put a hand into a bin usually puts the next hand there too. The binomial standard error sqrt(p (1 - p) / n)
+# counts every hand as new information and is too small. Shoes are independent, so they are the batches: per
+# bin we add up, over shoes, N (the shoe's hands in the bin), T (its ties), N^2, T^2 and N * T. The Tie share
+# p = sum T / sum N then has the batch-means variance
+#   var(p) = S / (S - 1) * sum over shoes of (T - p N)^2 / (sum N)^2     (batch_means.ratio_se)
+# where S counts all the shoes dealt (a shoe that never reached the bin adds 0 to the sum, but counts in S).
+# With independent hands this is p (1 - p) / n again. The effective sample size p (1 - p) / var(p) is the
+# number of independent hands the bin is worth. Sums of different batches, runs or workers simply add up.
+
+BATCH_SUMS = ("shoes", "hands", "ties", "hands_sq", "ties_sq", "cross")
+
+
+class BinBatchMeans:
+
+    def __init__(self):
+        self.offset = 0
+        self.sums = np.zeros((len(BATCH_SUMS), 0), dtype=np.int64)
+        self.shoes = 0
+
+    def _cover(self, offset, size):
+        # Growing the sums so that they cover bin indexes offset .. offset + size - 1.
+        if self.sums.shape[1] == 0:
+            self.offset = offset
+        low = min(self.offset, offset)
+        high = max(self.offset + self.sums.shape[1], offset + size)
+        if low == self.offset and high == self.offset + self.sums.shape[1]:
+            return
+        sums = np.zeros((len(BATCH_SUMS), high - low), dtype=np.int64)
+        begin = self.offset - low
+        sums[:, begin:begin + self.sums.shape[1]] = self.sums
+        self.offset, self.sums = low, sums
+
+    def add_hands(self, bins, ties, shoes, n_shoes=None):
+        # Recorded hands of whole shoes: the bin index, Tie flag and shoe number of every hand. n_shoes is the
+        # number of shoes dealt, including shoes without a recorded hand; by default the distinct shoe numbers.
+        bins = np.asarray(bins, dtype=np.int64)
+        ties = np.asarray(ties, dtype=np.int64)
+        shoes = np.asarray(shoes, dtype=np.int64)
+        if len(bins) == 0:
+            self.shoes += n_shoes or 0
+            return self
+        offset = int(bins.min())
+        size = int(bins.max()) - offset + 1
+        # One cell per (shoe, bin) that got hands; N and T per cell, then the sums per bin.
+        cells, cell = np.unique((shoes - shoes.min()) * size + bins - offset, return_inverse=True)
+        n = np.bincount(cell)
+        t = np.bincount(cell, weights=ties).astype(np.int64)
+        bin_of_cell = cells % size
+        columns = (np.ones_like(n), n, t, n * n, t * t, n * t)
+        sums = np.array([np.bincount(bin_of_cell, weights=c, minlength=size) for c in columns]).astype(np.int64)
+        self._cover(offset, size)
+        begin = offset - self.offset
+        self.sums[:, begin:begin + size] += sums
+        self.shoes += len(np.unique(shoes)) if n_shoes is None else n_shoes
+        return self
+
+    def merge(self, other):
+        self._cover(other.offset, other.sums.shape[1])
+        begin = other.offset - self.offset
+        self.sums[:, begin:begin + other.sums.shape[1]] += other.sums
+        self.shoes += other.shoes
+        return self
+
+    def errors(self):
+        # Per bin index: the batch-means standard error of the Tie EV (9 * P(Tie) - 1), the binomial one,
+        # the effective sample size and the number of shoes that reached the bin. A bin reached by a single
+        # shoe has no spread between batches to measure, so its standard error is unknown (nan).
+        # The squared sums and the number of shoes dealt come along, so that merge_bins can pool bins later.
+        if self.shoes < 2:
+            return {}
+        shoes_in_bin, n, t, nn, tt, nt = self.sums.astype(float)
+        se = np.where(shoes_in_bin >= 2, ratio_se(self.shoes, n, t, nn, tt, nt), np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            p = t / n
+            binomial = np.sqrt(p * (1 - p) / n)
+            ess = np.where(se > 0, p * (1 - p) / se ** 2, n)
+        result = {}
+        for j in np.flatnonzero(n):
+            result[int(j + self.offset)] = {
+                "ev_se": 9 * float(se[j]),
+                "ev_se_binomial": 9 * float(binomial[j]),
+                "ess": float(ess[j]),
+                "shoes": int(shoes_in_bin[j]),
+                "hands_sq": int(nn[j]),
+                "ties_sq": int(tt[j]),
+                "cross": int(nt[j]),
+                "shoes_dealt": int(self.shoes),
+            }
+        return result
+
+    def unsettled(self, target_se, z=1.96, min_share=0.01):
+        # Bins that still need hands: bins holding at least min_share of the recorded hands whose standard error
+        # is above target_se and whose interval EV +- z * se still contains 0 (we don't know yet whether the
+        # Tie is worth betting there). The rare bins at the edges of the count range are left out.
+        hands, ties = self.sums[1], self.sums[2]
+        pending = []
+        for bin_index, e in self.errors().items():
+            j = bin_index - self.offset
+            ev = 9 * ties[j] / hands[j] - 1
+            precise = e["ev_se"] <= target_se or abs(ev) >= z * e["ev_se"]
+            if hands[j] >= min_share * hands.sum() and not precise:
+                pending.append(bin_index)
+        return pending
+
+    def converged(self, target_se, z=1.96, min_share=0.01, min_shoes=100):
+        # The stopping rule: every bin that matters is either precise enough or clearly on one side of 0.
+        return self.shoes >= min_shoes and not self.unsettled(target_se, z, min_share)
 
 
 # SIMULATION: TRUE COUNT METHOD
@@ -171,26 +378,42 @@ def simulate_true_count(
     count_weights=None,
     bin_width=1.0,
     min_true=-40,
-    max_true=40
+    max_true=40,
+    dealer=None,
+    shuffle=None,
+    seed=None
 ):
     
-    total_counts = defaultdict(int)
-    tie_counts = defaultdict(int)
+    # Bin index, Tie flag (outcome code == TIE) and shoe number of every recorded hand; we count them with
+    # bincount at the end. The shoe numbers give the batch-means standard errors (see BinBatchMeans).
+    bins = array('q')
+    ties = array('b')
+    shoes = array('q')
     
-    shoe = CountedShoe(number_of_decks=number_of_decks, count_weights=count_weights)
+    # The dealer reshuffles at fewer than 52 cards (rules.COUNTING); observers registered on it see every card and hand.
+    # shuffle: a shuffle spec from shuffles.py (riffles, strips, a continuous shuffling machine, ...).
+    if dealer is None:
+        dealer = rules_dealer(COUNTING._replace(number_of_decks=number_of_decks, shuffle=shuffle or "uniform"),
+                              count_weights)
+    shoe = dealer.shoe
+    on_bin = dealer.on_bin
     
     skipped_unstable = 0
-    hands_recorded = 0
+    shoe_number = 0
+    remaining = shoe.remaining
     
     for _ in range(num_hands):
         
-        if shoe.cards_remaining() < 52:
-            shoe.reset()
+        dealer.ready()
+        # A reshuffle refills the shoe: a new batch.
+        if shoe.remaining > remaining:
+            shoe_number += 1
+        remaining = shoe.remaining
         
         true_count = shoe.true_count()
         
         
-        outcome = play_hand_counted(shoe)
+        outcome = dealer.play()
         
         
         if true_count is None:
@@ -200,34 +423,15 @@ def simulate_true_count(
         
         if min_true <= true_count < max_true:
             bin_index = math.floor(true_count / bin_width)
-            total_counts[bin_index] += 1
-            if outcome == "Tie":
-                tie_counts[bin_index] += 1
-            hands_recorded += 1
+            bins.append(bin_index)
+            ties.append(outcome == TIE)
+            shoes.append(shoe_number)
+            if on_bin is not None:
+                on_bin(bin_index, outcome)
     
     
-    results = []
-    for bin_index in sorted(total_counts.keys()):
-        n = total_counts[bin_index]
-        if n == 0:
-            continue
-        
-        ties = tie_counts[bin_index]
-        p_hat = ties / n
-        tie_ev = 8 * p_hat - (1 - p_hat)
-        
-        bin_left = bin_index * bin_width
-        bin_right = bin_left + bin_width
-        
-        results.append({
-            "bin_index": bin_index,
-            "bin_left": bin_left,
-            "bin_right": bin_right,
-            "hands": n,
-            "ties": ties,
-            "p_tie": p_hat,
-            "ev_tie": tie_ev,
-        })
+    results = bin_results(bins, ties, bin_width, seed=bootstrap_seed(seed), shoes=shoes, n_shoes=shoe_number + 1)
+    hands_recorded = len(bins)
     
     print(f"    Recorded: {hands_recorded:,} hands ({hands_recorded/num_hands*100:.1f}%)")
     print(f"    Skipped (unstable): {skipped_unstable:,}")
@@ -244,57 +448,48 @@ def simulate_running_count(
     count_weights=None,
     bin_width=5,
     min_count=-100,
-    max_count=100
+    max_count=100,
+    dealer=None,
+    shuffle=None,
+    seed=None
 ):
     
-    total_counts = defaultdict(int)
-    tie_counts = defaultdict(int)
+    bins = array('q')
+    ties = array('b')
+    shoes = array('q')
     
-    shoe = CountedShoe(number_of_decks=number_of_decks, count_weights=count_weights)
+    if dealer is None:
+        dealer = rules_dealer(COUNTING._replace(number_of_decks=number_of_decks, shuffle=shuffle or "uniform"),
+                              count_weights)
+    shoe = dealer.shoe
+    on_bin = dealer.on_bin
     
-    hands_recorded = 0
+    shoe_number = 0
+    remaining = shoe.remaining
     
     for _ in range(num_hands):
-        if shoe.cards_remaining() < 52:
-            shoe.reset()
-        
+        dealer.ready()
+        if shoe.remaining > remaining:
+            shoe_number += 1
+        remaining = shoe.remaining
         
         running_count = shoe.count
         
         
-        outcome = play_hand_counted(shoe)
+        outcome = dealer.play()
         
         
         if min_count <= running_count < max_count:
             bin_index = math.floor(running_count / bin_width)
-            total_counts[bin_index] += 1
-            if outcome == "Tie":
-                tie_counts[bin_index] += 1
-            hands_recorded += 1
+            bins.append(bin_index)
+            ties.append(outcome == TIE)
+            shoes.append(shoe_number)
+            if on_bin is not None:
+                on_bin(bin_index, outcome)
     
     
-    results = []
-    for bin_index in sorted(total_counts.keys()):
-        n = total_counts[bin_index]
-        if n == 0:
-            continue
-        
-        ties = tie_counts[bin_index]
-        p_hat = ties / n
-        tie_ev = 8 * p_hat - (1 - p_hat)
-        
-        bin_left = bin_index * bin_width
-        bin_right = bin_left + bin_width
-        
-        results.append({
-            "bin_index": bin_index,
-            "bin_left": bin_left,
-            "bin_right": bin_right,
-            "hands": n,
-            "ties": ties,
-            "p_tie": p_hat,
-            "ev_tie": tie_ev,
-        })
+    results = bin_results(bins, ties, bin_width, seed=bootstrap_seed(seed), shoes=shoes, n_shoes=shoe_number + 1)
+    hands_recorded = len(bins)
     
     print(f"    Recorded: {hands_recorded:,} hands ({hands_recorded/num_hands*100:.1f}%)")
     
@@ -304,9 +499,55 @@ def simulate_running_count(
 # VISUALIZATION
 
 
-def plot_comparison(true_results, running_results, system_name):
+# With very narrow bins (or very long runs) there can be far more bins than a scatter plot can show.
+# We then pool neighbouring bins (their hands and ties), which keeps the EV estimate of each point exact.
+# The bootstrap interval of a pooled bin is drawn again from its counts (seeded, group by group). Its batch-means
+# error comes from the pooled sums: every shoe's hands in each of the merged bins count as one batch, which
+# leaves out the correlation between neighbouring bins of the same shoe (small next to the one within a bin).
+def merge_bins(results, max_bins, seed=0):
+    if len(results) <= max_bins:
+        return results
+    
+    group = -(-len(results) // max_bins)
+    merged = []
+    batch_sums = []
+    for i in range(0, len(results), group):
+        part = results[i:i + group]
+        n = sum(r['hands'] for r in part)
+        ties = sum(r['ties'] for r in part)
+        p_hat = ties / n
+        row = {
+            "bin_index": part[0]['bin_index'],
+            "bin_left": part[0]['bin_left'],
+            "bin_right": part[-1]['bin_right'],
+            "hands": n,
+            "ties": ties,
+            "p_tie": p_hat,
+            "ev_tie": 8 * p_hat - (1 - p_hat),
+        }
+        if 'ev_low' in part[0]:
+            row['ev_low'], row['ev_high'] = bootstrap_interval(n, ties, seed=[seed, i])
+            row['significant'] = row['ev_low'] > 0
+        if 'hands_sq' in part[0]:
+            batch_sums.append([sum(r[name] for r in part) for name in BATCH_SUMS])
+        merged.append(row)
+    
+    if batch_sums:
+        batch_means = BinBatchMeans()
+        batch_means.sums = np.array(batch_sums, dtype=np.int64).T
+        batch_means.shoes = results[0]['shoes_dealt']
+        errors = batch_means.errors()
+        for j, row in enumerate(merged):
+            row.update(errors.get(j, {}))
+    return merged
+
+
+def plot_comparison(true_results, running_results, system_name, max_points=200, seed=0):
     """Create side-by-side comparison of true count vs running count - EV only."""
     
+    true_results = merge_bins(true_results, max_points, seed)
+    running_results = merge_bins(running_results, max_points, seed)
+    
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
     
     # TRUE COUNT - Expected Value
@@ -316,6 +557,11 @@ def plot_comparison(true_results, running_results, system_name):
         tc_hands = [r['hands'] for r in true_results]
         
         colors = ['red' if ev < 0 else 'green' for ev in tc_evs]
+        if 'ev_low' in true_results[0]:
+            # 95% bootstrap intervals; the bins whose whole interval is above 0 are drawn in dark green.
+            errors = [[r['ev_tie'] - r['ev_low'] for r in true_results], [r['ev_high'] - r['ev_tie'] for r in true_results]]
+            ax1.errorbar(tc_bins, tc_evs, yerr=errors, fmt='none', ecolor='gray', alpha=0.5)
+            colors = ['darkgreen' if r['significant'] else c for r, c in zip(true_results, colors)]
         ax1.scatter(tc_bins, tc_evs, s=[min(h/100, 200) for h in tc_hands], 
                    alpha=0.6, c=colors)
         ax1.axhline(y=0, color='black', linestyle='-', linewidth=2, label='Break-even')
@@ -333,6 +579,11 @@ def plot_comparison(true_results, running_results, system_name):
         rc_hands = [r['hands'] for r in running_results]
         
         colors = ['red' if ev < 0 else 'green' for ev in rc_evs]
+        if 'ev_low' in running_results[0]:
+            # 95% bootstrap intervals; the bins whose whole interval is above 0 are drawn in dark green.
+            errors = [[r['ev_tie'] - r['ev_low'] for r in running_results], [r['ev_high'] - r['ev_tie'] for r in running_results]]
+            ax2.errorbar(rc_bins, rc_evs, yerr=errors, fmt='none', ecolor='gray', alpha=0.5)
+            colors = ['darkgreen' if r['significant'] else c for r, c in zip(running_results, colors)]
         ax2.scatter(rc_bins, rc_evs, s=[min(h/100, 200) for h in rc_hands], 
                    alpha=0.6, c=colors)
         ax2.axhline(y=0, color='black', linestyle='-', linewidth=2, label='Break-even')
@@ -377,7 +628,26 @@ def analyze_results(results, method_name, system_name):
     print(f"  Count range: [{best['bin_left']:.1f}, {best['bin_right']:.1f})")
     print(f"  P(Tie): {best['p_tie']:.4f} ({best['p_tie']*100:.2f}%)")
     print(f"  EV: {best['ev_tie']:.4f} ({best['ev_tie']*100:.2f}%)")
+    if 'ev_low' in best:
+        print(f"  95% CI: [{best['ev_low']:.4f}, {best['ev_high']:.4f}]"
+              f"{' - significantly +EV' if best['significant'] else ' - not significant'}")
     print(f"  Sample size: {best['hands']:,} hands")
+    if np.isfinite(best.get('ev_se', np.nan)):
+        # Hands of one shoe are correlated; the shoe batches tell how many independent hands they are worth.
+        print(f"  Standard error: {best['ev_se']:.4f} from shoe batches, {best['ev_se_binomial']:.4f} binomial "
+              f"({best['ess']:,.0f} effective hands from {best['shoes']:,} shoes)")
+    
+    # The highest point estimate often comes from a bin with few hands; the bins whose whole confidence
+    # interval is above 0 are the ones we can actually trust.
+    if 'ev_low' in best:
+        significant = [r for r in results if r['significant']]
+        sig_hands = sum(r['hands'] for r in significant)
+        print(f"\n Significantly +EV bins: {len(significant)} ({sig_hands:,} hands, {sig_hands/total_hands*100:.3f}%)")
+        if significant:
+            safest = max(significant, key=lambda x: x['ev_low'])
+            print(f"  Best lower bound: [{safest['bin_left']:.1f}, {safest['bin_right']:.1f}), "
+                  f"EV {safest['ev_tie']:.4f}, 95% CI [{safest['ev_low']:.4f}, {safest['ev_high']:.4f}], "
+                  f"{safest['hands']:,} hands")
     
     # Average in +EV situations
     avg_ev = sum(r['ev_tie'] * r['hands'] for r in positive_ev) / pos_hands
@@ -392,7 +662,7 @@ def analyze_results(results, method_name, system_name):
 # MAIN COMPARISON
 # =============================================================================
 
-def compare_methods(systems, num_hands=1000000):
+def compare_methods(systems, num_hands=1000000, shuffle=None):
     
     print("\n" + "="*80)
     print("COMPARING COUNTING SYSTEMS")
@@ -411,7 +681,8 @@ def compare_methods(systems, num_hands=1000000):
             count_weights=count_weights,
             bin_width=1.0,
             min_true=-10,
-            max_true=10
+            max_true=10,
+            shuffle=shuffle
         )
         print(f"    Time: {time.time() - start:.1f}s")
         
@@ -423,7 +694,8 @@ def compare_methods(systems, num_hands=1000000):
             count_weights=count_weights,
             bin_width=5,
             min_count=-60,
-            max_count=60
+            max_count=60,
+            shuffle=shuffle
         )
         print(f"    Time: {time.time() - start:.1f}s")
         
@@ -0,0 +1,278 @@
+# Out-of-core outcome corpora.
+# Convergence studies need 10^9 and more hands, which doesn't fit into RAM as Python lists.
+# generate_corpus writes the outcomes (and optionally hand keys and running counts) into memory-mapped .npy
+# files in fixed-size chunks. Every chunk is dealt by a worker process with its own seed and written to its
+# own, disjoint region of the files, so the result does not depend on the number of workers.
+# The analysis helpers below read the files chunk by chunk, so memory use stays flat however long the corpus is.
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from bacc import PLAYER, BANKER, TIE, OUTCOMES
+from batch_bacc import build_shoes, deal_shoes, running_counts, count_weight_matrix
+from rules import Rules, compile_rules
+
+CHUNK_HANDS = 1_000_000
+# An 8 deck shoe gives about 80 hands; we deal a few more shoes than needed so one pass is nearly always enough.
+HANDS_PER_SHOE_GUESS = 70
+
+
+def corpus_files(path):
+    return {
+        "meta": path + ".json",
+        "outcome": path + ".outcome.npy",
+        "key": path + ".key.npy",
+        "count": path + ".count.npy",
+        "remaining": path + ".remaining.npy",
+    }
+
+
+def _deal_chunk(hands, number_of_decks, seed, chunk_index, weights, cut_cards=6, shuffle=None, burn=0):
+    # shuffle: a shuffle model from shuffles.py; the counts need a shoe, so a continuous shuffler won't do.
+    # burn: cards burned after every shuffle. They are neither dealt nor counted, and since the first hand
+    # starts after them, "remaining" (cards left before the hand) is net of them, like in rules_dealer.
+    if shuffle is not None and shuffle.continuous:
+        raise ValueError("Running counts need shoes; a continuous shuffling machine has none")
+    rng = np.random.default_rng([seed, chunk_index])
+    parts = []
+    dealt = 0
+    while dealt < hands:
+        shoes = build_shoes(max(1, (hands - dealt) // HANDS_PER_SHOE_GUESS + 1), number_of_decks, rng, shuffle)
+        hands_dealt = deal_shoes(shoes, cut_cards, burn)
+        if weights is not None:
+            hands_dealt["count"] = running_counts(shoes, hands_dealt["start"], hands_dealt["shoe"], weights, burn)
+            hands_dealt["remaining"] = (shoes.shape[1] - hands_dealt["start"]).astype(np.int16)
+        parts.append(hands_dealt)
+        dealt += len(hands_dealt["outcome"])
+    return {name: np.concatenate([p[name] for p in parts])[:hands] for name in parts[0]}
+
+
+def deal_chunk(hands, rules, seed, chunk_index, weights=None):
+    # The hands of chunk chunk_index of a run under the given table rules (rules.Rules): decks, cut card or
+    # penetration, burned cards and shuffle all come from them. The arrays are the ones of deal_shoes, plus
+    # "count" (running count of every system in weights, a count_weight_matrix) and "remaining" (cards left
+    # before the hand) when weights are given.
+    compiled = compile_rules(rules)
+    return _deal_chunk(hands, rules.number_of_decks, seed, chunk_index, weights, compiled.reshuffle_at,
+                       compiled.shuffle, compiled.burn)
+
+
+def _write_chunk(path, chunk_index, begin, end, rules, seed, weights):
+    # Runs in a worker: deals hands [begin, end) and writes them into the memory-mapped files.
+    files = corpus_files(path)
+    dealt = deal_chunk(end - begin, rules, seed, chunk_index, weights)
+    for name in ("outcome", "key", "count", "remaining"):
+        if name in dealt:
+            target = np.load(files[name], mmap_mode="r+")
+            target[begin:end] = dealt[name]
+            target.flush()
+            del target
+    return end - begin
+
+
+def generate_corpus(path, hands, number_of_decks=8, seed=0, chunk_hands=CHUNK_HANDS, workers=None,
+                    count_systems=None, cut_cards=6, rules=None):
+    # count_systems: optional {name: weights dict} (for example contunt_2.COUNTING_SYSTEMS); the running
+    # count of every system before each hand is then stored too, together with the cards remaining.
+    # cut_cards: a new shoe is used when fewer cards than this are left (6 like play_bacc, 52 like contunt_2).
+    # rules: table rules (rules.Rules) deciding the decks, cut card, burned cards and shuffle; they replace
+    # number_of_decks and cut_cards.
+    if rules is None:
+        rules = Rules(number_of_decks=number_of_decks, cut_cards=cut_cards)
+    if compile_rules(rules).shuffle.continuous:
+        raise ValueError("A corpus is dealt from shoes; a continuous shuffling machine has none")
+    files = corpus_files(path)
+    weights = None
+    names = []
+    if count_systems:
+        names = list(count_systems)
+        weights = count_weight_matrix([count_systems[n] for n in names])
+
+    np.lib.format.open_memmap(files["outcome"], mode="w+", dtype=np.int8, shape=(hands,)).flush()
+    np.lib.format.open_memmap(files["key"], mode="w+", dtype=np.int16, shape=(hands,)).flush()
+    if weights is not None:
+        np.lib.format.open_memmap(files["count"], mode="w+", dtype=np.int32, shape=(hands, len(names))).flush()
+        np.lib.format.open_memmap(files["remaining"], mode="w+", dtype=np.int16, shape=(hands,)).flush()
+
+    chunks = [(i, begin, min(begin + chunk_hands, hands)) for i, begin in enumerate(range(0, hands, chunk_hands))]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_write_chunk, path, i, begin, end, rules, seed, weights)
+                   for i, begin, end in chunks]
+        for f in futures:
+            f.result()
+
+    meta = {"hands": hands, "number_of_decks": rules.number_of_decks, "seed": seed,
+            "chunk_hands": chunk_hands, "count_systems": names, "cut_cards": rules.cut_cards,
+            "rules": rules._asdict()}
+    with open(files["meta"], "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def load_corpus(path):
+    # Returns the metadata and the memory-mapped arrays (nothing is read into memory yet).
+    files = corpus_files(path)
+    with open(files["meta"]) as f:
+        meta = json.load(f)
+    arrays = {name: np.load(files[name], mmap_mode="r")
+              for name in ("outcome", "key", "count", "remaining") if os.path.exists(files[name])}
+    return meta, arrays
+
+
+def iter_chunks(array, chunk_hands=CHUNK_HANDS):
+    for begin in range(0, len(array), chunk_hands):
+        yield np.asarray(array[begin:begin + chunk_hands])
+
+
+# STREAMING ANALYSIS
+
+
+def corpus_ev(path, chunk_hands=CHUNK_HANDS, commission=0.05):
+    # Outcome counts and EV per bet, the same numbers simulations.py reports.
+    _, arrays = load_corpus(path)
+    counts = np.zeros(3, dtype=np.int64)
+    for chunk in iter_chunks(arrays["outcome"], chunk_hands):
+        counts += np.bincount(chunk, minlength=3)
+    return outcome_ev(counts, commission)
+
+
+def outcome_ev(counts, commission=0.05):
+    # The EV summary from the number of Player wins, Banker wins and ties.
+    player_win, banker_win, tie = (int(c) for c in counts)
+    n = int(counts.sum())
+    return {
+        "hands": n,
+        "player_win": player_win,
+        "banker_win": banker_win,
+        "tie": tie,
+        "player_ev": (player_win - banker_win) / n,
+        "banker_ev": (banker_win * (1 - commission) - player_win) / n,
+        "tie_ev": (tie * 8 - (n - tie)) / n,
+        "banker_no_commission_ev": (banker_win - player_win) / n,
+    }
+
+
+def count_bins(count, remaining, method, bin_width, min_count, max_count, min_decks=1.5):
+    # Which hands fall into the count range, and the bin index of each of them.
+    count = np.asarray(count, dtype=float)
+    if method == "true":
+        count = count / np.maximum(np.asarray(remaining) / 52, min_decks)
+    keep = (count >= min_count) & (count < max_count)
+    return keep, np.floor(count[keep] / bin_width).astype(np.int64)
+
+
+def bin_counts(count, remaining, outcome, method, bin_width, min_count, max_count, min_decks=1.5):
+    # Hands and ties per count bin of one chunk; element i belongs to bin index i + floor(min_count / bin_width).
+    offset = int(np.floor(min_count / bin_width))
+    size = int(np.ceil(max_count / bin_width)) - offset + 1
+    keep, bins = count_bins(count, remaining, method, bin_width, min_count, max_count, min_decks)
+    bins = bins - offset
+    total = np.bincount(bins, minlength=size)[:size]
+    ties = np.bincount(bins, weights=np.asarray(outcome)[keep] == TIE, minlength=size)[:size].astype(np.int64)
+    return total, ties
+
+
+def shoe_numbers(start):
+    # Numbering the shoes of dealt hands (in dealing order): a shoe starts where the position of the first card
+    # doesn't move forward. Works across the parts _deal_chunk glues together, whose "shoe" restarts at 0.
+    start = np.asarray(start)
+    return np.cumsum(np.r_[0, np.diff(start.astype(np.int64)) <= 0])
+
+
+def corpus_bin_table(path, system, method="running", bin_width=5, min_count=-60, max_count=60,
+                     min_decks=1.5, chunk_hands=CHUNK_HANDS, replicates=200):
+    # The per-bin Tie table of contunt_2.simulate_running_count / simulate_true_count, streamed from disk.
+    from contunt_2 import bin_table, BinBootstrap
+
+    meta, arrays = load_corpus(path)
+    column = meta["count_systems"].index(system)
+    offset = int(np.floor(min_count / bin_width))
+    size = int(np.ceil(max_count / bin_width)) - offset + 1
+    total = np.zeros(size, dtype=np.int64)
+    tie_total = np.zeros(size, dtype=np.int64)
+    # Bootstrap replicate counters are updated chunk by chunk, like the totals.
+    bootstrap = BinBootstrap(replicates, seed=meta["seed"]) if replicates else None
+
+    for begin in range(0, meta["hands"], chunk_hands):
+        end = min(begin + chunk_hands, meta["hands"])
+        chunk_total, chunk_ties = bin_counts(arrays["count"][begin:end, column], arrays["remaining"][begin:end],
+                                             arrays["outcome"][begin:end], method, bin_width, min_count,
+                                             max_count, min_decks)
+        total += chunk_total
+        tie_total += chunk_ties
+        if bootstrap is not None:
+            bootstrap.update(chunk_total, chunk_ties, offset)
+
+    return bin_table(total, tie_total, offset, bin_width, bootstrap)
+
+
+def corpus_streak_stats(path, chunk_hands=CHUNK_HANDS, max_length=64):
+    # Distribution of streak lengths (runs of the same outcome) for each outcome, streamed over the corpus.
+    _, arrays = load_corpus(path)
+    return streak_stats(iter_chunks(arrays["outcome"], chunk_hands), max_length)
+
+
+def run_lengths(outcomes):
+    # Run-length encoding: the outcome, first position and length of every run of equal outcomes.
+    outcomes = np.asarray(outcomes)
+    if len(outcomes) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return outcomes[:0], empty, empty
+    starts = np.r_[0, np.flatnonzero(np.diff(outcomes)) + 1]
+    lengths = np.diff(np.r_[starts, len(outcomes)])
+    return outcomes[starts], starts, lengths
+
+
+def streak_stats(chunks, max_length=64):
+    # The streak statistics of a stream of outcome chunks. A run that crosses a chunk boundary is carried over
+    # to the next chunk.
+    histogram = np.zeros((3, max_length + 1), dtype=np.int64)
+    longest = [0, 0, 0]
+    carry_code = -1
+    carry_length = 0
+
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        codes, _, lengths = run_lengths(chunk)
+        if codes[0] == carry_code:
+            lengths[0] += carry_length
+        elif carry_length:
+            _add_run(histogram, longest, carry_code, carry_length, max_length)
+        # The last run might continue in the next chunk, so we only record the finished ones.
+        np.add.at(histogram, (codes[:-1], np.minimum(lengths[:-1], max_length)), 1)
+        for code in range(3):
+            mask = codes[:-1] == code
+            if mask.any():
+                longest[code] = max(longest[code], int(lengths[:-1][mask].max()))
+        carry_code, carry_length = int(codes[-1]), int(lengths[-1])
+
+    if carry_length:
+        _add_run(histogram, longest, carry_code, carry_length, max_length)
+
+    return {OUTCOMES[code]: {"histogram": histogram[code], "longest": longest[code],
+                             "mean_length": _mean_length(histogram[code])} for code in (PLAYER, BANKER, TIE)}
+
+
+def _add_run(histogram, longest, code, length, max_length):
+    histogram[code, min(length, max_length)] += 1
+    longest[code] = max(longest[code], length)
+
+
+def _mean_length(histogram):
+    # The last bucket holds all runs of max_length or longer, so this is a slight underestimate for very long runs.
+    runs = histogram.sum()
+    return float((histogram * np.arange(len(histogram))).sum() / runs) if runs else 0.0
+
+
+if __name__ == "__main__":
+    import time
+    from contunt_2 import COUNTING_SYSTEMS
+
+    start = time.time()
+    generate_corpus("corpus_demo", 10_000_000, count_systems=COUNTING_SYSTEMS)
+    print(f"Generated in {time.time() - start:.1f}s")
+    print(corpus_ev("corpus_demo"))
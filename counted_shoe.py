@@ -0,0 +1,116 @@
+# One shared CountedShoe for all the counting scripts.
+# counting.py and contunt_2.py used to have two slightly different CountedShoe classes that popped strings
+# from a list and looked up every card's weight in a dict. This one:
+#   - stores the cards as ranks 0..12 (the order of bacc.cards) and deals by moving an index, no list pops,
+#   - keeps a live composition vector (how many cards of each rank are left), updated in O(1) per card,
+#   - can track several counting systems at once through a weight matrix (one row per system),
+#   - answers true_count / decks_remaining / penetration queries without touching the cards,
+#   - reshuffles in place on reset, reusing the same list.
+
+import random
+
+from bacc import cards, values, play_hand, BANKER_DRAWS
+
+NUM_RANKS = len(cards)
+RANK_VALUES = tuple(values[c] for c in cards)
+RANK_INDEX = {card: i for i, card in enumerate(cards)}
+
+
+def weight_vector(count_weights):
+    # A counting system given as a dict card -> weight (like the ones in contunt_2.py) as a tuple per rank.
+    if count_weights is None:
+        return (0,) * NUM_RANKS
+    return tuple(count_weights.get(card, 0) for card in cards)
+
+
+class CountedShoe:
+
+    __slots__ = ("cards", "remaining", "size", "initial_decks", "composition", "full_composition",
+                 "count", "count_weights", "weights", "systems", "weight_matrix", "_ordered", "_shuffle", "rng")
+
+    def __init__(self, number_of_decks=8, count_weights=None, systems=None, shuffle=None, rng=None):
+        # count_weights: the main counting system (dict card -> weight); its running count is kept in self.count.
+        # systems: optional {name: weights dict} of extra systems, see running_counts().
+        # rng: a random.Random for the cards a continuous shuffler puts back (return_cards); by default the
+        # random module. Give the shuffle the same one (ShuffleModel.bind) to keep the whole shoe on it.
+        self.initial_decks = number_of_decks
+        self.size = 52 * number_of_decks
+        # Same card order as bacc.build_shoe before shuffling, so a seeded shoe deals the same cards as before.
+        self._ordered = [RANK_INDEX[card] for _ in range(number_of_decks) for card in cards for _ in range(4)]
+        self.rng = random if rng is None else rng
+        self._shuffle = self.rng.shuffle if shuffle is None else shuffle
+        self.cards = list(self._ordered)
+        self.full_composition = [4 * number_of_decks] * NUM_RANKS
+        self.composition = list(self.full_composition)
+
+        self.count_weights = count_weights or {}
+        self.weights = weight_vector(count_weights)
+        self.systems = list(systems) if systems else []
+        self.weight_matrix = [weight_vector(systems[name]) for name in self.systems]
+
+        self.remaining = self.size
+        self.count = 0
+        self._shuffle(self.cards)
+
+    def draw(self):
+        # Cards are dealt from the end of the list, like bacc.draw.
+        remaining = self.remaining
+        if remaining == 0:
+            raise ValueError("Cannot draw from empty shoe")
+        remaining -= 1
+        card = self.cards[remaining]
+        self.remaining = remaining
+        self.composition[card] -= 1
+        self.count += self.weights[card]
+        return card
+
+    def burn(self, n):
+        # Burned cards go face down: they leave the shoe, but the count and composition don't see them.
+        self.remaining -= n
+
+    def return_cards(self, n, buffer=0):
+        # A continuous shuffling machine puts the last n dealt cards back at random places, at least `buffer`
+        # cards below the top. The running count keeps going: the counter has seen those cards.
+        returned = self.cards[self.remaining:self.remaining + n]
+        del self.cards[self.remaining:self.remaining + n]
+        for card in returned:
+            self.cards.insert(self.rng.randint(0, max(0, self.remaining - buffer)), card)
+            self.composition[card] += 1
+            self.remaining += 1
+
+    def cards_remaining(self):
+        return self.remaining
+
+    def decks_remaining(self):
+        return self.remaining / 52
+
+    def penetration(self):
+        # Share of the shoe that has already been dealt.
+        return 1 - self.remaining / self.size
+
+    def true_count(self, min_decks=1.5):
+        decks = max(self.remaining / 52, min_decks)
+        return self.count / decks
+
+    def running_counts(self):
+        # Running counts of all the extra systems, computed from the composition vector:
+        # count = sum over ranks of weight * (cards of that rank already dealt).
+        dealt = [full - left for full, left in zip(self.full_composition, self.composition)]
+        return [sum(w * d for w, d in zip(row, dealt)) for row in self.weight_matrix]
+
+    def true_counts(self, min_decks=1.5):
+        decks = max(self.remaining / 52, min_decks)
+        return [c / decks for c in self.running_counts()]
+
+    def reset(self):
+        # In-place reshuffle: we restore the new-deck order and shuffle the same list again.
+        self.cards[:] = self._ordered
+        self._shuffle(self.cards)
+        self.composition[:] = self.full_composition
+        self.remaining = self.size
+        self.count = 0
+
+
+# A hand on a CountedShoe (bacc.play_hand on its ranks), returning the outcome code.
+def play_counted_hand(shoe):
+    return play_hand(shoe.draw, RANK_VALUES)[0]
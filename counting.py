@@ -7,7 +7,7 @@
 # Matching parity isn't enough for a tie, but it's a necessary condition; pushing both totals into a narrower subset of 0-9 naturally increases the chance they land on the same number.
 # So an even-heavy shoe can increase the odds of betting on a tie. We will see if this bet can become theoretically profitable.
 
-from bacc import build_shoe, hand_value, decide_outcome, banker_draws_third
+from bacc import TIE
 cards = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K']
 values = {'A': 1, '2': 2, '3': 3, '4': 4, '5': 5, '6': 6, '7': 7, '8': 8, '9': 9, '10': 0, 'J': 0, 'Q': 0, 'K': 0}
 
@@ -28,68 +28,16 @@ count_weights = {
     'K': +1
 }
 
-# We will define a new class called CountedShoe, which will contain the cards, the running count and the logic to update that count when you draw a card.
-class CountedShoe:
-    def __init__(self, number_of_decks=8, count_weights=None):
-        self.cards = build_shoe(number_of_decks) # for storing the list of cards
-        self.count = 0 # for keeping the count
-        self.count_weights = count_weights # dictionary so that draw will know how to update the count when a card is drawn
-
-    def draw(self):
-        card = self.cards.pop() # takes one card from the end of self.cards
-        if self.count_weights is not None: # if a counting system was provided
-            self.count += self.count_weights[card] # we look up the weight assigned to that card and update the running count
-        return card
-
-    def cards_remaining(self): # to see how many cards are left
-        return len(self.cards)
-
-    def decks_remaining(self): # to see approximately how many decks are left
-        return len(self.cards) / 52
-
-# We update two original functions so they use .draw; everything else is reused from the original script.
-def first_deal2(shoe):
-    player = [shoe.draw(), shoe.draw()]
-    banker = [shoe.draw(), shoe.draw()]
-    return player, banker
+# CountedShoe contains the cards, the running count and the logic to update that count when you draw a card.
+# It lives in counted_shoe.py and is shared with contunt_2.py.
+from counted_shoe import CountedShoe, play_counted_hand
 
 def play_bacc2(shoe):
 
     if shoe.cards_remaining() < 6:
-        shoe.cards = build_shoe(8)
-        shoe.count = 0 
-
-    player, banker = first_deal2(shoe)
-
-    player_total = hand_value(player)
-    banker_total = hand_value(banker)
-
-    if player_total in {8, 9} or banker_total in {8, 9}:
-        return decide_outcome(player_total, banker_total)
-    
-    else:
-        player_third = None
-        if player_total <= 5:
-            player_third = shoe.draw()
-            player.append(player_third)
-            player_total = hand_value(player)
-
-        banker_third = None
-
-        if player_third is None:
-            if banker_total <= 5:
-                banker_third = shoe.draw()
-                banker.append(banker_third)
-                banker_total = hand_value(banker)
-        
-        else:
-            player_third_value = values[player_third]
-            if banker_draws_third(banker_total, player_third_value):
-                banker_third = shoe.draw()
-                banker.append(banker_third)
-                banker_total = hand_value(banker)
+        shoe.reset()
 
-        return decide_outcome(player_total, banker_total)
+    return play_counted_hand(shoe)
 
 # Our simulations yield the probability of winning with a Tie right off the bat is around 9.5%. The goal of counting is to find situations where the condtitional probability of winning on Tie when we have a high count = even-heavy remaining shoe is higher than that 9.5%;
 # to be more precise: for a fair bet (without the house edge), EV=0=8*p-1*(1-p) --> p=1/9, so the actual minimum probability we need for Tie to not be losing in expectation is 1/9.
@@ -124,15 +72,14 @@ def simulate_tie_probability(
 
     for i in range(num_hands):
         if shoe.cards_remaining() < 6:
-            shoe.cards = build_shoe(number_of_decks)
-            shoe.count = 0
+            shoe.reset()
 
         # Compute true count before the hand. This needs to be done before dealing the next hand to refelct the shoe composition at the decision time.
         decks_left = shoe.decks_remaining()
         if decks_left == 0:  # probably don't need this
             continue
         
-        true_count = shoe.count / decks_left
+        true_count = shoe.true_count(min_decks=0)
 
         # Only record if within interesting range.
         if true_count < min_true or true_count >= max_true:
@@ -147,7 +94,7 @@ def simulate_tie_probability(
         outcome = play_bacc2(shoe)
 
         total_counts[bin_index] += 1
-        if outcome == "Tie":
+        if outcome == TIE:
             tie_counts[bin_index] += 1
 
     # Compute estimated probabilities per bin.
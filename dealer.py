@@ -0,0 +1,170 @@
+# Dealing engine with event hooks.
+# To add something per hand (recording, extra counts, side-bet tracking, debugging) you used to copy play_bacc
+# and edit the copy; that's how play_bacc2 and play_hand_counted came to be. A Dealer instead lets you register
+# observers for these events:
+#   on_reshuffle(shoe)                     - the shoe was reshuffled (before the next hand)
+#   on_card(card, shoe)                    - a card (rank 0..12, see counted_shoe.py) was dealt
+#   on_hand_complete(outcome, player, banker, shoe) - a hand finished; player/banker are lists of ranks
+#   on_bin(bin_index, outcome)             - a driver (for example contunt_2.simulate_*) recorded a hand in a bin
+# Observers are plain callables, or objects with methods named like the events.
+#
+# When nobody is listening, Dealer.play is the plain fast engine (counted_shoe.play_counted_hand) and
+# Dealer.on_bin is None, so the fastest mode pays nothing for the hooks. Registering or removing an observer
+# switches Dealer.play to the observed engine and back. Both play the hand with bacc.play_hand; the observed
+# one wraps the draw function to announce every card.
+
+import time
+from array import array
+
+from counted_shoe import CountedShoe, play_counted_hand, weight_vector, RANK_VALUES
+from bacc import play_hand
+
+EVENTS = ("on_reshuffle", "on_card", "on_hand_complete", "on_bin")
+
+
+class Dealer:
+
+    def __init__(self, shoe=None, number_of_decks=8, count_weights=None, cut_cards=6, burn=0):
+        # cut_cards and burn are usually taken from compiled table rules, see rules.rules_dealer.
+        self.shoe = CountedShoe(number_of_decks, count_weights) if shoe is None else shoe
+        self.cut_cards = cut_cards
+        self.burn = burn
+        self.observers = {event: [] for event in EVENTS}
+        self._compile()
+
+    # OBSERVERS
+
+    def subscribe(self, event, callback):
+        if event not in self.observers:
+            raise ValueError(f"Unknown event: {event}")
+        self.observers[event].append(callback)
+        self._compile()
+
+    def unsubscribe(self, event, callback):
+        self.observers[event].remove(callback)
+        self._compile()
+
+    def add_observer(self, observer):
+        # Registering every on_* method the object has.
+        for event in EVENTS:
+            if hasattr(observer, event):
+                self.observers[event].append(getattr(observer, event))
+        self._compile()
+        return observer
+
+    def remove_observer(self, observer):
+        for event in EVENTS:
+            if hasattr(observer, event):
+                self.observers[event].remove(getattr(observer, event))
+        self._compile()
+
+    def _compile(self):
+        # Picking the engine once, when the observers change, instead of checking them on every hand.
+        observed = any(self.observers[e] for e in ("on_reshuffle", "on_card", "on_hand_complete"))
+        self.play = self._play_observed if observed else self._play_fast
+        bin_observers = tuple(self.observers["on_bin"])
+        self.on_bin = None
+        if bin_observers:
+            def on_bin(bin_index, outcome):
+                for callback in bin_observers:
+                    callback(bin_index, outcome)
+            self.on_bin = on_bin
+
+    # ENGINES
+
+    def ready(self):
+        # Reshuffling before a hand if needed. Drivers that look at the count before dealing call this first,
+        # so the count they read belongs to the shoe the hand will be dealt from.
+        shoe = self.shoe
+        if shoe.remaining < self.cut_cards:
+            self._reshuffle()
+            for callback in self.observers["on_reshuffle"]:
+                callback(shoe)
+
+    def _reshuffle(self):
+        shoe = self.shoe
+        shoe.reset()
+        if self.burn:
+            shoe.burn(self.burn)
+
+    def _play_fast(self):
+        shoe = self.shoe
+        if shoe.remaining < self.cut_cards:
+            self._reshuffle()
+        return play_counted_hand(shoe)
+
+    def _play_observed(self):
+        self.ready()
+        shoe = self.shoe
+
+        card_observers = self.observers["on_card"]
+        if card_observers:
+            def draw():
+                card = shoe.draw()
+                for callback in card_observers:
+                    callback(card, shoe)
+                return card
+        else:
+            draw = shoe.draw
+
+        outcome, player, banker = play_hand(draw, RANK_VALUES)
+        for callback in self.observers["on_hand_complete"]:
+            callback(outcome, player, banker, shoe)
+        return outcome
+
+
+# OBSERVERS
+
+
+class HandRecorder:
+    # Records the outcome code of every hand (and optionally the cards).
+
+    def __init__(self, keep_cards=False):
+        self.outcomes = array('b')
+        self.keep_cards = keep_cards
+        self.hands = []
+
+    def on_hand_complete(self, outcome, player, banker, shoe):
+        self.outcomes.append(outcome)
+        if self.keep_cards:
+            self.hands.append((tuple(player), tuple(banker)))
+
+
+class ExtraCount:
+    # An additional running count next to the shoe's own, reset on every reshuffle.
+
+    def __init__(self, count_weights):
+        self.weights = weight_vector(count_weights)
+        self.count = 0
+
+    def on_card(self, card, shoe):
+        self.count += self.weights[card]
+
+    def on_reshuffle(self, shoe):
+        self.count = 0
+
+
+class Instrumentation:
+    # Counts hands, cards and reshuffles, and measures hands per second.
+
+    def __init__(self):
+        self.hands = 0
+        self.cards = 0
+        self.reshuffles = 0
+        self.bins = 0
+        self.started = time.perf_counter()
+
+    def on_card(self, card, shoe):
+        self.cards += 1
+
+    def on_hand_complete(self, outcome, player, banker, shoe):
+        self.hands += 1
+
+    def on_reshuffle(self, shoe):
+        self.reshuffles += 1
+
+    def on_bin(self, bin_index, outcome):
+        self.bins += 1
+
+    def hands_per_second(self):
+        return self.hands / max(time.perf_counter() - self.started, 1e-9)
@@ -0,0 +1,454 @@
+# Differential checks of the fast engines against the reference rules.
+# bacc.play_bacc / deal_bacc (with banker_draws_third) and the simulate_* loops in strategies.py are the
+# definition of the game; every faster engine has to agree with them. Three kinds of checks:
+#   1. card for card: the same seeded list shoes are dealt by the reference and by every engine
+#      (batch_bacc, CountedShoe, Dealer with observers), and every hand must have the same outcome, hand key
+#      and number of cards,
+#   2. goodness of fit: the first hand of a shoe has exactly computable probabilities (exact_first_hand
+#      enumerates the first six cards), so engines that shuffle on their own (NumPy shoes, rules.deal_batch)
+#      are checked with a chi-square test of their hand keys and outcomes,
+#   3. path for path: the batched strategy engines (table.simulate_table, progressions.simulate_progressions,
+#      threads.run_progressions) against the single-bettor loops on the same outcomes.
+# run_checks() takes a few seconds, so it can be run after every change: python equivalence.py
+
+import math
+import random
+import sys
+
+import numpy as np
+import pandas as pd
+
+from bacc import (cards, build_shoe, deal_bacc, play_bacc_code, hand_value, decide_outcome_code,
+                  PLAYER, BANKER, TIE)
+from batch_bacc import BANKER_DRAWS, NUM_RANKS, RANK_VALUES, build_shoes, deal_shoes, ranks_from_cards
+from counted_shoe import CountedShoe, RANK_INDEX, play_counted_hand
+from dealer import Dealer
+from payouts import NUM_KEYS, OUTCOME_OF_KEY, hand_key
+
+ALPHA = 0.001
+
+
+def _row(check, engine, cases, mismatches, first=None, **extra):
+    row = {"check": check, "engine": engine, "cases": cases, "mismatches": mismatches,
+           "passed": mismatches == 0, "first_mismatch": first}
+    row.update(extra)
+    return row
+
+
+# 1. CARD FOR CARD
+
+
+def reference_hands(shoe, cut_cards=6):
+    # Every hand of a list shoe (like bacc.build_shoe returns) until the cut card, dealt by bacc.deal_bacc.
+    # play_bacc_code plays a copy of the same shoe alongside and has to agree on the outcome and the cards used.
+    shoe = list(shoe)
+    twin = list(shoe)
+    hands = []
+    while len(shoe) >= cut_cards:
+        before = len(shoe)
+        player, banker = deal_bacc(shoe, cut_cards=cut_cards)
+        outcome = decide_outcome_code(hand_value(player), hand_value(banker))
+        if play_bacc_code(twin, cut_cards=cut_cards) != outcome or len(twin) != len(shoe):
+            raise AssertionError("bacc.deal_bacc and bacc.play_bacc_code disagree")
+        hands.append((outcome, hand_key(player, banker), before - len(shoe)))
+    return hands
+
+
+def _counted_shoe(shoe):
+    # A CountedShoe holding exactly the cards of a list shoe (both deal from the end of the list).
+    counted = CountedShoe(len(shoe) // 52)
+    counted.cards[:] = [RANK_INDEX[card] for card in shoe]
+    counted.remaining = len(shoe)
+    return counted
+
+
+def counted_shoe_hands(shoe, cut_cards=6):
+    counted = _counted_shoe(shoe)
+    hands = []
+    while counted.remaining >= cut_cards:
+        before = counted.remaining
+        outcome = play_counted_hand(counted)
+        hands.append((outcome, None, before - counted.remaining))
+    return hands
+
+
+def dealer_hands(shoe, cut_cards=6):
+    # The observed engine of dealer.Dealer; the observer sees the cards, so the hand key is checked too.
+    dealer = Dealer(_counted_shoe(shoe), cut_cards=cut_cards)
+    seen = []
+    dealer.subscribe("on_hand_complete", lambda outcome, player, banker, s: seen.append((outcome, player, banker)))
+    hands = []
+    while dealer.shoe.remaining >= cut_cards:
+        dealer.play()
+        outcome, player, banker = seen[-1]
+        player = [cards[r] for r in player]
+        banker = [cards[r] for r in banker]
+        hands.append((outcome, hand_key(player, banker), len(player) + len(banker)))
+    return hands
+
+
+def batch_hands(shoes, cut_cards=6):
+    # All shoes in one call of the vectorized engine, split back into one list of hands per shoe.
+    dealt = deal_shoes(np.array([ranks_from_cards(shoe) for shoe in shoes]), cut_cards)
+    result = [[] for _ in shoes]
+    for s, outcome, key, used in zip(dealt["shoe"], dealt["outcome"], dealt["key"], dealt["ncards"]):
+        result[s].append((int(outcome), int(key), int(used)))
+    return result
+
+
+def compare_hands(reference, engine, name):
+    # reference and engine: one list of (outcome, key, cards used) per shoe; key None means "not reported".
+    cases = 0
+    mismatches = 0
+    first = None
+    for s, (expected, got) in enumerate(zip(reference, engine)):
+        if len(expected) != len(got):
+            mismatches += 1
+            first = first or {"shoe": s, "hands": (len(expected), len(got))}
+        for h, (a, b) in enumerate(zip(expected, got)):
+            cases += 1
+            same = a[0] == b[0] and a[2] == b[2] and (b[1] is None or a[1] == b[1])
+            if not same:
+                mismatches += 1
+                first = first or {"shoe": s, "hand": h, "reference": a, "engine": b}
+    return _row("card for card", name, cases, mismatches, first)
+
+
+def card_for_card(n_shoes=200, number_of_decks=8, cut_cards=6, seed=0):
+    random.seed(seed)
+    shoes = [build_shoe(number_of_decks) for _ in range(n_shoes)]
+    reference = [reference_hands(shoe, cut_cards) for shoe in shoes]
+    return [
+        compare_hands(reference, batch_hands(shoes, cut_cards), "batch_bacc.deal_shoes"),
+        compare_hands(reference, [counted_shoe_hands(shoe, cut_cards) for shoe in shoes],
+                      "counted_shoe.play_counted_hand"),
+        compare_hands(reference, [dealer_hands(shoe, cut_cards) for shoe in shoes], "dealer.Dealer (observed)"),
+    ]
+
+
+# 2. EXACT PROBABILITIES AND GOODNESS OF FIT
+
+
+def exact_first_hand(number_of_decks=8):
+    # Exact probability of every hand key for the first hand of a freshly shuffled shoe.
+    # The first four cards matter by rank (pairs), the fifth and sixth only by value, so we enumerate
+    # 13^4 rank combinations times 10 x 10 values of the drawing cards, weighting each sequence by the
+    # chance of drawing it without replacement. Cards that a hand doesn't use are summed out automatically.
+    per_rank = 4 * number_of_decks
+    n = 52 * number_of_decks
+    r = np.indices((NUM_RANKS,) * 4).reshape(4, -1)
+    v = RANK_VALUES[r].astype(np.int64)
+
+    weight = np.ones(r.shape[1])
+    for i in range(4):
+        seen = sum((r[j] == r[i]).astype(int) for j in range(i))
+        weight *= (per_rank - seen) / (n - i)
+
+    value_count = np.bincount(RANK_VALUES, minlength=10) * per_rank
+    used = np.array([(v == value).sum(axis=0) for value in range(10)])  # (values, combinations)
+
+    player2 = (v[0] + v[1]) % 10
+    banker2 = (v[2] + v[3]) % 10
+    natural = (player2 >= 8) | (banker2 >= 8)
+    player_third = ~natural & (player2 <= 5)
+    pairs = 800 * (r[0] == r[1]) + 1600 * (r[2] == r[3])
+
+    probabilities = np.zeros(NUM_KEYS)
+    for fifth in range(10):
+        w5 = weight * (value_count[fifth] - used[fifth]) / (n - 4)
+        for sixth in range(10):
+            w6 = w5 * (value_count[sixth] - used[sixth] - (fifth == sixth)) / (n - 5)
+            third_value = np.where(player_third, fifth, 10)
+            banker_third = ~natural & BANKER_DRAWS[banker2, third_value]
+            banker_card = np.where(player_third, sixth, fifth)
+            player_total = np.where(player_third, (player2 + fifth) % 10, player2)
+            banker_total = np.where(banker_third, (banker2 + banker_card) % 10, banker2)
+            key = (player_total + 10 * banker_total + 100 * natural + 200 * player_third
+                   + 400 * banker_third + pairs)
+            probabilities += np.bincount(key, weights=w6, minlength=NUM_KEYS)
+    return probabilities
+
+
+def exact_outcome_probabilities(number_of_decks=8):
+    return np.bincount(OUTCOME_OF_KEY, weights=exact_first_hand(number_of_decks), minlength=3)
+
+
+def chi2_sf(x, df):
+    # P(chi-square with df degrees of freedom > x), the regularized upper incomplete gamma function Q(df/2, x/2):
+    # a series for small x and a continued fraction for large x (Numerical Recipes, gammq).
+    a = df / 2
+    x = x / 2
+    if x <= 0:
+        return 1.0
+    log_front = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        term = total = 1 / a
+        k = a
+        for _ in range(1000):
+            k += 1
+            term *= x / k
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(0.0, 1 - total * math.exp(log_front))
+    b = x + 1 - a
+    c = 1 / 1e-300
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = 1e-300 if abs(d) < 1e-300 else d
+        c = b + an / c
+        c = 1e-300 if abs(c) < 1e-300 else c
+        d = 1 / d
+        step = d * c
+        h *= step
+        if abs(step - 1) < 1e-15:
+            break
+    return math.exp(log_front) * h
+
+
+def chi_square_test(observed, probabilities, min_expected=5):
+    # Pearson's test; categories expected fewer than min_expected times are pooled into one.
+    observed = np.asarray(observed, dtype=float)
+    expected = observed.sum() * np.asarray(probabilities, dtype=float)
+    small = expected < min_expected
+    if small.any():
+        observed = np.r_[observed[~small], observed[small].sum()]
+        expected = np.r_[expected[~small], expected[small].sum()]
+    keep = expected > 0
+    if (observed[~keep] > 0).any():
+        # Something happened that has probability 0.
+        return math.inf, int(keep.sum()) - 1, 0.0
+    observed, expected = observed[keep], expected[keep]
+    statistic = float(((observed - expected) ** 2 / expected).sum())
+    df = len(expected) - 1
+    # Too few hands for even two categories: nothing to test.
+    return statistic, df, chi2_sf(statistic, df) if df > 0 else 1.0
+
+
+def fit_row(engine, keys, probabilities, alpha=ALPHA):
+    keys = np.asarray(keys)
+    rows = []
+    for level, observed, p in (
+            ("outcome", np.bincount(OUTCOME_OF_KEY[keys], minlength=3),
+             np.bincount(OUTCOME_OF_KEY, weights=probabilities, minlength=3)),
+            ("hand key", np.bincount(keys, minlength=NUM_KEYS), probabilities)):
+        statistic, df, p_value = chi_square_test(observed, p)
+        rows.append(_row(f"goodness of fit ({level})", engine, len(keys), int(p_value < alpha),
+                         chi2=statistic, df=df, p_value=p_value))
+    return rows
+
+
+def goodness_of_fit(n_shoes=100_000, python_shoes=10_000, number_of_decks=8, seed=0, alpha=ALPHA):
+    # First hands only: hands later in a shoe depend on each other and on the cut card.
+    from rules import Rules, deal_batch
+
+    probabilities = exact_first_hand(number_of_decks)
+    rng = np.random.default_rng(seed)
+    rows = []
+
+    # With 9 cards per row and the cut at 6, deal_shoes deals exactly one hand per row (at most 6 cards).
+    shoes = build_shoes(n_shoes, number_of_decks, rng)[:, :9]
+    rows += fit_row("batch_bacc.build_shoes + deal_shoes", deal_shoes(shoes, cut_cards=6)["key"], probabilities,
+                    alpha)
+
+    # The first hand after the burn card is still a first hand off the top, from the player's point of view.
+    dealt = deal_batch(n_shoes // 20, Rules(number_of_decks=number_of_decks, burn=3), rng)
+    rows += fit_row("rules.deal_batch (burn 3)", dealt["key"][dealt["start"] == 3], probabilities, alpha)
+
+    random.seed(seed)
+    keys = [hand_key(*deal_bacc(build_shoe(number_of_decks))) for _ in range(python_shoes)]
+    rows += fit_row("bacc.build_shoe + deal_bacc", keys, probabilities, alpha)
+
+    counted = CountedShoe(number_of_decks)
+    outcomes = []
+    for _ in range(python_shoes):
+        counted.reset()
+        outcomes.append(play_counted_hand(counted))
+    statistic, df, p_value = chi_square_test(np.bincount(outcomes, minlength=3),
+                                             np.bincount(OUTCOME_OF_KEY, weights=probabilities, minlength=3))
+    rows.append(_row("goodness of fit (outcome)", "counted_shoe.CountedShoe.reset", python_shoes,
+                     int(p_value < alpha), chi2=statistic, df=df, p_value=p_value))
+    return rows
+
+
+# 3. PATH FOR PATH
+
+
+def _reference_summary(path, initial_bankroll):
+    from sketches import max_drawdown
+
+    path = np.asarray(path, dtype=float)
+    broke = np.flatnonzero(path <= 0)
+    ruin = int(broke[0]) + 1 if len(broke) else -1
+    return {
+        "final_bankroll": 0.0 if ruin > 0 else float(path[-1]),
+        "ruin_hand": ruin,
+        "peak_bankroll": max(initial_bankroll, float(path.max())),
+        "max_drawdown": max_drawdown(path, initial_bankroll),
+    }
+
+
+def _compare_summaries(check, engine, frame, references):
+    mismatches = 0
+    first = None
+    for i, expected in enumerate(references):
+        got = frame.iloc[i]
+        bad = [c for c, value in expected.items() if not np.isclose(got[c], value)]
+        if bad:
+            mismatches += 1
+            first = first or {"seat": i, "columns": bad, "reference": expected,
+                              "engine": {c: got[c] for c in bad}}
+    return _row(check, engine, len(references), mismatches, first)
+
+
+def table_paths(hands=2000, seed=0):
+    # table.simulate_table against simulate_flat / _martingale / _paroli / _dalembert, on one shared outcome
+    # sequence and with one sequence per seat.
+    from rules import STANDARD, generate_outcomes
+    from strategies import simulate_flat, simulate_martingale, simulate_paroli, simulate_dalembert
+    from table import bettor_grid, simulate_table
+
+    reference = {"Flat": simulate_flat, "Martingale": simulate_martingale, "Paroli": simulate_paroli,
+                 "D'Alembert": simulate_dalembert}
+    bettors = bettor_grid(base_bets=(1, 5), bankrolls=(20, 100))
+    seats = len(bettors["strategy"])
+
+    random.seed(seed)
+    outcomes = generate_outcomes(hands, STANDARD)
+    frame, _ = simulate_table(outcomes, bettors)
+    expected = [_reference_summary(reference[s](outcomes, bankroll, base, bet), bankroll)
+                for s, bet, base, bankroll in zip(bettors["strategy"], bettors["bet_type"], bettors["base_bet"],
+                                                  bettors["bankroll"])]
+    rows = [_compare_summaries("path for path", "table.simulate_table (shared outcomes)", frame, expected)]
+
+    per_seat = np.array([generate_outcomes(hands, STANDARD) for _ in range(seats)]).T
+    frame, _ = simulate_table(per_seat, bettors)
+    expected = [_reference_summary(reference[s](per_seat[:, i].tolist(), bankroll, base, bet), bankroll)
+                for i, (s, bet, base, bankroll) in enumerate(zip(bettors["strategy"], bettors["bet_type"],
+                                                                 bettors["base_bet"], bettors["bankroll"]))]
+    rows.append(_compare_summaries("path for path", "table.simulate_table (per seat)", frame, expected))
+    return rows
+
+
+def progression_paths(hands=2000, seed=0):
+    # progressions.simulate_progressions (batched) against the scalar engine, every bankroll after every hand,
+    # and both against the loops of strategies.py (simulate_flat, simulate_martingale, ...).
+    from progressions import PROGRESSIONS, simulate_progression, simulate_progressions
+    from rules import STANDARD, generate_outcomes
+    from strategies import simulate_flat, simulate_martingale, simulate_paroli, simulate_dalembert
+
+    random.seed(seed)
+    outcomes = generate_outcomes(hands, STANDARD)
+    combos = [(name, bet, bankroll) for name in PROGRESSIONS for bet in ("Player", "Banker", "Tie")
+              for bankroll in (30, 200)]
+    seats = {
+        "progression": [c[0] for c in combos],
+        "bet_type": [c[1] for c in combos],
+        "base_bet": np.ones(len(combos)),
+        "bankroll": np.array([c[2] for c in combos], dtype=float),
+    }
+    _, history = simulate_progressions(outcomes, seats, paths=True)
+    mismatches = 0
+    first = None
+    for i, (name, bet, bankroll) in enumerate(combos):
+        path = simulate_progression(PROGRESSIONS[name], outcomes, bankroll, 1, bet)
+        bad = np.flatnonzero(~np.isclose(history[:, i], path))
+        if len(bad):
+            mismatches += 1
+            first = first or {"progression": name, "bet_type": bet, "hand": int(bad[0]) + 1}
+    rows = [_row("path for path", "progressions.simulate_progressions", len(combos), mismatches, first)]
+
+    # Every system of strategies.py against its progression, on the same outcomes: the scalar engine and the
+    # batched one, for every bet, a base bet of 1 and 2 and a bankroll the stakes run into.
+    systems = {"Flat": simulate_flat, "Martingale": simulate_martingale, "Paroli": simulate_paroli,
+               "D'Alembert": simulate_dalembert}
+    cases = [(name, bet, base_bet, bankroll) for name in systems for bet in ("Player", "Banker", "Tie")
+             for base_bet, bankroll in ((1, 30), (2, 75.5))]
+    seats = {
+        "progression": [c[0] for c in cases],
+        "bet_type": [c[1] for c in cases],
+        "base_bet": np.array([c[2] for c in cases], dtype=float),
+        "bankroll": np.array([c[3] for c in cases], dtype=float),
+    }
+    _, history = simulate_progressions(outcomes, seats, paths=True)
+    for engine in ("scalar", "batched"):
+        mismatches = 0
+        first = None
+        for i, (name, bet, base_bet, bankroll) in enumerate(cases):
+            expected = systems[name](outcomes, bankroll, base_bet, bet)
+            if engine == "scalar":
+                got = simulate_progression(PROGRESSIONS[name], outcomes, bankroll, base_bet, bet)
+            else:
+                got = history[:, i]
+            bad = np.flatnonzero(~np.isclose(expected, got))
+            if len(bad):
+                mismatches += 1
+                first = first or {"progression": name, "bet_type": bet, "base_bet": base_bet,
+                                  "hand": int(bad[0]) + 1}
+        rows.append(_row("path for path", f"progressions ({engine}) vs strategies.simulate_*", len(cases),
+                         mismatches, first))
+    return rows
+
+
+def threaded_paths(sessions=4, hands=1000, seed=0, workers=2):
+    # threads.run_progressions on a thread pool against strategies.simulate_* run serially on the outcomes of
+    # every session (threads.ProgressionJob.outcomes, seeded per session like the threads).
+    from rules import STANDARD
+    from strategies import simulate_flat, simulate_martingale, simulate_paroli, simulate_dalembert, \
+        simulate_fibonacci
+    from threads import ProgressionJob, progression_seats, run_progressions
+
+    systems = {"Flat": simulate_flat, "Martingale": simulate_martingale, "Paroli": simulate_paroli,
+               "D'Alembert": simulate_dalembert, "Fibonacci": simulate_fibonacci}
+    cases = 0
+    mismatches = 0
+    first = None
+    for bet in ("Player", "Banker", "Tie"):
+        run = run_progressions(sessions, hands, list(systems), bet, bankroll=40, seed=seed, workers=workers,
+                               executor="thread", paths=True)
+        _, paths = run["result"]
+        job = ProgressionJob(progression_seats(list(systems), bet, 40), STANDARD, seed)
+        for session in range(sessions):
+            outcomes = job.outcomes(hands, session)
+            for seat, simulate in enumerate(systems.values()):
+                cases += 1
+                bad = np.flatnonzero(~np.isclose(simulate(outcomes, 40, 1, bet), paths[session, :, seat]))
+                if len(bad):
+                    mismatches += 1
+                    first = first or {"progression": list(systems)[seat], "bet_type": bet, "session": session,
+                                      "hand": int(bad[0]) + 1}
+    return [_row("path for path", "threads.run_progressions vs strategies.simulate_*", cases, mismatches, first)]
+
+
+# ALL CHECKS
+
+
+def run_checks(seed=0, verbose=True):
+    rows = []
+    rows += card_for_card(seed=seed)
+    rows += card_for_card(n_shoes=100, number_of_decks=1, seed=seed)
+    rows += card_for_card(n_shoes=100, cut_cards=52, seed=seed)
+    rows += goodness_of_fit(seed=seed)
+    rows += table_paths(seed=seed)
+    rows += progression_paths(seed=seed)
+    rows += threaded_paths(seed=seed)
+    report = pd.DataFrame(rows)
+    if verbose:
+        columns = ["check", "engine", "cases", "mismatches", "p_value", "passed"]
+        print(report[columns].to_string(index=False))
+        for row in rows:
+            if not row["passed"] and row["first_mismatch"] is not None:
+                print(f"\n{row['engine']}: first mismatch {row['first_mismatch']}")
+    return report
+
+
+if __name__ == "__main__":
+    probabilities = exact_outcome_probabilities()
+    print(f"Exact first hand (8 decks): Player {probabilities[PLAYER]:.6f}, Banker {probabilities[BANKER]:.6f}, "
+          f"Tie {probabilities[TIE]:.6f}\n")
+    report = run_checks()
+    sys.exit(0 if report["passed"].all() else 1)
@@ -0,0 +1,162 @@
+# Settlement layer driven by a payout matrix.
+# Instead of an if/elif chain over strings (settle_bet in strategies.py), every finished hand is described by
+# one integer "hand key" that holds everything any bet needs to know about it:
+#   player total, banker total, was it a natural, did Player/Banker draw a third card, Player pair, Banker pair.
+# The payout matrix has one row per bet type and one column per hand key, and holds the payout multiplier
+# (profit per 1 unit staked). Settling any number of hands for all bet types is then one fancy-indexing step.
+
+import numpy as np
+
+from bacc import PLAYER, BANKER, TIE, build_shoe, deal_bacc, hand_value
+
+# Layout of the hand key: key = player_total + 10*banker_total + 100*natural + 200*player_third
+#                               + 400*banker_third + 800*player_pair + 1600*banker_pair
+NUM_KEYS = 3200
+
+# Tie on a specific total (both hands end on the same given total).
+TIE_TOTAL_PAYS = [150, 215, 225, 200, 120, 110, 45, 45, 80, 80]
+
+# Dragon Bonus pays on non-natural wins by a margin of 4 or more.
+DRAGON_MARGIN_PAYS = {9: 30, 8: 10, 7: 6, 6: 4, 5: 2, 4: 1}
+
+PAIR_PAYS = 11
+
+# EZ Baccarat: no commission, but a Banker win with a three card 7 ("Dragon 7") is a push on Banker.
+# The two side bets pay on a Banker three card 7 win and on a Player three card 8 win ("Panda 8").
+DRAGON_7_PAYS = 40
+PANDA_8_PAYS = 25
+
+BET_TYPES = [
+    "Player",
+    "Banker",
+    "Tie",
+    "Banker No Commission",
+    "Player Pair",
+    "Banker Pair",
+    "Player Dragon",
+    "Banker Dragon",
+    "EZ Banker",
+    "Dragon 7",
+    "Panda 8",
+] + [f"Tie {total}" for total in range(10)]
+
+
+def hand_key(player, banker):
+    # Computing the key of a finished hand from its cards (lists like the ones deal_bacc returns).
+    player_total = hand_value(player)
+    banker_total = hand_value(banker)
+    natural = hand_value(player[:2]) >= 8 or hand_value(banker[:2]) >= 8
+    return (player_total + 10 * banker_total + 100 * natural
+            + 200 * (len(player) == 3) + 400 * (len(banker) == 3)
+            + 800 * (player[0] == player[1]) + 1600 * (banker[0] == banker[1]))
+
+
+def decode_keys(keys):
+    # The inverse of hand_key for an array of keys; returns a dict of arrays.
+    keys = np.asarray(keys)
+    return {
+        "player_total": keys % 10,
+        "banker_total": keys // 10 % 10,
+        "natural": keys // 100 % 2,
+        "player_third": keys // 200 % 2,
+        "banker_third": keys // 400 % 2,
+        "player_pair": keys // 800 % 2,
+        "banker_pair": keys // 1600 % 2,
+    }
+
+
+ALL_KEYS = decode_keys(np.arange(NUM_KEYS))
+OUTCOME_OF_KEY = np.where(ALL_KEYS["player_total"] > ALL_KEYS["banker_total"], PLAYER,
+                          np.where(ALL_KEYS["banker_total"] > ALL_KEYS["player_total"], BANKER, TIE)).astype(np.int8)
+
+
+def _dragon_row(own_total, other_total, natural):
+    margin = own_total - other_total
+    row = np.full(NUM_KEYS, -1.0)
+    for m, pays in DRAGON_MARGIN_PAYS.items():
+        row[(natural == 0) & (margin == m)] = pays
+    row[(natural == 1) & (margin > 0)] = 1.0
+    row[(natural == 1) & (margin == 0)] = 0.0
+    return row
+
+
+def build_payout_matrix(commission=0.05, bet_types=None):
+    # Returns the (bet types x hand keys) matrix of payout multipliers.
+    k = ALL_KEYS
+    outcome = OUTCOME_OF_KEY
+    rows = {}
+
+    rows["Player"] = np.select([outcome == PLAYER, outcome == BANKER], [1.0, -1.0], 0.0)
+    rows["Banker"] = np.select([outcome == BANKER, outcome == PLAYER], [1.0 - commission, -1.0], 0.0)
+    rows["Tie"] = np.where(outcome == TIE, 8.0, -1.0)
+
+    # No-commission Banker: a Banker win pays even money, except a win with a total of 6 pays half.
+    rows["Banker No Commission"] = np.select(
+        [(outcome == BANKER) & (k["banker_total"] == 6), outcome == BANKER, outcome == PLAYER],
+        [0.5, 1.0, -1.0], 0.0)
+
+    dragon_7 = (outcome == BANKER) & (k["banker_third"] == 1) & (k["banker_total"] == 7)
+    panda_8 = (outcome == PLAYER) & (k["player_third"] == 1) & (k["player_total"] == 8)
+    rows["EZ Banker"] = np.select([dragon_7, outcome == BANKER, outcome == PLAYER], [0.0, 1.0, -1.0], 0.0)
+    rows["Dragon 7"] = np.where(dragon_7, float(DRAGON_7_PAYS), -1.0)
+    rows["Panda 8"] = np.where(panda_8, float(PANDA_8_PAYS), -1.0)
+
+    rows["Player Pair"] = np.where(k["player_pair"] == 1, float(PAIR_PAYS), -1.0)
+    rows["Banker Pair"] = np.where(k["banker_pair"] == 1, float(PAIR_PAYS), -1.0)
+
+    rows["Player Dragon"] = _dragon_row(k["player_total"], k["banker_total"], k["natural"])
+    rows["Banker Dragon"] = _dragon_row(k["banker_total"], k["player_total"], k["natural"])
+
+    for total, pays in enumerate(TIE_TOTAL_PAYS):
+        rows[f"Tie {total}"] = np.where((outcome == TIE) & (k["player_total"] == total), float(pays), -1.0)
+
+    bet_types = BET_TYPES if bet_types is None else bet_types
+    return np.array([rows[b] for b in bet_types])
+
+
+PAYOUT_MATRIX = build_payout_matrix()
+
+
+# SETTLEMENT
+
+
+def settle_hands(keys, stakes=1.0, matrix=PAYOUT_MATRIX):
+    # Profit of every bet type on every hand, shape (hands, bet types).
+    # stakes can be a number, one stake per bet type, or a full (hands, bet types) array.
+    return matrix[:, np.asarray(keys)].T * stakes
+
+
+def settle_totals(keys, stakes=1.0, matrix=PAYOUT_MATRIX):
+    # Total profit of every bet type over all hands when the stake per bet type is constant.
+    # We only need to know how often each hand key happened, so this costs one bincount.
+    key_counts = np.bincount(np.asarray(keys), minlength=NUM_KEYS)
+    return (matrix @ key_counts) * stakes
+
+
+def outcome_payouts(commission=0.05, bet_types=("Player", "Banker", "Tie")):
+    # Payout per (bet type, outcome) for bets that only depend on who won, like the ones in settle_bet.
+    matrix = build_payout_matrix(commission, list(bet_types))
+    # Any key with the given outcome will do; we pick the first non-natural hand without pairs or third cards.
+    plain = (ALL_KEYS["natural"] == 0) & (ALL_KEYS["player_pair"] == 0) & (ALL_KEYS["banker_pair"] == 0) \
+        & (ALL_KEYS["player_third"] == 0) & (ALL_KEYS["banker_third"] == 0) & (ALL_KEYS["banker_total"] != 6)
+    columns = [np.flatnonzero(plain & (OUTCOME_OF_KEY == o))[0] for o in (PLAYER, BANKER, TIE)]
+    return matrix[:, columns]
+
+
+def deal_keys(hands_number, shoe=None):
+    # Dealing hands and recording their keys as a compact int16 array.
+    if shoe is None:
+        shoe = build_shoe()
+    keys = np.empty(hands_number, dtype=np.int16)
+    for i in range(hands_number):
+        player, banker = deal_bacc(shoe)
+        keys[i] = hand_key(player, banker)
+    return keys
+
+
+if __name__ == "__main__":
+    hands_number = 200000
+    keys = deal_keys(hands_number)
+    evs = settle_totals(keys) / hands_number
+    for bet, ev in zip(BET_TYPES, evs):
+        print(f"EV per hand ({bet}): {ev:.4f}")
@@ -0,0 +1,170 @@
+# Plotting helpers for very long bankroll paths and EV curves.
+# A figure is at most a couple of thousand pixels wide, so drawing 10^5 (or 10^8) points per line only costs
+# time and memory. Before plotting we downsample each line in a way that keeps its shape:
+#   - min/max envelope: every bucket of consecutive points is replaced by its minimum and maximum
+#     (in the order they happened), so spikes and crashes to 0 are never lost,
+#   - LTTB (Largest Triangle Three Buckets): picks one point per bucket that best preserves the visual shape.
+# Paths can be lists, NumPy arrays, np.memmap files or iterators that yield chunks of values;
+# memory-mapped and streamed paths are read in chunks, so memory use doesn't grow with the length of the path.
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+CHUNK_SIZE = 1 << 22
+
+
+# Log-spaced checkpoints 1 <= c <= hands_number (integers, no duplicates), for EV convergence plots.
+# Early hands get many checkpoints, where the EV still moves a lot, and late hands only a few.
+def log_checkpoints(hands_number, num=200, start=1):
+    points = np.geomspace(start, hands_number, num=num)
+    return np.unique(np.round(points).astype(np.int64))
+
+
+def linear_checkpoints(hands_number, step=100):
+    return np.arange(step, hands_number + 1, step)
+
+
+def _minmax_buckets(y, bucket, offset):
+    # Min and max of each full bucket of `bucket` consecutive values of y, in the order they occur.
+    n = len(y) // bucket * bucket
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    blocks = np.asarray(y[:n], dtype=float).reshape(-1, bucket)
+    lo = blocks.argmin(axis=1)
+    hi = blocks.argmax(axis=1)
+    first = np.minimum(lo, hi)
+    second = np.maximum(lo, hi)
+    starts = np.arange(len(blocks)) * bucket
+    rows = np.arange(len(blocks))
+    x = np.column_stack([starts + first, starts + second]).ravel() + offset
+    values = np.column_stack([blocks[rows, first], blocks[rows, second]]).ravel()
+    return x, values
+
+
+def minmax_downsample(y, max_points=2000):
+    # Min/max envelope of an array-like path (list, array or np.memmap), returns (x, y) with x = hand index.
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n), np.asarray(y, dtype=float)
+
+    bucket = -(-n // (max_points // 2))
+    xs, ys = [], []
+    # Reading whole buckets in chunks keeps memory bounded even for memory-mapped paths.
+    chunk = max(bucket, CHUNK_SIZE // bucket * bucket)
+    for start in range(0, n, chunk):
+        part = y[start:start + chunk]
+        x, v = _minmax_buckets(part, bucket, start)
+        xs.append(x)
+        ys.append(v)
+        tail = len(part) % bucket
+        if tail:
+            # The last, incomplete bucket.
+            rest = np.asarray(part[len(part) - tail:], dtype=float)
+            idx = sorted({int(rest.argmin()), int(rest.argmax())})
+            xs.append(np.array(idx) + start + len(part) - tail)
+            ys.append(rest[idx])
+    return np.concatenate(xs), np.concatenate(ys)
+
+
+def lttb(x, y, max_points=2000):
+    # Largest Triangle Three Buckets downsampling of the points (x, y).
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n <= max_points or max_points < 3:
+        return x, y
+
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # The average point of the next bucket is the third corner of the triangle.
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return x[keep], y[keep]
+
+
+def stream_downsample(chunks, max_points=2000):
+    # Min/max envelope of a path that arrives as an iterator of chunks of unknown total length.
+    # We keep at most max_points envelope points; whenever we have too many, neighbouring buckets are
+    # merged (bucket size doubles), so memory stays bounded however long the stream is.
+    bucket = 1
+    xs = np.zeros(0, dtype=np.int64)
+    ys = np.zeros(0)
+    pending = np.zeros(0)
+    offset = 0
+
+    for chunk in chunks:
+        pending = np.concatenate([pending, np.asarray(chunk, dtype=float)])
+        while True:
+            x, v = _minmax_buckets(pending, bucket, offset)
+            used = len(pending) // bucket * bucket
+            xs = np.concatenate([xs, x])
+            ys = np.concatenate([ys, v])
+            pending = pending[used:]
+            offset += used
+            if len(xs) <= max_points:
+                break
+            # Too many points: merge pairs of buckets (each bucket has exactly two envelope points).
+            xs, ys = _merge_envelope(xs, ys)
+            bucket *= 2
+            if len(pending) < bucket:
+                break
+
+    while len(xs) > max_points and len(xs) >= 4:
+        xs, ys = _merge_envelope(xs, ys)
+
+    if len(pending):
+        idx = sorted({int(pending.argmin()), int(pending.argmax())})
+        xs = np.concatenate([xs, np.array(idx) + offset])
+        ys = np.concatenate([ys, pending[idx]])
+    return xs, ys
+
+
+def _merge_envelope(xs, ys):
+    pairs = len(xs) // 4
+    if pairs == 0:
+        return xs, ys
+    bx = xs[:pairs * 4].reshape(-1, 4)
+    by = ys[:pairs * 4].reshape(-1, 4)
+    rows = np.arange(pairs)
+    lo = by.argmin(axis=1)
+    hi = by.argmax(axis=1)
+    first = np.minimum(lo, hi)
+    second = np.maximum(lo, hi)
+    new_x = np.column_stack([bx[rows, first], bx[rows, second]]).ravel()
+    new_y = np.column_stack([by[rows, first], by[rows, second]]).ravel()
+    return np.concatenate([new_x, xs[pairs * 4:]]), np.concatenate([new_y, ys[pairs * 4:]])
+
+
+def downsample_path(path, max_points=2000, method="lttb"):
+    # One entry point for every kind of path: returns (x, y) with at most about max_points points.
+    if not hasattr(path, "__len__"):
+        return stream_downsample(path, max_points)
+
+    if method == "minmax":
+        return minmax_downsample(path, max_points)
+    if method == "lttb":
+        # For very long paths, LTTB runs on a finer min/max envelope instead of every single point.
+        x, y = minmax_downsample(path, max_points * 16)
+        return lttb(x, y, max_points)
+    raise ValueError(f"Unknown downsampling method: {method}")
+
+
+def plot_paths(paths, ax=None, x=None, max_points=2000, method="lttb", **kwargs):
+    # Plotting several long paths given as {label: path}. By default the x axis is the hand index;
+    # x can give other positions for the points (for example the EV checkpoints).
+    if ax is None:
+        ax = plt.gca()
+    for label, path in paths.items():
+        index, y = downsample_path(path, max_points, method)
+        positions = index if x is None else np.asarray(x)[np.asarray(index, dtype=np.int64)]
+        ax.plot(positions, y, label=label, **kwargs)
+    return ax
@@ -0,0 +1,359 @@
+# Betting progressions as data.
+# Every system in strategies.py is its own loop. Here a progression is described by:
+#   - an initial state,
+#   - the bet in a state (in units of the base bet),
+#   - the next state after a win, a loss, a tie (the hand was a tie and the bet was returned) and any other push,
+# and compile() walks all states reachable from the initial one, numbers them and stores the description as
+# two tables: bet units per state and next state per (event, state). One engine then runs every progression:
+# a scalar one (a path per run, like simulate_flat & co.) and a batched one that moves a whole population of
+# bettors at once with NumPy.
+# States can be anything hashable (a number, a tuple of numbers), so systems with unbounded state like
+# Labouchère are enumerated up to max_states; a transition out of the enumerated states, or to a bet above
+# max_units, resets the progression (a stop-loss), or with overflow="clamp" keeps betting max_units.
+
+import numpy as np
+import pandas as pd
+
+from bacc import TIE, OUTCOME_CODES
+from payouts import outcome_payouts
+
+WIN, LOSS, TIE_EVENT, PUSH = 0, 1, 2, 3
+EVENTS = ["win", "loss", "tie", "push"]
+
+
+class Progression:
+
+    def __init__(self, name, initial, bet, win, loss, tie=None, push=None, max_states=10000, max_units=None,
+                 overflow="reset", cap_at_bankroll=True, chips=None, cap_at_initial=False):
+        # bet(state) -> units; win/loss/tie/push(state) -> next state. Ties and pushes keep the state by default.
+        # cap_at_bankroll: never stake more than what is left (like simulate_martingale & co.); flat betting
+        # stakes the full base bet even then, like simulate_flat.
+        # chips(state) -> a fixed amount added to the bet, for systems that step by one chip whatever the base
+        # bet (simulate_dalembert). cap_at_initial: never bet more than the initial bankroll (the max_bet of
+        # simulate_paroli).
+        if overflow not in ("reset", "clamp"):
+            raise ValueError(f"Unknown overflow rule: {overflow}")
+        self.name = name
+        self.initial = initial
+        self.bet = bet
+        self.transitions = [win, loss, tie or (lambda state: state), push or (lambda state: state)]
+        self.max_states = max_states
+        self.max_units = max_units
+        self.overflow = overflow
+        self.cap_at_bankroll = cap_at_bankroll
+        self.chips = chips
+        self.cap_at_initial = cap_at_initial
+        self._compiled = None
+
+    def compile(self):
+        # The tables are built once per progression and shared by every run that uses it.
+        if self._compiled is None:
+            self._compiled = self._build()
+        return self._compiled
+
+    def _build(self):
+        states = [self.initial]
+        number = {self.initial: 0}
+        next_state = []
+        k = 0
+        while k < len(states):
+            state = states[k]
+            row = []
+            for transition in self.transitions:
+                target = transition(state)
+                if target not in number:
+                    too_big = self.overflow == "reset" and self.max_units is not None \
+                        and self.bet(target) > self.max_units
+                    if len(states) >= self.max_states or too_big:
+                        row.append(0)
+                        continue
+                    number[target] = len(states)
+                    states.append(target)
+                row.append(number[target])
+            next_state.append(row)
+            k += 1
+
+        units = np.array([self.bet(s) for s in states], dtype=float)
+        if self.max_units is not None:
+            units = np.minimum(units, self.max_units)
+        chips = np.array([self.chips(s) if self.chips else 0 for s in states], dtype=float)
+        return CompiledProgression(self.name, states, units, np.array(next_state, dtype=np.int32).T,
+                                   self.cap_at_bankroll, chips, self.cap_at_initial)
+
+
+class CompiledProgression:
+
+    def __init__(self, name, states, units, next_state, cap_at_bankroll=True, chips=None, cap_at_initial=False):
+        self.name = name
+        self.states = states          # the original state values, by number
+        self.units = units            # bet units per state
+        self.next_state = next_state  # (4 events, states)
+        self.cap_at_bankroll = cap_at_bankroll
+        self.chips = np.zeros(len(states)) if chips is None else chips  # fixed amount on top of the units
+        self.cap_at_initial = cap_at_initial
+
+    def stakes(self, base_bet):
+        return self.units * base_bet + self.chips
+
+    def __len__(self):
+        return len(self.states)
+
+    def outcome_transitions(self, bet_type, commission=0.05):
+        # Next state per (outcome, state) for a bet on bet_type, and the payout per outcome.
+        # Which event an outcome is (win, loss, tie, push) only depends on the bet, so the engines can go
+        # straight from the outcome code to the next state.
+        payout = payout_row(bet_type, commission)
+        events = [WIN if p > 0 else LOSS if p < 0 else TIE_EVENT if o == TIE else PUSH for o, p in enumerate(payout)]
+        return self.next_state[events], payout
+
+
+def payout_row(bet_type, commission=0.05):
+    return outcome_payouts(commission, [bet_type])[0]
+
+
+# SYSTEMS
+
+
+def _fibonacci(n):
+    a, b = 1, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+
+FLAT = Progression("Flat", 0, bet=lambda s: 1, win=lambda s: 0, loss=lambda s: 0, cap_at_bankroll=False)
+
+# Martingale, Paroli and D'Alembert follow simulate_martingale, simulate_paroli and simulate_dalembert in
+# strategies.py hand for hand: a hand that doesn't make a profit (a tie included) counts as a loss, and the
+# stake is capped by what is left of the bankroll, not by a table limit. The state stops growing at
+# MAX_DOUBLINGS (2^40 units is more than any bankroll) and MAX_STEPS, where it stays.
+MAX_DOUBLINGS = 40
+MAX_STEPS = 10_000
+
+# Doubling after a loss, back to the base bet after a win.
+MARTINGALE = Progression("Martingale", 0, bet=lambda s: 2 ** s, win=lambda s: 0,
+                         loss=lambda s: min(s + 1, MAX_DOUBLINGS), tie=lambda s: min(s + 1, MAX_DOUBLINGS),
+                         push=lambda s: min(s + 1, MAX_DOUBLINGS))
+
+# Doubling after a win, up to the initial bankroll, back to the base bet after a loss.
+PAROLI = Progression("Paroli", 0, bet=lambda s: 2 ** s, win=lambda s: min(s + 1, MAX_DOUBLINGS),
+                     loss=lambda s: 0, tie=lambda s: 0, push=lambda s: 0, cap_at_initial=True)
+
+# One chip more after a loss, one chip less after a win, never below the base bet; the state is the number
+# of chips above the base bet.
+DALEMBERT = Progression("D'Alembert", 0, bet=lambda s: 1, chips=lambda s: s, win=lambda s: max(0, s - 1),
+                        loss=lambda s: min(s + 1, MAX_STEPS), tie=lambda s: min(s + 1, MAX_STEPS),
+                        push=lambda s: min(s + 1, MAX_STEPS), max_states=MAX_STEPS + 1)
+
+# One step forward in the Fibonacci sequence after a loss, two steps back after a win.
+FIBONACCI = Progression("Fibonacci", 0, bet=_fibonacci, win=lambda s: max(0, s - 2), loss=lambda s: s + 1,
+                        max_states=40)
+
+# 1-3-2-6: four winning bets in a row complete the cycle, a loss restarts it.
+ONE_THREE_TWO_SIX = Progression("1-3-2-6", 0, bet=lambda s: (1, 3, 2, 6)[s], win=lambda s: (s + 1) % 4,
+                                loss=lambda s: 0)
+
+
+# Labouchère: the state is the list of numbers still to win. We bet the sum of the first and last number;
+# a win crosses both out, a loss writes the lost bet at the end. An empty list completes the cycle.
+def labouchere(line=(1, 2, 3), max_length=12, max_states=20000):
+    line = tuple(line)
+
+    def bet(state):
+        return state[0] + state[-1] if len(state) > 1 else state[0]
+
+    def win(state):
+        rest = state[1:-1]
+        return rest if rest else line
+
+    def loss(state):
+        # A line longer than max_length is abandoned, like a stop-loss.
+        return state + (bet(state),) if len(state) < max_length else line
+
+    return Progression("Labouchère", line, bet=bet, win=win, loss=loss, max_states=max_states)
+
+
+# Oscar's Grind: the state is (bet, profit of the current cycle) in units, and a cycle ends at +1 unit.
+# The bet goes up by one unit after a win, but never above what finishes the cycle; it stays after a loss.
+# Wins are counted as even money (the commission is left out of the cycle bookkeeping).
+def oscars_grind(max_deficit=50):
+    def win(state):
+        bet, profit = state
+        profit += bet
+        if profit >= 1:
+            return (1, 0)
+        return (min(bet + 1, 1 - profit), profit)
+
+    def loss(state):
+        bet, profit = state
+        profit -= bet
+        if profit < -max_deficit:
+            return (1, 0)
+        return (bet, profit)
+
+    return Progression("Oscar's Grind", (1, 0), bet=lambda s: s[0], win=win, loss=loss)
+
+
+LABOUCHERE = labouchere()
+OSCARS_GRIND = oscars_grind()
+
+PROGRESSIONS = {p.name: p for p in (FLAT, MARTINGALE, PAROLI, DALEMBERT, FIBONACCI, ONE_THREE_TWO_SIX,
+                                    LABOUCHERE, OSCARS_GRIND)}
+
+
+# ENGINES
+
+
+def simulate_progression(progression, outcomes, initial_bankroll, base_bet, bet_type, table_limit=None,
+                         commission=0.05):
+    # The scalar engine; returns the bankroll after every hand, like the simulate_* functions in strategies.py.
+    compiled = progression.compile() if isinstance(progression, Progression) else progression
+    next_state, payout = compiled.outcome_transitions(bet_type, commission)
+    next_state = next_state.tolist()
+    payout = payout.tolist()
+    stakes = compiled.stakes(base_bet).tolist()
+    limit = float("inf") if table_limit is None else table_limit
+    if compiled.cap_at_initial:
+        limit = min(limit, initial_bankroll)
+    cap = compiled.cap_at_bankroll
+
+    bankroll = initial_bankroll
+    state = 0
+    path = []
+    for outcome in outcomes:
+        if bankroll <= 0:
+            path.append(0)
+            continue
+        stake = min(stakes[state], bankroll, limit) if cap else min(stakes[state], limit)
+        bankroll += stake * payout[outcome]
+        path.append(bankroll)
+        state = next_state[outcome][state]
+    return path
+
+
+def progression_simulator(progression):
+    # A function with the same signature as simulate_flat & co., for strategies.py and the notebooks.
+    compiled = progression.compile()
+
+    def simulate(outcomes, initial_bankroll, base_bet, bet_type):
+        return simulate_progression(compiled, outcomes, initial_bankroll, base_bet, bet_type)
+
+    simulate.__name__ = "simulate_" + progression.name.lower().replace(" ", "_")
+    return simulate
+
+
+def simulate_progressions(outcomes, seats, commission=0.05, paths=False):
+    # The batched engine. seats is a dict of equally long arrays/lists:
+    #   progression (names from PROGRESSIONS or Progression objects), bet_type, base_bet, bankroll,
+    #   and optionally table_limit.
+    # outcomes is one sequence for every seat, or a (hands, seats) array with one sequence per seat.
+    # All progressions are put into one set of tables (their states numbered one after the other), so every
+    # hand is a few fancy-indexing steps for the whole population, whatever mix of systems it holds.
+    progressions = [PROGRESSIONS[p] if isinstance(p, str) else p for p in seats["progression"]]
+    bet_types = list(seats["bet_type"])
+    n = len(progressions)
+
+    compiled = {}
+    offsets = {}
+    total = 0
+    for p in progressions:
+        if p not in compiled:
+            compiled[p] = p.compile()
+            offsets[p] = total
+            total += len(compiled[p])
+    pairs = sorted({(p, b) for p, b in zip(progressions, bet_types)}, key=lambda pb: (offsets[pb[0]], pb[1]))
+
+    # One block of states per (progression, bet type), because the bet type decides which outcome is which event.
+    block = {}
+    units = []
+    chips = []
+    capped = []
+    next_blocks = []
+    payouts = []
+    start = 0
+    for p, b in pairs:
+        c = compiled[p]
+        next_state, payout = c.outcome_transitions(b, commission)
+        block[(p, b)] = start
+        units.append(c.units)
+        chips.append(c.chips)
+        capped.append(np.full(len(c), c.cap_at_bankroll))
+        next_blocks.append(next_state + start)
+        payouts.append(np.repeat(payout[:, None], len(c), axis=1))
+        start += len(c)
+    units = np.concatenate(units)
+    chips = np.concatenate(chips)
+    capped = np.concatenate(capped)
+    next_state = np.concatenate(next_blocks, axis=1)  # (3 outcomes, all states)
+    payout = np.concatenate(payouts, axis=1)          # (3 outcomes, all states)
+
+    state = np.array([block[(p, b)] for p, b in zip(progressions, bet_types)], dtype=np.int64)
+    base_bet = np.asarray(seats["base_bet"], dtype=float)
+    bankroll = np.asarray(seats["bankroll"], dtype=float).copy()
+    initial_bankroll = bankroll.copy()
+    limit = np.asarray(seats.get("table_limit", np.full(n, np.inf)), dtype=float)
+    cap_at_initial = np.array([compiled[p].cap_at_initial for p in progressions], dtype=bool)
+    limit = np.where(cap_at_initial, np.minimum(limit, initial_bankroll), limit)
+    peak = bankroll.copy()
+    drawdown = np.zeros(n)
+    wagered = np.zeros(n)
+    ruin_hand = np.full(n, -1, dtype=np.int64)
+
+    if len(outcomes) and isinstance(outcomes[0], str):
+        outcomes = [OUTCOME_CODES[o] for o in outcomes]
+    outcomes = np.asarray(outcomes)
+    history = np.empty((len(outcomes), n)) if paths else None
+
+    for hand, outcome in enumerate(outcomes, start=1):
+        alive = bankroll > 0
+        stake = np.minimum(units[state] * base_bet + chips[state], limit)
+        stake = np.where(capped[state], np.minimum(stake, bankroll), stake)
+        stake[~alive] = 0.0
+        bankroll += stake * payout[outcome, state]
+        wagered += stake
+        np.maximum(peak, bankroll, out=peak)
+        np.maximum(drawdown, peak - np.maximum(bankroll, 0.0), out=drawdown)
+        ruin_hand[alive & (bankroll <= 0)] = hand
+        state = next_state[outcome, state]
+        if paths:
+            # Like simulate_flat & co.: the bankroll of the hand that ruined the seat (it can be below 0 when
+            # the stake isn't capped), then 0.
+            history[hand - 1] = np.where((ruin_hand > 0) & (ruin_hand < hand), 0.0, bankroll)
+
+    final_bankroll = np.where(ruin_hand > 0, 0.0, bankroll)
+    result = pd.DataFrame({
+        "progression": [p.name for p in progressions],
+        "bet_type": bet_types,
+        "base_bet": base_bet,
+        "initial_bankroll": initial_bankroll,
+        "final_bankroll": final_bankroll,
+        "peak_bankroll": peak,
+        "max_drawdown": drawdown,
+        "ruin_hand": ruin_hand,
+        "wagered": wagered,
+    })
+    result["net"] = result["final_bankroll"] - result["initial_bankroll"]
+    return (result, history) if paths else result
+
+
+if __name__ == "__main__":
+    import itertools
+    import time
+
+    from bacc import build_shoe, generate_outcomes
+
+    hands = 10000
+    combos = list(itertools.product(PROGRESSIONS, ["Player", "Banker"], [100, 1000]))
+    seats = {
+        "progression": [c[0] for c in combos for _ in range(50)],
+        "bet_type": [c[1] for c in combos for _ in range(50)],
+        "base_bet": [1] * (len(combos) * 50),
+        "bankroll": [c[2] for c in combos for _ in range(50)],
+    }
+    outcomes = np.stack([np.frombuffer(generate_outcomes(hands, build_shoe()), dtype=np.int8)
+                         for _ in range(len(seats["bet_type"]))], axis=1)
+    start = time.time()
+    result = simulate_progressions(outcomes, seats)
+    print(f"{len(seats['bet_type'])} bettors x {hands} hands in {time.time() - start:.2f}s")
+    result["ruined"] = result["ruin_hand"] > 0
+    print(result.groupby(["progression", "bet_type", "initial_bankroll"])[["ruined", "net"]].mean())
@@ -0,0 +1,346 @@
+# Recorded shoes: card sequences logged at real tables.
+# The simulators deal shoes we shuffled ourselves. Here we read the cards that were actually dealt, in large
+# files, and turn them into the same integer shoes batch_bacc uses (ranks 0..12, dealt from index 0). From there
+# everything is the vectorized engine again: the hands are rebuilt with the third card rules (deal_shoes), the
+# running counts of every counting system come from running_counts, and the result tables are the ones of the
+# simulators (corpus.outcome_ev, contunt_2.bin_table, corpus.streak_stats), so real and simulated shoes can be
+# compared directly.
+#
+# Two layouts are read:
+#   "line" - one shoe per line, the cards in dealing order separated by spaces, commas, semicolons or tabs
+#            (so a CSV file with one shoe per row is fine too). Lines starting with '#' are comments;
+#            skip_fields drops the first fields of every line (a shoe id, a date, ...).
+#   "long" - a CSV file with one card per row and (at least) a shoe and a card column, rows in dealing order.
+# A card is A, 2-9, 10 or T, J, Q, K in any case, optionally followed by a suit letter (S, H, D, C): "10",
+# "Td", "qs" and "A" are all fine.
+#
+# Files are read in blocks of whole shoes, so memory use stays flat however long the log is. The "line"
+# layout is decoded byte by byte with NumPy (no Python loop over cards), which reads millions of hands per
+# second.
+#
+# A recorded shoe is only the dealt part of a shoe: it ends at the cut card (or wherever the log ends), so
+# rows have different lengths. A last hand without all of its cards is dropped. The cards remaining before a
+# hand (for true counts) are counted from the full shoe of number_of_decks decks.
+
+import numpy as np
+import pandas as pd
+
+from bacc import TIE, cards
+from batch_bacc import NUM_RANKS, deal_shoes, running_counts, count_weight_matrix
+from corpus import outcome_ev, count_bins, shoe_numbers, streak_stats, deal_chunk
+from rules import Rules
+
+BLOCK_BYTES = 1 << 22
+CHUNK_ROWS = 1_000_000
+
+SEPARATORS = b" ,;\t\r\n"
+SUITS = b"SHDCshdc"
+
+# Rank of every first byte of a card ('1' starts "10"), -1 for bytes that can't start a card.
+RANK_OF_BYTE = np.full(256, -1, dtype=np.int8)
+for _rank, _card in enumerate(cards):
+    RANK_OF_BYTE[ord(_card[0])] = _rank
+    RANK_OF_BYTE[ord(_card[0].lower())] = _rank
+RANK_OF_BYTE[ord("T")] = RANK_OF_BYTE[ord("t")] = cards.index("10")
+IS_SEPARATOR = np.zeros(256, dtype=bool)
+IS_SEPARATOR[list(SEPARATORS)] = True
+IS_SUIT = np.zeros(256, dtype=bool)
+IS_SUIT[list(SUITS)] = True
+
+
+def card_rank(token):
+    # The rank of a single card token, or -1 if it isn't a card.
+    token = str(token).strip()
+    if len(token) > 1 and token[-1] in SUITS.decode():
+        token = token[:-1]
+    token = token.upper()
+    if token == "T":
+        return cards.index("10")
+    return cards.index(token) if token in cards else -1
+
+
+# READING
+
+
+def _line_blocks(path, block_bytes):
+    # Blocks of whole lines.
+    with open(path, "rb") as f:
+        rest = b""
+        while True:
+            data = f.read(block_bytes)
+            if not data:
+                break
+            data = rest + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                rest = data
+                continue
+            yield data[:cut]
+            rest = data[cut:]
+        if rest:
+            yield rest
+
+
+def _decode_lines(data, first_line, skip_fields):
+    # The shoes of a block of lines: ranks (shoes, longest shoe), padded with 0, the number of cards in every
+    # shoe and the line it came from.
+    b = np.frombuffer(data, dtype=np.uint8)
+    separator = IS_SEPARATOR[b]
+    starts = np.flatnonzero(~separator & np.r_[True, separator[:-1]])
+    ends = np.flatnonzero(~separator & np.r_[separator[1:], True]) + 1
+    line = np.cumsum(b == ord("\n"), dtype=np.int32)[starts]
+
+    # Position of every field within its line; comment lines and the skipped fields are dropped.
+    first_field = np.flatnonzero(np.r_[True, line[1:] != line[:-1]])
+    fields = np.diff(np.r_[first_field, len(starts)])
+    field = np.arange(len(starts)) - np.repeat(first_field, fields)
+    comment = np.repeat(b[starts[first_field]] == ord("#"), fields)
+    keep = ~comment & (field >= skip_fields)
+    starts, ends, line = starts[keep], ends[keep], line[keep]
+
+    length = ends - starts
+    first = b[starts]
+    second = b[np.minimum(starts + 1, len(b) - 1)]
+    rank = RANK_OF_BYTE[first]
+    ten = first == ord("1")
+    body = 1 + ten
+    valid = ((rank >= 0) & (~ten | ((length >= 2) & (second == ord("0"))))
+             & ((length == body) | ((length == body + 1) & IS_SUIT[b[ends - 1]])))
+    if not valid.all():
+        bad = np.flatnonzero(~valid)[0]
+        token = data[starts[bad]:ends[bad]].decode(errors="replace")
+        raise ValueError(f"Unknown card {token!r} on line {first_line + line[bad] + 1}")
+
+    # Lines are in order, so a shoe starts wherever the line changes.
+    new_shoe = np.r_[True, line[1:] != line[:-1]] if len(line) else np.zeros(0, dtype=bool)
+    shoe = np.cumsum(new_shoe) - 1
+    return _rows(rank, shoe, int(new_shoe.sum())) + (first_line + line[new_shoe] + 1,)
+
+
+def _rows(rank, shoe, n_shoes):
+    # Ragged shoes (the rank and shoe of every card, in dealing order) as padded rows.
+    lengths = np.bincount(shoe, minlength=n_shoes)
+    first = np.r_[0, np.cumsum(lengths)[:-1]]
+    position = np.arange(len(shoe)) - first[shoe]
+    rows = np.zeros((n_shoes, lengths.max() if n_shoes else 0), dtype=np.int8)
+    rows[shoe, position] = rank
+    return rows, lengths
+
+
+def _long_chunks(path, shoe_column, card_column, chunk_rows):
+    # Chunks of whole shoes from a long CSV file, with the number of rows before them; the last shoe of a
+    # chunk may go on in the next one.
+    carry = None
+    rows_before = 0
+    reader = pd.read_csv(path, usecols=[shoe_column, card_column], dtype=str, chunksize=chunk_rows)
+    for frame in reader:
+        if carry is not None:
+            frame = pd.concat([carry, frame], ignore_index=True)
+        shoe_ids = frame[shoe_column].to_numpy()
+        last = np.flatnonzero(shoe_ids != shoe_ids[-1])
+        cut = last[-1] + 1 if len(last) else 0
+        carry = frame.iloc[cut:]
+        if cut:
+            yield frame.iloc[:cut], rows_before
+            rows_before += cut
+    if carry is not None and len(carry):
+        yield carry, rows_before
+
+
+def _decode_long(frame, shoe_column, card_column, first_row):
+    codes, tokens = pd.factorize(frame[card_column].fillna(""))
+    ranks = np.array([card_rank(t) for t in tokens], dtype=np.int8)
+    if (ranks < 0).any() or (codes < 0).any():
+        bad = np.flatnonzero((codes < 0) | (ranks[codes] < 0))[0]
+        raise ValueError(f"Unknown card {frame[card_column].iloc[bad]!r} in row {first_row + bad + 1}")
+    shoe_ids = frame[shoe_column].to_numpy()
+    shoe = np.cumsum(np.r_[0, shoe_ids[1:] != shoe_ids[:-1]])
+    first = np.flatnonzero(np.r_[True, shoe_ids[1:] != shoe_ids[:-1]])
+    return _rows(ranks[codes], shoe, len(first)) + (first_row + first + 1,)
+
+
+def read_shoes(path, layout="line", number_of_decks=8, skip_fields=0, shoe_column="shoe", card_column="card",
+               block_bytes=BLOCK_BYTES, chunk_rows=CHUNK_ROWS):
+    # Yields the recorded shoes in blocks: dicts with
+    #   cards    - ranks, shape (shoes, longest shoe of the block), dealt from index 0 and padded with 0
+    #   lengths  - number of recorded cards in every shoe
+    #   line     - line (row for "long") of the file every shoe starts on, for error messages
+    # A shoe with more cards of a rank than number_of_decks decks hold is a broken log and raises ValueError.
+    if layout == "line":
+        blocks = (_decode_lines(data, lines_before, skip_fields)
+                  for data, lines_before in _numbered(_line_blocks(path, block_bytes)))
+    elif layout == "long":
+        # Row numbers count the header as row 1, like a spreadsheet.
+        blocks = (_decode_long(frame, shoe_column, card_column, rows_before + 1)
+                  for frame, rows_before in _long_chunks(path, shoe_column, card_column, chunk_rows))
+    else:
+        raise ValueError(f"Unknown layout: {layout}")
+
+    for rows, lengths, line in blocks:
+        if len(lengths) == 0:
+            continue
+        recorded = np.arange(rows.shape[1]) < lengths[:, None]
+        shoe = np.nonzero(recorded)[0]
+        per_rank = np.bincount(shoe * NUM_RANKS + rows[recorded], minlength=len(lengths) * NUM_RANKS)
+        broken = (per_rank.reshape(len(lengths), NUM_RANKS) > 4 * number_of_decks).any(axis=1)
+        if broken.any():
+            raise ValueError(f"The shoe on line {line[np.argmax(broken)]} has more cards of a rank than "
+                             f"{number_of_decks} decks")
+        yield {"cards": rows, "lengths": lengths, "line": line}
+
+
+def _numbered(blocks):
+    # (block, number of lines before it).
+    lines = 0
+    for data in blocks:
+        yield data, lines
+        lines += data.count(b"\n")
+
+
+# EVALUATION
+
+
+def deal_recorded(shoes, weights=None, number_of_decks=8, burn=0):
+    # The hands of a block of recorded shoes, with the same arrays as corpus.deal_chunk:
+    #   outcome, key, shoe, start, ncards - as batch_bacc.deal_shoes
+    #   count      - running count of every system (weights from count_weight_matrix) before the hand
+    #   remaining  - cards left in the full shoe before the hand
+    # burn: cards at the start of every recorded shoe that were burned, not dealt.
+    rows, lengths = shoes["cards"], shoes["lengths"]
+    dealt = deal_shoes(rows, cut_cards=4, burn=burn, lengths=lengths)
+    complete = dealt["start"] + dealt["ncards"] <= lengths[dealt["shoe"]]
+    dealt = {name: values[complete] for name, values in dealt.items()}
+    if weights is not None:
+        dealt["count"] = running_counts(rows, dealt["start"], dealt["shoe"], weights, burn)
+        dealt["remaining"] = (52 * number_of_decks - dealt["start"]).astype(np.int16)
+    return dealt
+
+
+def iter_recorded(path, systems=None, number_of_decks=8, burn=0, **read_options):
+    # The hands of a whole log, block by block; "shoe" numbers the shoes of the file from 0.
+    # systems: {name: weights dict} for the counts (default contunt_2.COUNTING_SYSTEMS), or False for none.
+    if systems is None:
+        from contunt_2 import COUNTING_SYSTEMS
+
+        systems = COUNTING_SYSTEMS
+    weights = count_weight_matrix(list(systems.values())) if systems else None
+    shoes_before = 0
+    for shoes in read_shoes(path, number_of_decks=number_of_decks, **read_options):
+        dealt = deal_recorded(shoes, weights, number_of_decks, burn)
+        dealt["shoe"] = dealt["shoe"] + shoes_before
+        shoes_before += len(shoes["lengths"])
+        yield dealt
+
+
+def recorded_ev(path, commission=0.05, **options):
+    # Outcome counts and EV per bet of the log, the same numbers as simulations.py and corpus.corpus_ev.
+    counts = np.zeros(3, dtype=np.int64)
+    shoes = 0
+    for dealt in iter_recorded(path, systems=False, **options):
+        counts += np.bincount(dealt["outcome"], minlength=3)
+        shoes = max(shoes, int(dealt["shoe"].max()) + 1) if len(dealt["shoe"]) else shoes
+    return {**outcome_ev(counts, commission), "shoes": shoes}
+
+
+def recorded_streak_stats(path, max_length=64, **options):
+    # Streak lengths of the log, as corpus.corpus_streak_stats.
+    return streak_stats((dealt["outcome"] for dealt in iter_recorded(path, systems=False, **options)),
+                        max_length)
+
+
+def recorded_bin_table(path, system, method="running", bin_width=5, min_count=-60, max_count=60,
+                       min_decks=1.5, replicates=200, seed=0, **options):
+    # The per-bin Tie table of contunt_2.simulate_running_count / simulate_true_count for the log, with bootstrap
+    # intervals and batch-means standard errors (the shoes of the log are the batches).
+    from contunt_2 import COUNTING_SYSTEMS, BinBootstrap, BinBatchMeans, bin_table
+
+    offset = int(np.floor(min_count / bin_width))
+    size = int(np.ceil(max_count / bin_width)) - offset + 1
+    total = np.zeros(size, dtype=np.int64)
+    tie_total = np.zeros(size, dtype=np.int64)
+    bootstrap = BinBootstrap(replicates, seed=seed) if replicates else None
+    batch_means = BinBatchMeans()
+
+    for dealt in iter_recorded(path, {system: COUNTING_SYSTEMS[system]}, **options):
+        keep, bins = count_bins(dealt["count"][:, 0], dealt["remaining"], method, bin_width, min_count,
+                                max_count, min_decks)
+        ties = dealt["outcome"][keep] == TIE
+        chunk_total = np.bincount(bins - offset, minlength=size)[:size]
+        chunk_ties = np.bincount(bins - offset, weights=ties, minlength=size)[:size].astype(np.int64)
+        total += chunk_total
+        tie_total += chunk_ties
+        if bootstrap is not None:
+            bootstrap.update(chunk_total, chunk_ties, offset)
+        n_shoes = len(np.unique(dealt["shoe"]))
+        batch_means.add_hands(bins, ties, dealt["shoe"][keep], n_shoes)
+
+    return bin_table(total, tie_total, offset, bin_width, bootstrap, batch_means)
+
+
+def compare_with_simulation(path, system, method="running", bin_width=5, min_count=-60, max_count=60,
+                            number_of_decks=8, cut_cards=None, hands=None, seed=0, **options):
+    # The bin table of the log next to one of simulated hands (by default as many as the log has), dealt to the
+    # same penetration (cut_cards: by default the median number of cards the recorded shoes left undealt).
+    # Per bin: hands and
+    # Tie EV of both, and z, the difference of the EVs in standard errors (batch means of both sides).
+    from contunt_2 import COUNTING_SYSTEMS, BinBatchMeans, bin_table
+
+    read_options = {k: v for k, v in options.items() if k not in ("burn", "min_decks")}
+    if cut_cards is None:
+        left = [52 * number_of_decks - s["lengths"]
+                for s in read_shoes(path, number_of_decks=number_of_decks, **read_options)]
+        cut_cards = int(np.median(np.concatenate(left)))
+    real = pd.DataFrame(recorded_bin_table(path, system, method, bin_width, min_count, max_count,
+                                           number_of_decks=number_of_decks, replicates=0, **options))
+
+    weights = count_weight_matrix([COUNTING_SYSTEMS[system]])
+    hands = int(real["hands"].sum()) if hands is None else hands
+    rules = Rules(number_of_decks=number_of_decks, cut_cards=cut_cards, burn=options.get("burn", 0))
+    dealt = deal_chunk(hands, rules, seed, 0, weights)
+    keep, bins = count_bins(dealt["count"][:, 0], dealt["remaining"], method, bin_width, min_count, max_count,
+                            options.get("min_decks", 1.5))
+    ties = dealt["outcome"][keep] == TIE
+    offset = int(bins.min())
+    total = np.bincount(bins - offset)
+    batch_means = BinBatchMeans().add_hands(bins, ties, shoe_numbers(dealt["start"])[keep])
+    simulated = pd.DataFrame(bin_table(total, np.bincount(bins - offset, weights=ties, minlength=len(total)),
+                                       offset, bin_width, batch_means=batch_means))
+
+    columns = ["bin_index", "bin_left", "bin_right", "hands", "ev_tie", "ev_se"]
+    table = real[columns].merge(simulated[columns], on=["bin_index", "bin_left", "bin_right"], how="outer",
+                                suffixes=("_real", "_simulated"))
+    table["z"] = (table["ev_tie_real"] - table["ev_tie_simulated"]) / np.hypot(table["ev_se_real"],
+                                                                                table["ev_se_simulated"])
+    return table
+
+
+def write_shoes(path, shoes, lengths=None):
+    # Writing shoes of ranks (dealt from index 0) in the "line" layout, for example simulated shoes
+    # (batch_bacc.build_shoes) to compare with a log, or a log cleaned up.
+    names = np.array(cards)
+    shoes = np.asarray(shoes)
+    lengths = np.full(len(shoes), shoes.shape[1]) if lengths is None else lengths
+    with open(path, "w") as f:
+        for row, n in zip(shoes, lengths):
+            f.write(" ".join(names[row[:n]]) + "\n")
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        # A demo log: 20000 simulated shoes dealt to a cut card 14 cards from the end.
+        from batch_bacc import build_shoes
+
+        path = "recorded_demo.txt"
+        shoes = build_shoes(20_000, rng=np.random.default_rng(0))
+        write_shoes(path, shoes, np.full(len(shoes), shoes.shape[1] - 14))
+
+    start = time.time()
+    summary = recorded_ev(path)
+    print(f"{summary['hands']:,} hands from {summary['shoes']:,} shoes in {time.time() - start:.2f}s")
+    print(summary)
+    print(compare_with_simulation(path, "Even-Good", "running").to_string(index=False))
@@ -0,0 +1,260 @@
+# Streaks, roads and pattern betting on outcome streams.
+# Everything here works on int-coded outcome arrays (PLAYER=0, BANKER=1, TIE=2, like bacc.generate_outcomes
+# returns) and is computed with whole-array NumPy operations, so it runs in O(n) over millions of hands:
+#   - run-length encoding and streak length distributions,
+#   - the conditional distribution of the next outcome given the last k outcomes,
+#   - the Big Road and the three derived roads (Big Eye Boy, Small Road, Cockroach Pig) that casinos display,
+#   - batched backtests of pattern strategies ("follow the streak", "bet the chop", ...), where a strategy is a
+#     table that says what to bet after every possible pattern of the last k outcomes.
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from bacc import PLAYER, BANKER, TIE, OUTCOMES
+from corpus import run_lengths, streak_stats
+from payouts import outcome_payouts
+
+LETTERS = "PBT"
+NO_BET = -1
+
+
+def as_codes(outcomes):
+    # array('b') and lists of codes both become an int8 array (array('b') without copying).
+    if isinstance(outcomes, np.ndarray):
+        return outcomes
+    try:
+        return np.frombuffer(outcomes, dtype=np.int8)
+    except TypeError:
+        return np.asarray(outcomes, dtype=np.int8)
+
+
+# STREAKS
+
+
+def streak_distribution(outcomes, max_length=30, ignore_ties=False):
+    # Number of runs of every length for each outcome, as a DataFrame with one row per length; the counting
+    # is corpus.streak_stats on a single chunk (runs of max_length or more share the last row).
+    # With ignore_ties, ties are removed first, so a tie doesn't break a Player or Banker streak.
+    outcomes = as_codes(outcomes)
+    if ignore_ties:
+        outcomes = outcomes[outcomes != TIE]
+    stats = streak_stats([outcomes], max_length)
+    table = pd.DataFrame({name: stats[name]["histogram"] for name in OUTCOMES})
+    table.index.name = "length"
+    return table.iloc[1:]
+
+
+def pattern_index(outcomes, k, base=3):
+    # For every position i >= k, the last k outcomes (i-k .. i-1) as one number in the given base, oldest first.
+    outcomes = as_codes(outcomes).astype(np.int64)
+    n = len(outcomes)
+    index = np.zeros(max(n - k, 0), dtype=np.int64)
+    for j in range(k):
+        index = index * base + outcomes[j:n - k + j]
+    return index
+
+
+def pattern_name(index, k, base=3):
+    letters = []
+    for _ in range(k):
+        letters.append(LETTERS[index % base])
+        index //= base
+    return "".join(reversed(letters))
+
+
+def next_outcome_table(outcomes, k=2, ignore_ties=False):
+    # Conditional distribution of the next outcome given the last k outcomes.
+    # With ignore_ties, the patterns are made of the last k Player/Banker outcomes (ties are skipped), which is
+    # how pattern players read the scoreboard; the next outcome can still be a tie.
+    outcomes = as_codes(outcomes)
+    index, following = _history(outcomes, k, ignore_ties)
+    base = 2 if ignore_ties else 3
+    counts = np.bincount(index * 3 + following, minlength=base ** k * 3).reshape(base ** k, 3)
+    hands = counts.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        probabilities = counts / hands[:, None]
+    table = pd.DataFrame({
+        "pattern": [pattern_name(i, k, base) for i in range(base ** k)],
+        "hands": hands,
+        "P(Player)": probabilities[:, PLAYER],
+        "P(Banker)": probabilities[:, BANKER],
+        "P(Tie)": probabilities[:, TIE],
+    })
+    return table
+
+
+def _history(outcomes, k, ignore_ties):
+    # Pattern index of the last k outcomes before every hand that has a full history, and that hand's outcome.
+    if not ignore_ties:
+        return pattern_index(outcomes, k), outcomes[k:].astype(np.int64)
+    decided = np.flatnonzero(outcomes != TIE)
+    # The dummy outcome at the end adds the window after the very last Player/Banker hand.
+    windows = pattern_index(np.r_[outcomes[decided], 0], k, base=2)
+    # Hand i can use the window that ends with the last Player/Banker hand before it.
+    seen = np.searchsorted(decided, np.arange(len(outcomes)))
+    usable = seen >= k
+    return windows[seen[usable] - k], outcomes[usable].astype(np.int64)
+
+
+# ROADS
+
+
+def big_road(outcomes):
+    # The Big Road: Player/Banker outcomes in columns, a new column whenever the winner changes.
+    # Ties are not entries of their own; they are counted on the entry before them (ties before the first
+    # entry are reported separately). Rows are logical, i.e. long streaks are not bent into "dragon tails".
+    # Returns a dict of arrays with one element per entry, plus the length of every column.
+    outcomes = as_codes(outcomes)
+    decided = np.flatnonzero(outcomes != TIE)
+    entries = outcomes[decided]
+    # A column is a run of equal entries.
+    _, column_start, column_lengths = run_lengths(entries)
+    column = np.repeat(np.arange(len(column_start)), column_lengths)
+    row = np.arange(len(entries)) - column_start[column]
+    # Ties after entry j are the hands between entry j and entry j + 1.
+    ties = np.diff(np.r_[decided, len(outcomes)]) - 1
+    return {
+        "outcome": entries,
+        "hand": decided,
+        "column": column,
+        "row": row,
+        "ties": ties,
+        "leading_ties": int(decided[0]) if len(decided) else len(outcomes),
+        "column_lengths": column_lengths,
+    }
+
+
+def derived_road(road, offset):
+    # Colours of a derived road, one per Big Road entry: 1 = red (the road is "regular"), 0 = blue,
+    # -1 = before the road starts. offset is 1 for Big Eye Boy, 2 for Small Road and 3 for Cockroach Pig.
+    # A new column is red when the two columns before it (offset apart) have the same length. Any other entry
+    # is blue exactly when the column `offset` to the left ends one row above it, and red otherwise.
+    # Both compare against columns that are already finished, so the final column lengths are all we need.
+    column = road["column"]
+    row = road["row"]
+    lengths = road["column_lengths"]
+    colour = np.full(len(column), -1, dtype=np.int8)
+
+    first = (row == 0) & (column >= offset + 1)
+    colour[first] = lengths[column[first] - 1] == lengths[column[first] - 1 - offset]
+
+    later = (row > 0) & (column >= offset)
+    colour[later] = lengths[column[later] - offset] != row[later]
+    return colour
+
+
+def derived_roads(outcomes):
+    road = big_road(outcomes)
+    return {name: derived_road(road, offset)
+            for name, offset in (("big_eye_boy", 1), ("small_road", 2), ("cockroach_pig", 3))}
+
+
+# PATTERN STRATEGIES
+# A pattern strategy is a table with one entry per pattern of the last k outcomes: the outcome to bet on
+# (PLAYER, BANKER, TIE) or NO_BET. Rules are written as plain functions of the pattern (a tuple of codes,
+# oldest first) and turned into tables once, so the backtest never runs Python per hand.
+
+
+def pattern_table(rule, k, ignore_ties=True):
+    base = 2 if ignore_ties else 3
+    table = np.full(base ** k, NO_BET, dtype=np.int8)
+    for i, pattern in enumerate(itertools.product(range(base), repeat=k)):
+        bet = rule(pattern)
+        table[i] = NO_BET if bet is None else bet
+    return table
+
+
+def follow_last(pattern):
+    # Bet on whoever won last.
+    return pattern[-1]
+
+
+def chop(pattern):
+    # Bet against whoever won last ("the chop").
+    return BANKER if pattern[-1] == PLAYER else PLAYER
+
+
+def follow_streak(length):
+    # Bet on the streak continuing once it has reached the given length; otherwise sit out.
+    def rule(pattern):
+        last = pattern[-length:]
+        return last[-1] if all(p == last[-1] for p in last) else None
+    return rule
+
+
+def break_streak(length):
+    # Bet against a streak of the given length.
+    def rule(pattern):
+        last = pattern[-length:]
+        if all(p == last[-1] for p in last):
+            return BANKER if last[-1] == PLAYER else PLAYER
+        return None
+    return rule
+
+
+def follow_chop(length):
+    # Bet on an alternating pattern (P B P ...) continuing once it is `length` long.
+    def rule(pattern):
+        last = pattern[-length:]
+        if all(a != b for a, b in zip(last, last[1:])):
+            return BANKER if last[-1] == PLAYER else PLAYER
+        return None
+    return rule
+
+
+PATTERN_STRATEGIES = {
+    "Follow last": follow_last,
+    "Chop": chop,
+    "Follow streak of 3": follow_streak(3),
+    "Break streak of 4": break_streak(4),
+    "Follow chop of 3": follow_chop(3),
+}
+
+
+def backtest_patterns(outcomes, strategies=None, k=4, stake=1.0, commission=0.05, ignore_ties=True,
+                      paths=False):
+    # Flat-stake backtest of many pattern strategies on one outcome stream.
+    # The totals only need to know how often every (pattern, next outcome) pair happened, so they cost one
+    # bincount over the hands plus a tiny matrix product, however many strategies there are.
+    # With paths=True the cumulative profit of every strategy after every hand is returned too,
+    # as a (strategies, hands) array.
+    strategies = PATTERN_STRATEGIES if strategies is None else strategies
+    outcomes = as_codes(outcomes)
+    base = 2 if ignore_ties else 3
+    tables = np.array([pattern_table(rule, k, ignore_ties) for rule in strategies.values()])
+
+    # Payout of a bet (rows P, B, T and "no bet") for each outcome.
+    payout = np.vstack([outcome_payouts(commission, ("Player", "Banker", "Tie")), np.zeros(3)])
+
+    index, following = _history(outcomes, k, ignore_ties)
+    counts = np.bincount(index * 3 + following, minlength=base ** k * 3).reshape(base ** k, 3)
+    per_pattern = payout[tables]  # (strategies, patterns, outcomes)
+    profit = stake * (per_pattern * counts).sum(axis=(1, 2))
+    bets = stake * (counts.sum(axis=1) * (tables != NO_BET)).sum(axis=1)
+
+    summary = pd.DataFrame({
+        "strategy": list(strategies),
+        "hands": len(following),
+        "bets": (bets / stake).astype(np.int64),
+        "profit": profit,
+        "ev_per_bet": np.divide(profit, bets, out=np.zeros_like(profit), where=bets > 0),
+    })
+    if not paths:
+        return summary
+    hand_profit = stake * payout[tables[:, index], following]
+    return summary, np.cumsum(hand_profit, axis=1)
+
+
+if __name__ == "__main__":
+    from bacc import build_shoe, generate_outcomes
+
+    outcomes = generate_outcomes(1_000_000, build_shoe())
+    print(streak_distribution(outcomes, max_length=12, ignore_ties=True))
+    print(next_outcome_table(outcomes, k=3, ignore_ties=True).to_string(index=False))
+    roads = derived_roads(outcomes)
+    for name, colour in roads.items():
+        shown = colour[colour >= 0]
+        print(f"{name}: {shown.mean() * 100:.1f}% red")
+    print(backtest_patterns(outcomes).to_string(index=False))
@@ -0,0 +1,199 @@
+# Table rules as data.
+# The rules used to be spread over the code: play_bacc rebuilds 8 decks when fewer than 6 cards are left,
+# contunt_2.py reshuffles at 52 cards and settle_bet charges a 5% commission. Here a Rules tuple describes a
+# table (decks, where the cut card goes, burned cards, commission variant) and compile_rules turns it once into
+# everything the engines need: the Banker drawing table, the reshuffle threshold and the settlement matrix.
+# compile_rules is cached, so every engine (and every cell of a sweep) with the same rules shares the same
+# compiled tables, and the per-hand code only ever looks values up in them.
+#
+# Variants:
+#   "standard"      - Banker pays 1 - commission
+#   "no_commission" - Banker pays even money, except a win with 6 pays half (payouts "Banker No Commission")
+#   "ez"            - EZ Baccarat: Banker pays even money, a three card 7 Banker win pushes (Dragon 7);
+#                     the Dragon 7 and Panda 8 side bets are offered
+
+import math
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+import bacc
+from bacc import PLAYER, BANKER, TIE, OUTCOME_CODES
+from payouts import build_payout_matrix, outcome_payouts, settle_totals
+import batch_bacc
+import counted_shoe
+from dealer import Dealer
+from shuffles import get_shuffle
+
+VARIANTS = ("standard", "no_commission", "ez")
+
+# The Banker bet of each variant, as a row of payouts.build_payout_matrix.
+BANKER_ROW = {"standard": "Banker", "no_commission": "Banker No Commission", "ez": "EZ Banker"}
+
+SIDE_BETS = {
+    "standard": ["Player Pair", "Banker Pair", "Player Dragon", "Banker Dragon"],
+    "no_commission": ["Player Pair", "Banker Pair", "Player Dragon", "Banker Dragon"],
+    "ez": ["Dragon 7", "Panda 8"],
+}
+
+# penetration: share of the shoe dealt before the cut card (for example 0.75); None means the shoe is played
+# down to cut_cards cards. burn: cards burned face down after every shuffle.
+# shuffle: how the shoe is shuffled, a spec from shuffles.py ("uniform", "riffle:3+strip+cut", "csm", ...).
+Rules = namedtuple("Rules", ["number_of_decks", "penetration", "cut_cards", "burn", "commission", "variant",
+                             "shuffle"],
+                   defaults=[8, None, 6, 0, 0.05, "standard", "uniform"])
+
+STANDARD = Rules()
+# The rules contunt_2.py has always used for its counting simulations.
+COUNTING = Rules(cut_cards=52)
+EZ = Rules(variant="ez", commission=0.0)
+
+
+class CompiledRules:
+
+    def __init__(self, rules):
+        if rules.variant not in VARIANTS:
+            raise ValueError(f"Unknown rule variant: {rules.variant}")
+        self.rules = rules
+        self.shoe_size = 52 * rules.number_of_decks
+
+        # A new shoe is used when fewer than reshuffle_at cards are left. A hand can need 6 cards, so never less.
+        reshuffle_at = rules.cut_cards
+        if rules.penetration is not None:
+            reshuffle_at = max(reshuffle_at, int(round(self.shoe_size * (1 - rules.penetration))))
+        self.reshuffle_at = max(reshuffle_at, 6)
+        self.burn = rules.burn
+        self.shuffle = get_shuffle(rules.shuffle)
+        # A continuous shuffling machine never reaches a cut card; these are the hands a shoe would have given.
+        self.hands_per_shoe = max(1, round((self.shoe_size - self.reshuffle_at - self.burn) / 4.94))
+
+        # The drawing rules don't change between variants, so all compiled rules share the same tables.
+        self.banker_draws = batch_bacc.BANKER_DRAWS
+        self.banker_draws_rows = counted_shoe.BANKER_DRAWS
+
+        self.bet_types = ["Player", "Banker", "Tie"] + SIDE_BETS[rules.variant]
+        self.payout_matrix = _payout_matrix(rules.commission, rules.variant, tuple(self.bet_types))
+        self.bet_index = {bet: i for i, bet in enumerate(self.bet_types)}
+
+    def payout_row(self, bet_type):
+        return self.payout_matrix[self.bet_index[bet_type]]
+
+    def payout_lookup(self, bet_type):
+        # Payout per outcome, like strategies.payout_lookup, for bets that only depend on who won.
+        # The EZ Banker bet also depends on the cards (Dragon 7), so it has to be settled from hand keys.
+        if self.rules.variant == "ez" and bet_type == "Banker":
+            raise ValueError("The EZ Banker bet depends on the cards; settle it with settle_keys")
+        row = _outcome_payouts(self.rules.commission, self.rules.variant, bet_type)
+        payouts = {PLAYER: row[PLAYER], BANKER: row[BANKER], TIE: row[TIE]}
+        for name, code in OUTCOME_CODES.items():
+            payouts[name] = payouts[code]
+        return payouts
+
+    def settle_keys(self, keys, stakes=1.0):
+        # Total profit of every bet type of this table over the given hand keys (see payouts.settle_totals).
+        return settle_totals(keys, stakes, self.payout_matrix)
+
+    def ev(self, keys):
+        keys = np.asarray(keys)
+        return dict(zip(self.bet_types, self.settle_keys(keys) / len(keys)))
+
+    def __repr__(self):
+        return f"CompiledRules({self.rules})"
+
+
+@lru_cache(maxsize=None)
+def compile_rules(rules=STANDARD):
+    return CompiledRules(rules)
+
+
+# Settlement rows only depend on the commission and the variant, so rule sets that differ only in the shoe
+# (decks, penetration, burn) share them too.
+@lru_cache(maxsize=None)
+def _payout_matrix(commission, variant, bet_types):
+    names = [BANKER_ROW[variant] if bet == "Banker" else bet for bet in bet_types]
+    matrix = build_payout_matrix(commission, names)
+    matrix.setflags(write=False)
+    return matrix
+
+
+@lru_cache(maxsize=None)
+def _outcome_payouts(commission, variant, bet_type):
+    name = BANKER_ROW[variant] if bet_type == "Banker" else bet_type
+    return tuple(float(p) for p in outcome_payouts(commission, [name])[0])
+
+
+# DEALING UNDER GIVEN RULES
+
+
+def deal_batch(n_shoes, rules=STANDARD, rng=None):
+    # Dealing n_shoes full shoes with the vectorized engine; returns the same dict as batch_bacc.deal_shoes.
+    # With a continuous shuffling machine every "shoe" is a machine dealing hands_per_shoe hands.
+    compiled = compile_rules(rules)
+    if compiled.shuffle.continuous:
+        return compiled.shuffle.deal(n_shoes, compiled.hands_per_shoe, rules.number_of_decks, rng)
+    shoes = batch_bacc.build_shoes(n_shoes, rules.number_of_decks, rng, compiled.shuffle)
+    return batch_bacc.deal_shoes(shoes, compiled.reshuffle_at, compiled.burn)
+
+
+def deal_outcome_block(rules, rows, hands, rng):
+    # (rows, hands) outcome codes dealt shoe after shoe with the vectorized engine. The number of shoes is
+    # estimated from the cards left before the cut card (about 5 per hand) and topped up until there are enough.
+    compiled = compile_rules(rules)
+    needed = rows * hands
+    hands_per_shoe = max(1, (compiled.shoe_size - compiled.reshuffle_at - compiled.burn) / 5)
+    parts = []
+    dealt = 0
+    while dealt < needed:
+        outcome = deal_batch(math.ceil((needed - dealt) / hands_per_shoe) + 1, rules, rng)["outcome"]
+        parts.append(outcome)
+        dealt += len(outcome)
+    return np.concatenate(parts)[:needed].reshape(rows, hands)
+
+
+def generate_outcomes(hands_number, rules=STANDARD, shoe=None, rng=None):
+    # bacc.generate_outcomes (the reference engine) under the given rules. rng: a random.Random to shuffle
+    # with instead of the random module, for example one per thread (threads.py).
+    compiled = compile_rules(rules)
+    if compiled.shuffle.continuous:
+        return compiled.shuffle.generate_outcomes(hands_number, rules.number_of_decks, rng)
+    shuffle = compiled.shuffle if rng is None else compiled.shuffle.bind(rng)
+    return bacc.generate_outcomes(hands_number, shoe, rules.number_of_decks, compiled.reshuffle_at, compiled.burn,
+                                  shuffle)
+
+
+def rules_dealer(rules=STANDARD, count_weights=None, shuffle=None, rng=None):
+    # A dealer.Dealer with a shoe and reshuffle rule following the given rules. shuffle (a function shuffling
+    # a list in place) overrides the shuffle of the rules. rng: a random.Random that the shuffles and a
+    # continuous shuffler's returned cards are drawn from, instead of the random module (threads.py).
+    compiled = compile_rules(rules)
+    rules_shuffle = shuffle is None
+    if rules_shuffle:
+        shuffle = compiled.shuffle if rng is None else compiled.shuffle.bind(rng)
+    shoe = counted_shoe.CountedShoe(rules.number_of_decks, count_weights, shuffle=shuffle, rng=rng)
+    dealer = Dealer(shoe, cut_cards=compiled.reshuffle_at, burn=compiled.burn)
+    if compiled.shuffle.continuous and rules_shuffle:
+        dealer.add_observer(compiled.shuffle)
+    return dealer
+
+
+def house_edges(rules_list, n_shoes=2000, seed=0):
+    # EV per hand of every bet under each rule set, all dealt from the same random stream.
+    # Returns a list of dicts, one per rule set.
+    results = []
+    for rules in rules_list:
+        compiled = compile_rules(rules)
+        dealt = deal_batch(n_shoes, rules, np.random.default_rng(seed))
+        row = {"rules": rules, "hands": len(dealt["key"])}
+        row.update(compiled.ev(dealt["key"]))
+        results.append(row)
+    return results
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    variants = [STANDARD, Rules(commission=0.04), Rules(variant="no_commission"), EZ,
+                Rules(number_of_decks=6, penetration=0.75, burn=1), COUNTING]
+    table = pd.DataFrame(house_edges(variants))
+    print(table.to_string())
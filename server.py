@@ -0,0 +1,331 @@
+"""
+Local simulation job server.
+
+Every notebook kernel or script that runs a simulation normally starts from a cold
+Python process and re-simulates configurations that were already computed a minute ago.
+This server keeps one warm process pool alive and remembers the result for every
+parameter set it has already seen, so several kernels and CLI calls can share it.
+
+Start it with:
+    python server.py --port 8765 --workers 4
+
+and submit jobs from anywhere with:
+    from server import submit_job
+    submit_job("ev", hands=100000, seed=42)
+
+Only the standard library is used for the HTTP part.
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from bacc import build_shoe, generate_outcomes
+from cache import MISSING, cache_key, default_cache, module_dependencies
+from survival import RuinSurvival
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+# JOBS
+# Each job is a plain top-level function, so that it can be sent to a worker process.
+# The default parameters are merged into every request before we compute the cache key,
+# so {"hands": 10000} and {} are recognised as the same job when 10000 is the default.
+
+
+def run_ev_job(hands=10000, number_of_decks=8, seed=42):
+    # Same estimate as simulations.py, just without the plots and CSV files.
+    random.seed(seed)
+    outcomes = generate_outcomes(hands, build_shoe(number_of_decks))
+    player_win, banker_win, tie = (int(c) for c in np.bincount(np.frombuffer(outcomes, dtype=np.int8), minlength=3))
+
+    return {
+        "hands": hands,
+        "player_win": player_win,
+        "banker_win": banker_win,
+        "tie": tie,
+        "player_ev": (player_win - banker_win) / hands,
+        "banker_ev": (banker_win * 0.95 - player_win) / hands,
+        "tie_ev": (tie * 8 - (hands - tie)) / hands,
+        "banker_no_commission_ev": (banker_win - player_win) / hands,
+    }
+
+
+def run_ruin_job(strategy="Flat", bet_type="Banker", hands=10000, num_simulations=10,
+                 initial_bankroll=100, base_bet=1, seed=42):
+    # Same study as time_to_ruin.py for a single strategy.
+    from strategies import strategies, ruin_time
+
+    random.seed(seed)
+    fn = strategies[strategy]
+    ruin_times = []
+    final_bankrolls = []
+    survival = RuinSurvival(hands)
+    for _ in range(num_simulations):
+        shoe = build_shoe()
+        outcomes = generate_outcomes(hands, shoe)
+        path = fn(outcomes, initial_bankroll, base_bet, bet_type)
+        final_bankrolls.append(path[-1])
+        t = ruin_time(path)
+        if t is not None:
+            ruin_times.append(t)
+        survival.add([t], hands)
+
+    return {
+        "strategy": strategy,
+        "ruin_times": ruin_times,
+        "final_bankrolls": final_bankrolls,
+        "average_ruin_time": (sum(ruin_times) / len(ruin_times)) if ruin_times else None,
+        "survival": survival.summary(),
+    }
+
+
+def run_counting_job(system="Even-Good", method="true", hands=100000, number_of_decks=8,
+                     bin_width=None, seed=42):
+    # Same binning as contunt_2.compare_methods for a single system and method.
+    from contunt_2 import COUNTING_SYSTEMS, simulate_true_count, simulate_running_count
+
+    random.seed(seed)
+    weights = COUNTING_SYSTEMS[system]
+    if method == "true":
+        return simulate_true_count(num_hands=hands, number_of_decks=number_of_decks,
+                                   count_weights=weights, bin_width=bin_width or 1.0,
+                                   min_true=-10, max_true=10, seed=seed)
+    if method == "running":
+        return simulate_running_count(num_hands=hands, number_of_decks=number_of_decks,
+                                      count_weights=weights, bin_width=bin_width or 5,
+                                      min_count=-60, max_count=60, seed=seed)
+    raise ValueError(f"Unknown counting method: {method}")
+
+
+# Modules whose code determines the job results (this file and everything it imports, also inside the jobs);
+# editing any of them invalidates the on-disk cache.
+JOB_MODULES = module_dependencies("server.py")
+
+JOBS = {
+    "ev": run_ev_job,
+    "ruin": run_ruin_job,
+    "counting": run_counting_job,
+}
+
+
+class BadRequest(ValueError):
+    # A request the server refuses before running anything (answered with 400). Errors raised by a job
+    # itself are the server's problem and are answered with 500.
+    pass
+
+
+def job_key(kind, params):
+    # Checking the request and merging the defaults, which makes equivalent requests share one cache entry.
+    if not isinstance(kind, str) or kind not in JOBS:
+        raise BadRequest(f"Unknown job kind: {kind}")
+    if not isinstance(params, dict):
+        raise BadRequest("params must be an object")
+    fn = JOBS[kind]
+    names = fn.__code__.co_varnames[:fn.__code__.co_argcount]
+    unknown = set(params) - set(names)
+    if unknown:
+        raise BadRequest(f"Unknown parameters for {kind}: {sorted(unknown)}")
+    defaults = dict(zip(names[len(names) - len(fn.__defaults__):], fn.__defaults__))
+    for name, value in params.items():
+        # Every value has to have the type of its default (an int is fine where a float is expected).
+        default = defaults[name]
+        if default is None:
+            expected = (int, float, str, type(None))
+        elif isinstance(default, float):
+            expected = (int, float)
+        else:
+            expected = type(default)
+        if isinstance(value, bool) != isinstance(default, bool) or not isinstance(value, expected):
+            raise BadRequest(f"Parameter {name} of {kind} must be like {default!r}, got {value!r}")
+    full = dict(defaults)
+    full.update(params)
+    return json.dumps([kind, full], sort_keys=True), full
+
+
+def json_safe(value):
+    # Empty bins give NaN (and some estimates inf), which json.dumps would write as bare NaN / Infinity,
+    # not valid JSON. They are sent as null.
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(v) for v in value]
+    if isinstance(value, np.generic):
+        return json_safe(value.item())
+    return value
+
+
+# SERVER
+
+
+class JobServer:
+    """Warm process pool plus a result cache shared by all clients."""
+
+    def __init__(self, workers=None, max_results=256):
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        # Finished results by job key, the most recently used last. Only the newest max_results are kept in
+        # memory; older ones are still found in the on-disk cache.
+        self.results = OrderedDict()
+        self.max_results = max_results
+        self.running = {}  # futures for jobs that are being computed right now
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def run(self, kind, params):
+        key, full = job_key(kind, params)
+        with self.lock:
+            if key in self.results:
+                self.hits += 1
+                self.results.move_to_end(key)
+                return self.results[key], True
+            # If another client asked for the same job a moment ago, we just wait for it.
+            future = self.running.get(key)
+            if future is None:
+                future = Future()
+                self.running[key] = future
+                owner = True
+            else:
+                owner = False
+                self.hits += 1
+        if not owner:
+            # Computed for another client, so for this one it is a cached result too.
+            return future.result(), True
+
+        # The disk cache and the job itself run outside the lock, so other jobs are not held up by them.
+        # Whatever happens, the key leaves self.running, so a retry after a failed job starts it again.
+        try:
+            # Results of earlier server sessions live in the on-disk cache (keyed by the code version too).
+            disk_key = cache_key(kind, full, JOB_MODULES)
+            result = default_cache.get(disk_key)
+            cached = result is not MISSING
+            if not cached:
+                result = self.pool.submit(JOBS[kind], **full).result()
+                default_cache.put(disk_key, result)
+            with self.lock:
+                if cached:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                self.results[key] = result
+                while len(self.results) > self.max_results:
+                    self.results.popitem(last=False)
+            future.set_result(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.running.pop(key, None)
+        return result, cached
+
+    def status(self):
+        with self.lock:
+            return {
+                "cached": len(self.results),
+                "running": len(self.running),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def make_handler(job_server):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def send_json(self, code, payload):
+            body = json.dumps(json_safe(payload), allow_nan=False).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self.send_json(200, job_server.status())
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/jobs":
+                self.send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(request, dict) or "kind" not in request:
+                    raise BadRequest("The request needs a job kind")
+                kind, params = request["kind"], request.get("params", {})
+                job_key(kind, params)
+            except ValueError as e:
+                # Malformed JSON, a bad Content-Length or a BadRequest from job_key.
+                self.send_json(400, {"error": str(e)})
+                return
+            try:
+                result, cached = job_server.run(kind, params)
+            except Exception as e:
+                # A job that crashed (e.g. hands=0) still gets a JSON answer instead of a dropped connection.
+                self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+            self.send_json(200, {"result": result, "cached": cached})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None):
+    job_server = JobServer(workers=workers)
+    httpd = ThreadingHTTPServer((host, port), make_handler(job_server))
+    print(f"Simulation server listening on http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        job_server.shutdown()
+
+
+# CLIENT
+
+
+def submit_job(kind, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None, **params):
+    request = urllib.request.Request(
+        f"http://{host}:{port}/jobs",
+        data=json.dumps({"kind": kind, "params": params}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())["result"]
+
+
+def server_status(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    with urllib.request.urlopen(f"http://{host}:{port}/status") as response:
+        return json.loads(response.read())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Baccarat simulation job server")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
@@ -0,0 +1,230 @@
+# Shuffle models.
+# build_shoe uses random.shuffle, a perfectly uniform shuffle. Real tables use hand shuffles (a few riffles,
+# a strip, a cut) or continuous shuffling machines. A shuffle model here is a sequence of steps; every step is
+# a vectorized function on a batch of shoes (rows of cards, index 0 on top), so shuffling 10000 shoes with a
+# few riffles costs about as much as shuffling them uniformly:
+#   riffle  - Gilbert–Shannon–Reeds riffle: the shoe is cut Binomial(n, 1/2) and the two packets are dropped
+#             together card by card. Every one of the 2^n left/right sequences is equally likely, so a riffle
+#             is n independent coin flips per shoe.
+#   strip   - the dealer pulls packets (geometric size, `packet` cards on average) off the top and drops them
+#             on a pile, which reverses the order of the packets.
+#   cut     - the shoe is cut somewhere between `spread` and 1 - `spread` of the way down.
+#   uniform - a perfect shuffle.
+# Models are given as spec strings like "riffle:3+strip+riffle+cut" (steps joined with "+", an optional
+# argument after ":"), so they can go into Rules (see rules.py), sweep cells and cache keys.
+#
+# A shoe is shuffled starting from new decks (the order build_shoe puts the cards in before shuffling), as at
+# tables that open every shoe with new cards. Reused cards start from the discards of the previous shoe, which
+# are already in random order, so there a weak shuffle only matters to a player who tracked the previous shoe.
+#
+# "csm" is a continuous shuffling machine: there is no shoe end; after every hand the cards go back into the
+# machine at random places, at least `buffer` cards below the next card to be dealt.
+
+import random
+from array import array
+from functools import lru_cache
+
+import numpy as np
+
+import bacc
+from bacc import build_shoe, deal_bacc, decide_outcome_code, hand_value
+
+
+# STEPS
+# Each step takes a (shoes, cards) array and a NumPy Generator and returns the shuffled array.
+
+
+def uniform(rows, rng):
+    return rng.permuted(rows, axis=1)
+
+
+def riffle(rows, rng, passes=1):
+    n_shoes, n = rows.shape
+    positions = np.arange(n_shoes)[:, None]
+    for _ in range(int(passes)):
+        right = rng.random((n_shoes, n)) < 0.5
+        left = ~right
+        cut = left.sum(axis=1, keepdims=True)
+        # Position j takes the next card of the left packet (the top `cut` cards) or of the right one.
+        source = np.where(right, cut + np.cumsum(right, axis=1) - 1, np.cumsum(left, axis=1) - 1)
+        rows = rows[positions, source]
+    return rows
+
+
+def strip(rows, rng, packet=6):
+    n_shoes, n = rows.shape
+    starts = rng.random((n_shoes, n)) < 1 / float(packet)
+    starts[:, 0] = True
+    packet_index = np.cumsum(starts, axis=1)
+    # The packet pulled first ends up at the bottom; cards keep their order inside a packet.
+    key = (packet_index[:, -1:] - packet_index) * n + np.arange(n)
+    return np.take_along_axis(rows, np.argsort(key, axis=1), axis=1)
+
+
+def cut(rows, rng, spread=0.25):
+    n_shoes, n = rows.shape
+    at = rng.integers(int(spread * n), int((1 - spread) * n) + 1, size=(n_shoes, 1))
+    return np.take_along_axis(rows, (np.arange(n) + at) % n, axis=1)
+
+
+STEPS = {"uniform": uniform, "riffle": riffle, "strip": strip, "cut": cut}
+
+# A few common hand shuffles, usable by name.
+PRESETS = {
+    "hand": "riffle:2+strip+riffle:2+cut",
+    "quick": "riffle+cut",
+    "thorough": "riffle:4+strip+riffle:4+strip+riffle:2+cut",
+}
+
+
+class ShuffleModel:
+
+    continuous = False
+
+    def __init__(self, steps, spec):
+        self.steps = steps  # list of (step function, argument or None)
+        self.spec = spec
+
+    def rows(self, rows, rng):
+        for step, argument in self.steps:
+            rows = step(rows, rng) if argument is None else step(rows, rng, argument)
+        return rows
+
+    def build_shoes(self, n_shoes, number_of_decks=8, rng=None):
+        # Like batch_bacc.build_shoes: n_shoes shoes of ranks, shuffled with this model from new decks.
+        from batch_bacc import NUM_RANKS
+
+        rng = np.random.default_rng() if rng is None else rng
+        ordered = np.tile(np.repeat(np.arange(NUM_RANKS, dtype=np.int8), 4), number_of_decks)
+        return self.rows(np.broadcast_to(ordered, (n_shoes, len(ordered))), rng)
+
+    def __call__(self, cards, rng=None):
+        # Shuffling a list shoe in place (bacc.build_shoe, CountedShoe). Lists are dealt from the end, so the
+        # list is turned around for the steps, which deal from index 0. The random numbers come from the
+        # random module, so random.seed makes list shoes reproducible like before, or from rng, a
+        # random.Random of its own (see bind).
+        rng = random if rng is None else rng
+        if self.spec == "uniform":
+            rng.shuffle(cards)
+            return
+        rng = np.random.default_rng(rng.getrandbits(64))
+        top_first = np.arange(len(cards))[::-1]
+        order = self.rows(top_first[None, :], rng)[0][::-1]
+        cards[:] = [cards[i] for i in order]
+
+    def bind(self, rng):
+        # A shuffle for list shoes that draws from rng instead of the random module's shared state, so shoes
+        # on different threads don't share a random stream (threads.py).
+        return lambda cards: self(cards, rng)
+
+    def __repr__(self):
+        return f"ShuffleModel({self.spec!r})"
+
+
+# CONTINUOUS SHUFFLING MACHINE
+
+
+class CSM:
+
+    continuous = True
+
+    def __init__(self, buffer=10):
+        self.buffer = int(buffer)
+        self.spec = f"csm:{self.buffer}"
+
+    def __call__(self, cards, rng=None):
+        # The machine is filled with (uniformly) shuffled cards.
+        (random if rng is None else rng).shuffle(cards)
+
+    def bind(self, rng):
+        return lambda cards: self(cards, rng)
+
+    def build_shoes(self, n_shoes, number_of_decks=8, rng=None):
+        from batch_bacc import build_shoes
+
+        return build_shoes(n_shoes, number_of_decks, rng)
+
+    def on_hand_complete(self, outcome, player, banker, shoe):
+        # As a dealer.Dealer observer: the cards of the hand go straight back into the CountedShoe.
+        shoe.return_cards(len(player) + len(banker), self.buffer)
+
+    def deal(self, n_tables, hands_per_table, number_of_decks=8, rng=None):
+        # The vectorized engine for a CSM: hands_per_table hands at every one of n_tables machines, with the
+        # same result dict as batch_bacc.deal_shoes ("shoe" is the table, "start" is always 0).
+        from batch_bacc import deal_shoes
+
+        rng = np.random.default_rng() if rng is None else rng
+        machines = self.build_shoes(n_tables, number_of_decks, rng)
+        n = machines.shape[1]
+        names = ("outcome", "key", "ncards")
+        dealt = {name: [] for name in names}
+        for _ in range(hands_per_table):
+            # Nine cards with the cut at six make deal_shoes deal exactly one hand per machine.
+            hand = deal_shoes(machines[:, :9], cut_cards=6)
+            for name in names:
+                dealt[name].append(hand[name])
+            # The used cards get a random slot between the buffer and the bottom, the others keep their order.
+            used = hand["ncards"].astype(np.int64)[:, None]
+            position = np.arange(n) - used
+            slot = rng.integers(self.buffer, n - used + 1, size=(n_tables, n)) - 0.5 + rng.random((n_tables, n)) / 2
+            key = np.where(position < 0, slot, position)
+            machines = np.take_along_axis(machines, np.argsort(key, axis=1), axis=1)
+        result = {name: np.stack(dealt[name], axis=1).ravel() for name in names}
+        result["shoe"] = np.repeat(np.arange(n_tables, dtype=np.int32), hands_per_table)
+        result["start"] = np.zeros(n_tables * hands_per_table, dtype=np.int16)
+        return result
+
+    def generate_outcomes(self, hands_number, number_of_decks=8, rng=None):
+        # The reference list engine (bacc.deal_bacc) at a CSM: after every hand its cards are put back.
+        # rng: a random.Random to use instead of the random module.
+        rng = random if rng is None else rng
+        shoe = build_shoe(number_of_decks, self.bind(rng))
+        outcomes = array('b', bytes(hands_number))
+        for i in range(hands_number):
+            player, banker = deal_bacc(shoe, number_of_decks)
+            outcomes[i] = decide_outcome_code(hand_value(player), hand_value(banker))
+            for card in player + banker:
+                # The top of a list shoe is its end; buffer cards stay above the returned card.
+                shoe.insert(rng.randint(0, max(0, len(shoe) - self.buffer)), card)
+        return outcomes
+
+    def __repr__(self):
+        return f"CSM(buffer={self.buffer})"
+
+
+@lru_cache(maxsize=None)
+def _parse(spec):
+    spec = PRESETS.get(spec, spec)
+    steps = []
+    for token in spec.split("+"):
+        name, _, argument = token.strip().partition(":")
+        if name == "csm":
+            if len(spec.split("+")) > 1:
+                raise ValueError("A continuous shuffling machine can't be combined with other steps")
+            return CSM(argument or 10)
+        if name not in STEPS:
+            raise ValueError(f"Unknown shuffle step: {name}")
+        steps.append((STEPS[name], float(argument) if argument else None))
+    return ShuffleModel(steps, spec)
+
+
+def get_shuffle(shuffle=None):
+    # A shuffle model from a spec string (or None for the uniform shuffle); models are passed through.
+    if shuffle is None:
+        return UNIFORM
+    if isinstance(shuffle, str):
+        return _parse(shuffle)
+    return shuffle
+
+
+UNIFORM = _parse("uniform")
+
+
+def generate_outcomes(hands_number, shuffle=None, number_of_decks=8, cut_cards=6, burn=0):
+    # bacc.generate_outcomes (the reference engine) with a shuffle model; a CSM deals without a shoe end.
+    model = get_shuffle(shuffle)
+    if model.continuous:
+        return model.generate_outcomes(hands_number, number_of_decks)
+    shuffle = None if model is UNIFORM else model
+    return bacc.generate_outcomes(hands_number, build_shoe(number_of_decks, shuffle), number_of_decks,
+                                  cut_cards, burn, shuffle)
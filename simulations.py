@@ -1,52 +1,108 @@
-from bacc import build_shoe, play_bacc
+from bacc import build_shoe, generate_outcomes, PLAYER, BANKER, TIE
+import numpy as np
 import matplotlib.pyplot as plt
+from plotting import plot_paths, linear_checkpoints, log_checkpoints
 import pandas as pd
+import os
+from cache import cached_call, module_dependencies
+from batch_means import batch_means
 
 # We repeated the simulation multiple times and the estimates were stable within about 0.1 percentage point, so we use random.seed for the sake of reproducibility of our results.
 import random
-random.seed(42)
+seed = 42
 
 # We simulate the game of Baccarat and compute the share of wins for each hand.
 # From that, we calculate the house edge for each hand.
 
-shoe = build_shoe()
+number_of_decks = 8
 
 hands_number = 10000
 
-banker_win = 0
-player_win = 0
-tie = 0
-
-banker_share = 0
-player_share = 0
-tie_share = 0
-
-checkpoints = []
-banker_ev_history = []
-player_ev_history = []
-tie_ev_history = []
-
 step = 100
-
-for i in range(1, hands_number + 1):
-    result = play_bacc(shoe)
-    if result == "Player":
-        player_win += 1
-    elif result == "Banker":
-        banker_win += 1
+# Checkpoints for the EV convergence plot: every `step` hands ("linear") or log-spaced ("log"), which keeps
+# the number of checkpoints small for very long runs while still showing the early hands in detail.
+checkpoint_spacing = "linear"
+
+# Hands of the same shoe are correlated, so the standard errors of the EVs come from batch means (see
+# batch_means.py): the hands are cut into batches of batch_size hands, several shoes each.
+batch_size = 500
+# Stopping rule: with a target standard error, hands are dealt in rounds of hands_number until the batch-means
+# standard error of every EV is below target_se (but at most max_hands). None deals hands_number hands once.
+target_se = None
+max_hands = 10_000_000
+
+# Profit of a 1 unit bet for every outcome code (Player, Banker, Tie).
+BET_PAYOFFS = {
+    "Player": [1, -1, 0],
+    "Banker": [-1, 0.95, 0],
+    "Tie": [-1, -1, 8],
+    "Banker no commission": [-1, 1, 0],
+}
+
+
+def ev_standard_errors(outcomes, batch_size):
+    return {bet: batch_means(np.asarray(payoffs)[outcomes], batch_size) for bet, payoffs in BET_PAYOFFS.items()}
+
+
+def simulate_outcome_counts(hands_number, number_of_decks, seed, step, checkpoint_spacing, batch_size=500,
+                            target_se=None, max_hands=10_000_000):
+    random.seed(seed)
+    shoe = build_shoe(number_of_decks)
+
+    # We store the outcomes as one-byte codes (see bacc.py) and count them with bincount instead of comparing strings.
+    # More rounds are dealt from the same shoe (and random stream) until the stopping rule is met.
+    rounds = [np.frombuffer(generate_outcomes(hands_number, shoe), dtype=np.int8)]
+    while target_se is not None and (len(rounds) + 1) * hands_number <= max_hands:
+        errors = ev_standard_errors(np.concatenate(rounds), batch_size)
+        if all(e["se"] <= target_se for e in errors.values()):
+            break
+        rounds.append(np.frombuffer(generate_outcomes(hands_number, shoe), dtype=np.int8))
+    outcomes = np.concatenate(rounds)
+    hands_number = len(outcomes)
+    player_win, banker_win, tie = (int(c) for c in np.bincount(outcomes, minlength=3))
+
+    # EV checkpoints: cumulative number of each outcome at each checkpoint.
+    if checkpoint_spacing == "log":
+        checkpoints = log_checkpoints(hands_number, num=200)
     else:
-        tie += 1
-    
-    if i % step == 0:
-        # EV calculations
-        banker_ev = (player_win * (-1) + banker_win * 0.95) / i
-        player_ev = (player_win * 1 + banker_win * (-1)) / i
-        tie_ev    = (tie * 8 + (i - tie) * (-1)) / i
-
-        checkpoints.append(i)
-        banker_ev_history.append(banker_ev)
-        player_ev_history.append(player_ev)
-        tie_ev_history.append(tie_ev)
+        checkpoints = linear_checkpoints(hands_number, step)
+    player_cum = np.cumsum(outcomes == PLAYER)[checkpoints - 1]
+    banker_cum = np.cumsum(outcomes == BANKER)[checkpoints - 1]
+    tie_cum = np.cumsum(outcomes == TIE)[checkpoints - 1]
+
+    return {
+        "hands": hands_number,
+        "player_win": player_win,
+        "banker_win": banker_win,
+        "tie": tie,
+        "standard_errors": ev_standard_errors(outcomes, batch_size),
+        "checkpoints": checkpoints,
+        "banker_ev_history": (player_cum * (-1) + banker_cum * 0.95) / checkpoints,
+        "player_ev_history": (player_cum * 1 + banker_cum * (-1)) / checkpoints,
+        "tie_ev_history": (tie_cum * 8 + (checkpoints - tie_cum) * (-1)) / checkpoints,
+    }
+
+# The result is cached on disk (see cache.py) under the parameters above and the code of this file and every
+# module it imports, so rerunning the script (or importing it from the notebook) doesn't simulate again when
+# nothing changed.
+simulation, from_cache = cached_call(
+    "simulations",
+    simulate_outcome_counts,
+    {"hands_number": hands_number, "number_of_decks": number_of_decks, "seed": seed,
+     "step": step, "checkpoint_spacing": checkpoint_spacing, "batch_size": batch_size,
+     "target_se": target_se, "max_hands": max_hands},
+    modules=module_dependencies("simulations.py"),
+)
+# With a stopping rule the number of hands dealt is only known afterwards.
+hands_number = simulation["hands"]
+standard_errors = simulation["standard_errors"]
+player_win = simulation["player_win"]
+banker_win = simulation["banker_win"]
+tie = simulation["tie"]
+checkpoints = simulation["checkpoints"]
+banker_ev_history = simulation["banker_ev_history"]
+player_ev_history = simulation["player_ev_history"]
+tie_ev_history = simulation["tie_ev_history"]
 
 # We calculate the share of wins for each bet.
 banker_share = banker_win / hands_number
@@ -83,56 +139,67 @@ print("Player bet:",  player_house_edge * 100, "%")
 print("Banker bet:",  banker_house_edge * 100, "%")
 print("Tie bet:   ",  tie_house_edge * 100, "%")
 print("Banker no commision bet:",  banker_no_commision_house_edge * 100, "%")
+print()
+print(f"Standard errors (batch means, {hands_number:,} hands):")
+for bet, e in standard_errors.items():
+    print(f"{bet}: EV {e['mean']:.5f} +- {e['se']:.5f} (independent hands would give {e['se_iid']:.5f}; "
+          f"effective hands {e['ess']:,.0f})")
+
+# The CSV files and figures are only rewritten when the results changed (or a file is missing).
+output_files = ["baccarat_results.csv", "baccarat_EV.csv", "ev_per_bet.png", "ev_konvergenca.png"]
+write_outputs = not from_cache or not all(os.path.exists(f) for f in output_files)
+
+if write_outputs:
+    df = pd.DataFrame({
+        "Outcome": ["Player", "Banker", "Tie"],
+        "Win percentage": [player_share, banker_share, tie_share]
+
+    })
+
+    df.to_csv("baccarat_results.csv", index=False)
 
-df = pd.DataFrame({
-    "Outcome": ["Player", "Banker", "Tie"],
-    "Win percentage": [player_share, banker_share, tie_share]
-    
-})
+    df2 = pd.DataFrame({
+        "Outcome": ["Player", "Banker", "Tie"],
+        "Expected value": [player_ev, banker_ev, tie_ev]
 
-df.to_csv("baccarat_results.csv", index=False)
+    })
 
-df2 = pd.DataFrame({
-    "Outcome": ["Player", "Banker", "Tie"],
-    "Expected value": [player_ev, banker_ev, tie_ev]
-    
-})
+    df2.to_csv("baccarat_EV.csv", index=False)
 
-df2.to_csv("baccarat_EV.csv", index=False)
 
+    bets = ["Player", "Banker", "Tie", "Banker brez comisson"]
 
-bets = ["Player", "Banker", "Tie", "Banker brez comisson"]
+    evs = [player_ev, banker_ev, tie_ev, banker_no_commission_ev]
 
-evs = [player_ev, banker_ev, tie_ev, banker_no_commission_ev]
 
-        
 
 
-plt.figure(figsize=(4,3))
-plt.bar(bets, evs)
-plt.axhline(0, linewidth=1)
-plt.title("EV na stavo")
-plt.xticks(rotation=15)
-plt.grid(axis="y", alpha=0.3)
+    plt.figure(figsize=(4,3))
+    plt.bar(bets, evs)
+    plt.axhline(0, linewidth=1)
+    plt.title("EV na stavo")
+    plt.xticks(rotation=15)
+    plt.grid(axis="y", alpha=0.3)
 
-plt.savefig("ev_per_bet.png", dpi=300, bbox_inches="tight")
-plt.close()
+    plt.savefig("ev_per_bet.png", dpi=300, bbox_inches="tight")
+    plt.close()
 
 
 
-plt.figure(figsize=(4,3))
+    plt.figure(figsize=(4,3))
 
-plt.plot(checkpoints, banker_ev_history, label="Banker")
-plt.plot(checkpoints, player_ev_history, label="Player")
-plt.plot(checkpoints, tie_ev_history, label="Tie")
+    plot_paths({"Banker": banker_ev_history, "Player": player_ev_history, "Tie": tie_ev_history},
+               x=checkpoints)
+    if checkpoint_spacing == "log":
+        plt.xscale("log")
 
-plt.axhline(0, linewidth=1)
+    plt.axhline(0, linewidth=1)
 
-plt.xlabel("Število iger")
-plt.ylabel("EV na stavo")
-plt.title("EV konvergenca")
-plt.legend()
-plt.grid(alpha=0.3)
+    plt.xlabel("Število iger")
+    plt.ylabel("EV na stavo")
+    plt.title("EV konvergenca")
+    plt.legend()
+    plt.grid(alpha=0.3)
 
-plt.savefig("ev_konvergenca.png", dpi=300, bbox_inches="tight")
-plt.close()
+    plt.savefig("ev_konvergenca.png", dpi=300, bbox_inches="tight")
+    plt.close()
@@ -0,0 +1,154 @@
+# Streaming quantile sketches.
+# To report tail quantiles (the 1% / 5% final bankroll, the distribution of the maximum drawdown, ...) we would
+# have to keep every session's value in a list and sort it. A QuantileSketch (a KLL sketch) keeps only a few
+# hundred values however many it has seen: values are stored in levels, and when a level is full it is sorted
+# and every second value is promoted to the next level, where it stands for twice as many values.
+# The rank error is about 1.7 / k of the count (k=200 gives roughly 1%), sketches built in different chunks or
+# worker processes can be merged, and the memory stays bounded.
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+class QuantileSketch:
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.levels = [np.zeros(0)]
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.rng = np.random.default_rng(seed)
+
+    def capacity(self, level):
+        # The top level holds k values, every level below it 2/3 of the one above (but at least 2).
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values):
+        # Adding one value or a whole array of them.
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) == 0:
+            return self
+        self.count += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.zeros(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self.capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.zeros(0))
+                items = np.sort(items)
+                # An odd item stays behind; of the rest, a random half (odds or evens) moves up with double weight.
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                pairs = items[:len(items) - len(keep)]
+                promoted = pairs[self.rng.integers(2)::2]
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def _weighted(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** h) for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind="stable")
+        return values[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        if np.ndim(q):
+            return [self.quantile(x) for x in q]
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        values, cumulative = self._weighted()
+        index = np.searchsorted(cumulative, q * cumulative[-1], side="left")
+        return float(values[min(index, len(values) - 1)])
+
+    def rank(self, value):
+        # Estimated share of the values that are <= value.
+        if self.count == 0:
+            return None
+        values, cumulative = self._weighted()
+        index = np.searchsorted(values, value, side="right")
+        return float(cumulative[index - 1] / cumulative[-1]) if index else 0.0
+
+    def size(self):
+        return sum(len(items) for items in self.levels)
+
+
+# PER-STRATEGY SESSION METRICS
+
+
+def max_drawdown(path, initial_bankroll):
+    # Largest fall from a previous peak (the initial bankroll counts as the first peak).
+    # A bankroll can't fall below 0 (the last flat bet of a ruined session may overshoot), like in table.py.
+    path = np.r_[initial_bankroll, np.maximum(np.asarray(path, dtype=float), 0.0)]
+    return float((np.maximum.accumulate(path) - path).max())
+
+
+class SessionSketches:
+    # Sketches of the final bankroll, the peak bankroll and the maximum drawdown of many sessions.
+
+    METRICS = ("final_bankroll", "peak_bankroll", "max_drawdown")
+
+    def __init__(self, k=200, seed=None):
+        self.sketches = {metric: QuantileSketch(k, seed) for metric in self.METRICS}
+
+    def add_path(self, path, initial_bankroll):
+        path = np.asarray(path, dtype=float)
+        self.sketches["final_bankroll"].update(path[-1] if len(path) else initial_bankroll)
+        self.sketches["peak_bankroll"].update(max(initial_bankroll, path.max()) if len(path) else initial_bankroll)
+        self.sketches["max_drawdown"].update(max_drawdown(path, initial_bankroll))
+        return self
+
+    def add_results(self, results):
+        # A whole batch at once: a DataFrame from table.simulate_table or progressions.simulate_progressions.
+        for metric in self.METRICS:
+            self.sketches[metric].update(results[metric].to_numpy())
+        return self
+
+    def merge(self, other):
+        for metric in self.METRICS:
+            self.sketches[metric].merge(other.sketches[metric])
+        return self
+
+    def summary(self, quantiles=QUANTILES):
+        # One row per metric, one column per quantile.
+        rows = []
+        for metric, sketch in self.sketches.items():
+            row = {"metric": metric, "sessions": sketch.count}
+            for q in quantiles:
+                row[f"q{q * 100:g}"] = sketch.quantile(q)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def sketch_report(sketches, quantiles=QUANTILES):
+    # A tidy table for several strategies: {name: SessionSketches} -> one row per (strategy, metric).
+    frames = []
+    for name, s in sketches.items():
+        frame = s.summary(quantiles)
+        frame.insert(0, "strategy", name)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
@@ -1,60 +1,73 @@
 import matplotlib.pyplot as plt
 import pandas as pd
+from plotting import plot_paths
+from cache import cached_call, module_dependencies
+from progressions import FIBONACCI, progression_simulator
+from survival import RuinSurvival
+from sketches import SessionSketches, sketch_report
+from shuffles import generate_outcomes as shuffled_outcomes
+import math
+import os
+import random
+import statistics as stats
+
 
+from bacc import build_shoe, generate_outcomes, PLAYER, BANKER, TIE, OUTCOME_CODES
 
 # First we define a new function whose output will tell us given what actully happened in the game
 # and what we bet on, how much money do we win or lose.
+# The outcome can be an outcome code (PLAYER, BANKER, TIE) or the old string 'Player'/'Banker'/'Tie'.
 def settle_bet(outcome, bet_type, stake, commission=0.05):
+    return stake * payout_lookup(bet_type, commission)[outcome]
+
+# The payout per 1 unit staked for each outcome of a given bet. The simulators below look it up once per run,
+# so the per-hand work is a single indexing step instead of a chain of string comparisons.
+def payout_lookup(bet_type, commission=0.05):
 
     if bet_type == "Player":
-        if outcome == "Player":
-            return stake
-        elif outcome == "Banker":
-            return -stake
-        else:
-            return 0
+        payouts = {PLAYER: 1, BANKER: -1, TIE: 0}
 
     elif bet_type == "Banker":
-        if outcome == "Banker":
-            return stake * (1 - commission)
-        elif outcome == "Player":
-            return -stake
-        else:
-            return 0
+        payouts = {PLAYER: -1, BANKER: 1 - commission, TIE: 0}
 
     elif bet_type == "Tie":
-        if outcome == "Tie":
-            return stake * 8
-        else:
-            return -stake
+        payouts = {PLAYER: -1, BANKER: -1, TIE: 8}
+
+    else:
+        raise ValueError(f"Unknown bet type: {bet_type}")
 
+    for name, code in OUTCOME_CODES.items():
+        payouts[name] = payouts[code]
+    return payouts
 
-from bacc import build_shoe, play_bacc
 
 hands_number = 100000
 initial_bankroll = 100
 base_bet = 1
 bet_type = "Player"  # or Player or Tie
+num_simulations = 20
 
-# Generating the outcomes once:
-shoe = build_shoe()
-outcomes = []
-for i in range(hands_number):
-    outcome = play_bacc(shoe)
-    outcomes.append(outcome)
+# With a seed, results are cached on disk (see cache.py), keyed by the parameters and the code of the modules below,
+# so running the script again only recomputes what changed. With seed = None every run is a new random sample,
+# so nothing is cached.
+seed = 42
+# How the shoes are shuffled: None (uniform) or a spec from shuffles.py, for example "hand" or "csm".
+shuffle = None
+STRATEGY_MODULES = module_dependencies("strategies.py")
 
 # FIRST STRATEGY: FLAT BETTING
 # With this strategy you bet the same amount every hand, so there's no 'system' to recover losses.
 def simulate_flat(outcomes, initial_bankroll, base_bet, bet_type):
     bankroll = initial_bankroll
     path = []
+    payout = payout_lookup(bet_type)
 
     for outcome in outcomes:
         if bankroll <= 0:
             path.append(0)
             continue
 
-        profit = settle_bet(outcome, bet_type, base_bet)
+        profit = base_bet * payout[outcome]
         bankroll += profit
         path.append(bankroll)
 
@@ -69,6 +82,7 @@ def simulate_martingale(outcomes, initial_bankroll, base_bet, bet_type):
     bankroll = initial_bankroll
     path = []
     current_bet = base_bet
+    payout = payout_lookup(bet_type)
 
     for outcome in outcomes:
         if bankroll <= 0:
@@ -77,7 +91,7 @@ def simulate_martingale(outcomes, initial_bankroll, base_bet, bet_type):
 
         # Make sure we don't bet more than what we have
         stake = min(current_bet, bankroll)
-        profit = settle_bet(outcome, bet_type, stake)
+        profit = stake * payout[outcome]
         bankroll += profit
         path.append(bankroll)
 
@@ -99,6 +113,7 @@ def simulate_paroli(outcomes, initial_bankroll, base_bet, bet_type, max_bet=None
     current_bet = base_bet
     if max_bet is None:
         max_bet = initial_bankroll 
+    payout = payout_lookup(bet_type)
 
     for outcome in outcomes:
         if bankroll <= 0:
@@ -106,7 +121,7 @@ def simulate_paroli(outcomes, initial_bankroll, base_bet, bet_type, max_bet=None
             continue
 
         stake = min(current_bet, bankroll)
-        profit = settle_bet(outcome, bet_type, stake)
+        profit = stake * payout[outcome]
         bankroll += profit
         path.append(bankroll)
 
@@ -129,6 +144,7 @@ def simulate_dalembert(outcomes, initial_bankroll, base_bet, bet_type):
     bankroll = initial_bankroll
     path = []
     current_bet = base_bet
+    payout = payout_lookup(bet_type)
 
     for outcome in outcomes:
         if bankroll <= 0:
@@ -136,7 +152,7 @@ def simulate_dalembert(outcomes, initial_bankroll, base_bet, bet_type):
             continue
 
         stake = min(current_bet, bankroll)
-        profit = settle_bet(outcome, bet_type, stake)
+        profit = stake * payout[outcome]
         bankroll += profit
         path.append(bankroll)
 
@@ -147,11 +163,22 @@ def simulate_dalembert(outcomes, initial_bankroll, base_bet, bet_type):
 
     return path
 
+#   The Fibonacci system (and more, like Labouchère, 1-3-2-6 and Oscar's Grind) is described as data in
+#   progressions.py instead of another loop; simulate_fibonacci has the same signature as the functions above.
+simulate_fibonacci = progression_simulator(FIBONACCI)
+
 # RUNNING AND COMPARING
-flat_results = simulate_flat(outcomes, initial_bankroll, base_bet, bet_type)
-martingale_results = simulate_martingale(outcomes, initial_bankroll, base_bet, bet_type)
-paroli_results     = simulate_paroli(outcomes, initial_bankroll, base_bet, bet_type)
-dalembert_results  = simulate_dalembert(outcomes, initial_bankroll, base_bet, bet_type)
+# Generating the outcomes once and running every strategy on them.
+def run_strategy_paths(hands_number, initial_bankroll, base_bet, bet_type, seed, shuffle=None):
+    if seed is not None:
+        random.seed(seed)
+    outcomes = shuffled_outcomes(hands_number, shuffle)
+    return [
+        simulate_flat(outcomes, initial_bankroll, base_bet, bet_type),
+        simulate_martingale(outcomes, initial_bankroll, base_bet, bet_type),
+        simulate_paroli(outcomes, initial_bankroll, base_bet, bet_type),
+        simulate_dalembert(outcomes, initial_bankroll, base_bet, bet_type),
+    ]
 
 # Check if/when each strategy went broke
 def ruin_time(path):
@@ -160,25 +187,7 @@ def ruin_time(path):
             return i
     return None
 
-flat_ruin = ruin_time(flat_results)
-martingale_ruin = ruin_time(martingale_results)
-paroli_ruin = ruin_time(paroli_results)
-dalembert_ruin = ruin_time(dalembert_results)
-
-print(f"Final bankroll Flat: {flat_results[-1]}")
-print(f"Final bankroll Martingale: {martingale_results[-1]}")
-print(f"Final bankroll Paroli: {paroli_results[-1]}")
-print(f"Final bankroll D'Alembert: {dalembert_results[-1]}")
-print(f"Flat ruin at hand: {flat_ruin}")
-print(f"Martingale ruin at hand: {martingale_ruin}")
-print(f"Paroli ruin at hand: {paroli_ruin}")
-print(f"D'Alembert ruin at hand: {dalembert_ruin}")
-
 # Now we calculate the expected value per hand for each strategy and variance of bankroll changes.
-
-import statistics as stats
-import math
-
 def strategy_stats(path, initial_bankroll):
 
     # profit/loss per hand
@@ -197,22 +206,6 @@ def strategy_stats(path, initial_bankroll):
 
     return ev_per_hand, var_per_hand, vol_per_hand
 
-# Computing the stats for each strategy; ev will be the same for each strategy, the strategies only change how we lose, not how much
-flat_ev, flat_var, flat_vol = strategy_stats(flat_results, initial_bankroll)
-mart_ev, mart_var, mart_vol = strategy_stats(martingale_results, initial_bankroll)
-par_ev, par_var, par_vol = strategy_stats(paroli_results, initial_bankroll)
-dal_ev, dal_var, dal_vol = strategy_stats(dalembert_results, initial_bankroll)
-
-print("Approximate stats per hand:")
-print(f"Flat: EV = {flat_ev:.5f}, Var = {flat_var:.5f}, Vol = {flat_vol:.5f}")
-print(f"Martingale: EV = {mart_ev:.5f}, Var = {mart_var:.5f}, Vol = {mart_vol:.5f}")
-print(f"Paroli: EV = {par_ev:.5f}, Var = {par_var:.5f}, Vol = {par_vol:.5f}")
-print(f"D'Alembert: EV = {dal_ev:.5f}, Var = {dal_var:.5f}, Vol = {dal_vol:.5f}")
-
-
-
-num_simulations = 20      
-
             
 strategies = {
     "Flat": simulate_flat,
@@ -229,60 +222,130 @@ def truncate_at_ruin(path):
     return path
 
 
-average_ruin_times = {}
-for name, fn in strategies.items():
-    ruin_times = []
-    for sim in range(num_simulations):
-        shoe = build_shoe()
-        outcomes = [play_bacc(shoe) for _ in range(hands_number)]
-        path = fn(outcomes, initial_bankroll, base_bet, bet_type)
-        t = ruin_time(path)
-        if t is not None:
-            ruin_times.append(t)
-    average_ruin_times[name] = (sum(ruin_times)/len(ruin_times)) if ruin_times else None
-
-
-
-print(f"Average time to ruin over {num_simulations} simulations:")
-for name, avg_time in average_ruin_times.items():
-    if avg_time is not None:
-        print(f"{name}: {avg_time:.1f} hands")
-    else:
-        print(f"{name}: no ruin observed in {num_simulations} simulations")
-
-
-
-ruin_df = pd.DataFrame(list(average_ruin_times.items()), columns=["Strategy", "Average_Ruin_Hands"])
-
-# Replace None with a descriptive string if you want
-ruin_df["Average_Ruin_Hands"] = ruin_df["Average_Ruin_Hands"].apply(
-    lambda x: x if x is not None else "No ruin observed"
-)
-ruin_df.to_csv("avg_ruin_time.csv", index=False)
-
-
-
-
-
-max_hands = 3000
-
-plt.figure(figsize=(4,3))
-plt.plot(flat_results[:max_hands], label="Flat Betting")
-plt.plot(martingale_results[:max_hands], label="Martingale")
-plt.plot(paroli_results[:max_hands], label="Paroli")
-plt.plot(dalembert_results[:max_hands], label="D'Alembert")
-
-plt.xlabel("Število iger")
-plt.ylabel("Bankroll")
-plt.title(f"Čas do propada različnih strategij")
-plt.legend()
-plt.grid(alpha=0.3)
-
-plt.savefig("ruin_time.png", dpi=300, bbox_inches="tight")
-plt.show()
-
-
-
-
-
-
+# Besides the average over the runs that went broke, we keep a Kaplan–Meier survival estimate per strategy
+# (survival.py), in which the runs that never went broke count as censored at hands_number.
+def run_ruin_study(hands_number, num_simulations, initial_bankroll, base_bet, bet_type, seed, shuffle=None):
+    if seed is not None:
+        random.seed(seed + 1)
+    average_ruin_times = {}
+    survival = {}
+    sketches = {}
+    for name, fn in strategies.items():
+        ruin_times = []
+        survival[name] = RuinSurvival(hands_number)
+        sketches[name] = SessionSketches(seed=seed)
+        for sim in range(num_simulations):
+            outcomes = shuffled_outcomes(hands_number, shuffle)
+            path = fn(outcomes, initial_bankroll, base_bet, bet_type)
+            t = ruin_time(path)
+            if t is not None:
+                ruin_times.append(t)
+            survival[name].add([t], hands_number)
+            sketches[name].add_path(path, initial_bankroll)
+        average_ruin_times[name] = (sum(ruin_times)/len(ruin_times)) if ruin_times else None
+    return average_ruin_times, survival, sketches
+
+
+# THE SCRIPT
+# Everything above can be imported (the job server does); running the file does the study below.
+def main():
+    paths, paths_from_cache = cached_call(
+        "strategy_paths",
+        run_strategy_paths,
+        {"hands_number": hands_number, "initial_bankroll": initial_bankroll, "base_bet": base_bet,
+         "bet_type": bet_type, "seed": seed, "shuffle": shuffle},
+        modules=STRATEGY_MODULES,
+        enabled=seed is not None,
+    )
+    flat_results, martingale_results, paroli_results, dalembert_results = paths
+
+    flat_ruin = ruin_time(flat_results)
+    martingale_ruin = ruin_time(martingale_results)
+    paroli_ruin = ruin_time(paroli_results)
+    dalembert_ruin = ruin_time(dalembert_results)
+
+    print(f"Final bankroll Flat: {flat_results[-1]}")
+    print(f"Final bankroll Martingale: {martingale_results[-1]}")
+    print(f"Final bankroll Paroli: {paroli_results[-1]}")
+    print(f"Final bankroll D'Alembert: {dalembert_results[-1]}")
+    print(f"Flat ruin at hand: {flat_ruin}")
+    print(f"Martingale ruin at hand: {martingale_ruin}")
+    print(f"Paroli ruin at hand: {paroli_ruin}")
+    print(f"D'Alembert ruin at hand: {dalembert_ruin}")
+
+    # Computing the stats for each strategy; ev will be the same for each strategy, the strategies only change how we lose, not how much
+    flat_ev, flat_var, flat_vol = strategy_stats(flat_results, initial_bankroll)
+    mart_ev, mart_var, mart_vol = strategy_stats(martingale_results, initial_bankroll)
+    par_ev, par_var, par_vol = strategy_stats(paroli_results, initial_bankroll)
+    dal_ev, dal_var, dal_vol = strategy_stats(dalembert_results, initial_bankroll)
+
+    print("Approximate stats per hand:")
+    print(f"Flat: EV = {flat_ev:.5f}, Var = {flat_var:.5f}, Vol = {flat_vol:.5f}")
+    print(f"Martingale: EV = {mart_ev:.5f}, Var = {mart_var:.5f}, Vol = {mart_vol:.5f}")
+    print(f"Paroli: EV = {par_ev:.5f}, Var = {par_var:.5f}, Vol = {par_vol:.5f}")
+    print(f"D'Alembert: EV = {dal_ev:.5f}, Var = {dal_var:.5f}, Vol = {dal_vol:.5f}")
+
+    (average_ruin_times, ruin_survival, session_sketches), ruin_from_cache = cached_call(
+        "ruin_study",
+        run_ruin_study,
+        {"hands_number": hands_number, "num_simulations": num_simulations, "initial_bankroll": initial_bankroll,
+         "base_bet": base_bet, "bet_type": bet_type, "seed": seed, "shuffle": shuffle},
+        modules=STRATEGY_MODULES,
+        enabled=seed is not None,
+    )
+
+    print(f"Average time to ruin over {num_simulations} simulations:")
+    for name, avg_time in average_ruin_times.items():
+        if avg_time is not None:
+            print(f"{name}: {avg_time:.1f} hands")
+        else:
+            print(f"{name}: no ruin observed in {num_simulations} simulations")
+
+    survival_summaries = {name: s.summary() for name, s in ruin_survival.items()}
+    print(f"Survival estimate (runs still alive after {hands_number} hands are censored):")
+    for name, summary in survival_summaries.items():
+        print(f"{name}: P(ruin) = {summary['ruin_probability']:.2f}, median = {summary['median_ruin_hand']}, "
+              f"restricted mean = {summary['restricted_mean']:.0f} hands")
+
+    # Quantiles of the final bankroll, peak bankroll and maximum drawdown of every strategy (see sketches.py).
+    quantiles_df = sketch_report(session_sketches)
+    print(quantiles_df.to_string(index=False))
+
+    # The CSV file and the figure are only rewritten when the results changed (or a file is missing).
+    output_files = ["avg_ruin_time.csv", "strategy_quantiles.csv", "ruin_time.png"]
+    write_outputs = not (paths_from_cache and ruin_from_cache) or not all(os.path.exists(f) for f in output_files)
+
+    if write_outputs:
+        ruin_df = pd.DataFrame(list(average_ruin_times.items()), columns=["Strategy", "Average_Ruin_Hands"])
+
+        # Replace None with a descriptive string if you want
+        ruin_df["Average_Ruin_Hands"] = ruin_df["Average_Ruin_Hands"].apply(
+            lambda x: x if x is not None else "No ruin observed"
+        )
+        ruin_df["Ruin_Probability"] = [survival_summaries[name]["ruin_probability"] for name in ruin_df["Strategy"]]
+        ruin_df["Median_Ruin_Hands"] = [survival_summaries[name]["median_ruin_hand"] for name in ruin_df["Strategy"]]
+        ruin_df["Restricted_Mean_Hands"] = [survival_summaries[name]["restricted_mean"] for name in ruin_df["Strategy"]]
+        ruin_df.to_csv("avg_ruin_time.csv", index=False)
+        quantiles_df.to_csv("strategy_quantiles.csv", index=False)
+
+        plt.figure(figsize=(4,3))
+        # The whole paths, all hands_number hands: they are downsampled before drawing (see plotting.py).
+        plot_paths({
+            "Flat Betting": flat_results,
+            "Martingale": martingale_results,
+            "Paroli": paroli_results,
+            "D'Alembert": dalembert_results,
+        })
+
+        plt.xlabel("Število iger")
+        plt.ylabel("Bankroll")
+        plt.title(f"Čas do propada različnih strategij")
+        plt.legend()
+        plt.grid(alpha=0.3)
+
+        plt.savefig("ruin_time.png", dpi=300, bbox_inches="tight")
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# Survival analysis of the time to ruin.
+# Averaging the ruin hand over the runs that went broke (average_ruin_times in strategies.py and
+# time_to_ruin.py) drops every run that survived the whole horizon, so it underestimates how long a bankroll
+# lasts, and it says nothing at all when nobody went broke. The Kaplan–Meier estimator uses the survivors too:
+# they are right-censored at the hand where we stopped watching them.
+#
+# A RuinSurvival only stores two counts per hand (ruins and censored sessions), so it can be fed any number of
+# sessions chunk by chunk, and accumulators from different chunks or worker processes are combined with merge().
+# From the counts it gives the survival curve S(t) = P(still playing after t hands), the hazard (the chance
+# of going broke on hand t given the bankroll survived so far), Greenwood confidence bands, quantiles of the
+# ruin time with confidence intervals, and the restricted mean (expected hands survived within the horizon).
+
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+
+class RuinSurvival:
+
+    def __init__(self, horizon=0):
+        self.events = np.zeros(horizon + 1, dtype=np.int64)    # ruins on hand t
+        self.censored = np.zeros(horizon + 1, dtype=np.int64)  # sessions last seen alive after hand t
+
+    def _grow(self, horizon):
+        if horizon + 1 > len(self.events):
+            extra = horizon + 1 - len(self.events)
+            self.events = np.r_[self.events, np.zeros(extra, dtype=np.int64)]
+            self.censored = np.r_[self.censored, np.zeros(extra, dtype=np.int64)]
+
+    def add(self, ruin_hands, horizon):
+        # ruin_hands: the hand on which each session went broke (1-based), or -1 / None if it survived all
+        # `horizon` hands. horizon can also be an array with one horizon per session.
+        ruin = np.array([-1 if t is None else t for t in ruin_hands], dtype=np.int64) \
+            if not isinstance(ruin_hands, np.ndarray) else ruin_hands.astype(np.int64)
+        horizon = np.broadcast_to(np.asarray(horizon, dtype=np.int64), ruin.shape)
+        if len(ruin) == 0:
+            return self
+        self._grow(int(max(horizon.max(), ruin.max())))
+        ruined = ruin > 0
+        self.events += np.bincount(ruin[ruined], minlength=len(self.events))
+        self.censored += np.bincount(horizon[~ruined], minlength=len(self.censored))
+        return self
+
+    def add_paths(self, paths):
+        # Convenience for bankroll paths (lists like the simulate_* functions return).
+        ruin = []
+        horizon = []
+        for path in paths:
+            broke = np.flatnonzero(np.asarray(path) <= 0)
+            ruin.append(int(broke[0]) + 1 if len(broke) else -1)
+            horizon.append(len(path))
+        return self.add(np.array(ruin), np.array(horizon))
+
+    def merge(self, other):
+        self._grow(len(other.events) - 1)
+        self.events[:len(other.events)] += other.events
+        self.censored[:len(other.censored)] += other.censored
+        return self
+
+    @property
+    def sessions(self):
+        return int(self.events.sum() + self.censored.sum())
+
+    # ESTIMATES
+
+    def curve(self, confidence=0.95):
+        # The Kaplan–Meier curve for every hand 0..horizon, as a DataFrame. A session censored after hand t
+        # is still at risk on hand t (it survived it), which is the usual convention.
+        n = self.sessions
+        left = n - np.cumsum(self.events + self.censored)
+        at_risk = np.r_[n, left[:-1]]
+        d = self.events
+        with np.errstate(divide="ignore", invalid="ignore"):
+            hazard = np.where(at_risk > 0, d / at_risk, 0.0)
+            survival = np.cumprod(1 - hazard)
+            # Greenwood's formula, on the log(-log S) scale so the band stays inside [0, 1].
+            greenwood = np.cumsum(np.where(at_risk > d, d / (at_risk * (at_risk - d)), 0.0))
+            z = NormalDist().inv_cdf(0.5 + confidence / 2)
+            log_log = np.log(-np.log(survival))
+            spread = z * np.sqrt(greenwood) / np.abs(np.log(survival))
+            lower = np.exp(-np.exp(log_log + spread))
+            upper = np.exp(-np.exp(log_log - spread))
+        # Where S is still 1 (or already 0) the band collapses onto it.
+        lower = np.where(np.isfinite(lower), lower, survival)
+        upper = np.where(np.isfinite(upper), upper, survival)
+        return pd.DataFrame({
+            "hand": np.arange(len(d)),
+            "at_risk": at_risk,
+            "ruined": d,
+            "censored": self.censored,
+            "hazard": hazard,
+            "survival": survival,
+            "lower": lower,
+            "upper": upper,
+        })
+
+    def quantile(self, q, confidence=0.95, curve=None):
+        # The hand by which a share q of the sessions has gone broke (q=0.5 is the median ruin time), with a
+        # confidence interval read off the bands. None means it is not reached within the horizon.
+        curve = self.curve(confidence) if curve is None else curve
+        target = 1 - q
+
+        def first(column):
+            hit = np.flatnonzero(curve[column].to_numpy() <= target + 1e-12)
+            return int(hit[0]) if len(hit) else None
+
+        return {"estimate": first("survival"), "lower": first("lower"), "upper": first("upper")}
+
+    def restricted_mean(self, curve=None):
+        # Expected number of hands played before ruin, counting at most the horizon: the area under S(t).
+        curve = self.curve() if curve is None else curve
+        return float(curve["survival"].to_numpy()[:-1].sum())
+
+    def summary(self, quantiles=(0.05, 0.25, 0.5), confidence=0.95):
+        curve = self.curve(confidence)
+        horizon = len(self.events) - 1
+        result = {
+            "sessions": self.sessions,
+            "ruined": int(self.events.sum()),
+            "censored": int(self.censored.sum()),
+            "horizon": horizon,
+            "ruin_probability": 1 - float(curve["survival"].iloc[-1]),
+            "restricted_mean": self.restricted_mean(curve),
+        }
+        for q in quantiles:
+            estimate = self.quantile(q, confidence, curve)
+            name = "median" if q == 0.5 else f"q{int(round(q * 100)):02d}"
+            result[f"{name}_ruin_hand"] = estimate["estimate"]
+            result[f"{name}_lower"] = estimate["lower"]
+            result[f"{name}_upper"] = estimate["upper"]
+        return result
+
+
+# MANY SESSIONS
+
+
+def _survival_chunk(progression, bet_type, sessions, hands, initial_bankroll, base_bet, seed, chunk_index, rules):
+    # One chunk of sessions, dealt with the vectorized engine and played with the batched progression engine.
+    from progressions import simulate_progressions
+    from rules import deal_outcome_block
+
+    rng = np.random.default_rng([seed, chunk_index])
+    outcomes = deal_outcome_block(rules, sessions, hands, rng).T
+    seats = {
+        "progression": [progression] * sessions,
+        "bet_type": [bet_type] * sessions,
+        "base_bet": np.full(sessions, base_bet),
+        "bankroll": np.full(sessions, initial_bankroll),
+    }
+    result = simulate_progressions(outcomes, seats, commission=rules.commission)
+    return RuinSurvival(hands).add(result["ruin_hand"].to_numpy(), hands)
+
+
+def simulate_ruin_survival(progression="Flat", bet_type="Banker", sessions=100000, hands=1000,
+                           initial_bankroll=100, base_bet=1, seed=0, chunk_sessions=5000, workers=None,
+                           rules=None):
+    # Kaplan–Meier survival of many independent sessions (each a fresh sequence of `hands` hands).
+    # progression is a name from progressions.PROGRESSIONS (or a Progression); Flat, Martingale, Paroli and
+    # D'Alembert play exactly like strategies.simulate_*, so the curves are those systems' ruin times.
+    # Chunks run on a process pool and their accumulators are merged; memory per chunk is
+    # chunk_sessions * hands bytes of outcomes.
+    from rules import STANDARD
+
+    rules = STANDARD if rules is None else rules
+    chunks = [(i, min(chunk_sessions, sessions - begin)) for i, begin in enumerate(range(0, sessions, chunk_sessions))]
+    total = RuinSurvival(hands)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_survival_chunk, progression, bet_type, size, hands, initial_bankroll, base_bet,
+                               seed, i, rules) for i, size in chunks]
+        for f in futures:
+            total.merge(f.result())
+    return total
+
+
+if __name__ == "__main__":
+    import time
+
+    start = time.time()
+    for name in ["Flat", "Martingale", "Paroli", "D'Alembert"]:
+        survival = simulate_ruin_survival(name, "Banker", sessions=100000, hands=2000)
+        print(name, survival.summary())
+    print(f"Done in {time.time() - start:.1f}s")
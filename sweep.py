@@ -0,0 +1,231 @@
+# Parameter sweeps over table rules and betting setups.
+# Instead of editing the constants at the top of strategies.py / time_to_ruin.py and rerunning, we describe a
+# parameter space (a full grid or a random sample of it) and let run_sweep work through all of its cells:
+#   - cells that deal the same hands (same rules, hands, simulations and seed) are grouped, so the hands are
+#     dealt once and every strategy / bet type / bankroll of the group is settled on them in one
+#     table.simulate_table pass; the compiled rule tables are shared through rules.compile_rules,
+#   - the groups go to a process pool, the most expensive first, and a new one is only handed out when a worker
+#     is free, so the long cells don't end up queued behind the short ones,
+#   - every finished cell is appended to a CSV file straight away, and cells already in that file are skipped,
+#     so an interrupted sweep continues where it stopped.
+
+import hashlib
+import itertools
+import json
+import os
+import random
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from rules import Rules, deal_outcome_block
+from table import simulate_table
+
+# Every parameter of a cell and its default value.
+# The first group decides which hands are dealt, the second one who bets on them and how.
+DEAL_PARAMS = {
+    "number_of_decks": 8,
+    "penetration": None,
+    "cut_cards": 6,
+    "burn": 0,
+    "commission": 0.05,
+    "shuffle": "uniform",
+    "hands": 10000,
+    "num_simulations": 10,
+    "seed": 0,
+}
+SEAT_PARAMS = {
+    "strategy": "Flat",
+    "bet_type": "Banker",
+    "base_bet": 1,
+    "initial_bankroll": 100,
+}
+PARAMS = {**DEAL_PARAMS, **SEAT_PARAMS}
+
+# Largest number of cells settled in one task; bigger groups are split so the work spreads over the workers.
+MAX_SEATS_PER_TASK = 64
+
+
+# PARAMETER SPACES
+
+
+def grid(**axes):
+    # Every combination of the given values, for example grid(number_of_decks=[1, 6, 8], strategy=["Flat"]).
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[n] for n in names))]
+
+
+def sample_space(n_cells, seed=0, **axes):
+    # n_cells random cells. An axis given as a list is sampled uniformly from its values, an axis given as a
+    # (low, high) tuple uniformly from that range (whole numbers if both ends are whole numbers).
+    rng = random.Random(seed)
+    cells = []
+    for _ in range(n_cells):
+        cell = {}
+        for name, values in axes.items():
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    cell[name] = rng.randint(low, high)
+                else:
+                    cell[name] = rng.uniform(low, high)
+            else:
+                cell[name] = rng.choice(values)
+        cells.append(cell)
+    return cells
+
+
+def full_cell(cell):
+    unknown = set(cell) - set(PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+    return {**PARAMS, **cell}
+
+
+def cell_id(cell):
+    # A stable name for a cell, used to recognise cells that are already in the output file.
+    payload = json.dumps([cell[name] for name in PARAMS], default=repr)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+# WORK
+
+
+def cell_rules(cell):
+    return Rules(number_of_decks=cell["number_of_decks"], penetration=cell["penetration"],
+                 cut_cards=cell["cut_cards"], burn=cell["burn"], commission=cell["commission"],
+                 shuffle=cell["shuffle"])
+
+
+@lru_cache(maxsize=4)
+def dealt_outcomes(deal):
+    # (num_simulations, hands) outcome codes for one deal key. Cached, because a big group is split into
+    # several tasks and a worker often gets more than one of them.
+    cell = dict(zip(DEAL_PARAMS, deal))
+    rng = np.random.default_rng(cell["seed"])
+    return deal_outcome_block(cell_rules(cell), cell["num_simulations"], cell["hands"], rng)
+
+
+def run_task(deal, seats):
+    # Settling all the seats of one group on the same dealt hands. Every simulation is a separate column
+    # block of one table, so the whole task is one simulate_table call.
+    cell = dict(zip(DEAL_PARAMS, deal))
+    outcomes = dealt_outcomes(deal)
+    sims = cell["num_simulations"]
+    bettors = {
+        "bet_type": np.repeat([s["bet_type"] for s in seats], sims),
+        "strategy": np.repeat([s["strategy"] for s in seats], sims),
+        "base_bet": np.repeat([float(s["base_bet"]) for s in seats], sims),
+        "bankroll": np.repeat([float(s["initial_bankroll"]) for s in seats], sims),
+    }
+    columns = np.tile(np.arange(sims), len(seats))
+    table, _ = simulate_table(outcomes.T[:, columns], bettors, commission=cell["commission"])
+
+    rows = []
+    for i, seat in enumerate(seats):
+        runs = table.iloc[i * sims:(i + 1) * sims]
+        ruined = runs["ruin_hand"] > 0
+        row = {**cell, **seat}
+        row.update({
+            "cell_id": cell_id(row),
+            "ruin_rate": float(ruined.mean()),
+            "mean_ruin_hand": float(runs["ruin_hand"][ruined].mean()) if ruined.any() else None,
+            "mean_final_bankroll": float(runs["final_bankroll"].mean()),
+            "mean_net": float(runs["net"].mean()),
+            "mean_peak_bankroll": float(runs["peak_bankroll"].mean()),
+            "mean_hands_played": float(runs["hands_played"].mean()),
+            "ev_per_unit": float(runs["net"].sum() / runs["wagered"].sum()) if runs["wagered"].sum() else 0.0,
+        })
+        rows.append(row)
+    return rows
+
+
+def plan_tasks(cells):
+    # Grouping cells by the hands they need and ordering the tasks from the most to the least expensive.
+    groups = {}
+    for cell in cells:
+        deal = tuple(cell[name] for name in DEAL_PARAMS)
+        seat = {name: cell[name] for name in SEAT_PARAMS}
+        if seat not in groups.setdefault(deal, []):
+            groups[deal].append(seat)
+    tasks = []
+    for deal, seats in groups.items():
+        for begin in range(0, len(seats), MAX_SEATS_PER_TASK):
+            tasks.append((deal, seats[begin:begin + MAX_SEATS_PER_TASK]))
+    # Dealing costs about as much as settling a few seats; settling grows with seats, hands and simulations.
+    hands = list(DEAL_PARAMS).index("hands")
+    sims = list(DEAL_PARAMS).index("num_simulations")
+    tasks.sort(key=lambda t: t[0][hands] * t[0][sims] * (4 + len(t[1])), reverse=True)
+    return tasks
+
+
+# RUNNING
+
+
+def finished_cells(output):
+    if output is None or not os.path.exists(output):
+        return set()
+    return set(pd.read_csv(output, usecols=["cell_id"])["cell_id"])
+
+
+def append_rows(output, rows):
+    if output is None:
+        return
+    frame = pd.DataFrame(rows, columns=list(PARAMS) + [c for c in rows[0] if c not in PARAMS])
+    frame.to_csv(output, mode="a", header=not os.path.exists(output), index=False)
+
+
+def run_sweep(cells, output="sweep.csv", workers=None, verbose=True):
+    # Runs every cell not yet in `output` and returns the table of all cells (old and new) as a DataFrame.
+    # workers=0 runs everything in this process, which is handy for debugging.
+    cells = [full_cell(c) for c in cells]
+    done = finished_cells(output)
+    todo = [c for c in cells if cell_id(c) not in done]
+    tasks = plan_tasks(todo)
+    if verbose:
+        print(f"{len(cells)} cells, {len(cells) - len(todo)} already done, {len(tasks)} tasks to run")
+
+    new_rows = []
+
+    def collect(rows):
+        append_rows(output, rows)
+        new_rows.extend(rows)
+        if verbose:
+            print(f"  {len(new_rows)}/{len(todo)} cells finished")
+
+    if workers == 0:
+        for deal, seats in tasks:
+            collect(run_task(deal, seats))
+    else:
+        workers = workers or os.cpu_count()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Only a couple of tasks per worker are queued at any time, the rest are handed out as workers free up.
+            in_flight = 2 * workers
+            pending = set()
+            queue = iter(tasks)
+            for task in itertools.islice(queue, in_flight):
+                pending.add(pool.submit(run_task, *task))
+            while pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    collect(future.result())
+                for task in itertools.islice(queue, len(finished)):
+                    pending.add(pool.submit(run_task, *task))
+
+    if output is not None and os.path.exists(output):
+        return pd.read_csv(output)
+    return pd.DataFrame(new_rows)
+
+
+if __name__ == "__main__":
+    cells = grid(
+        number_of_decks=[1, 2, 6, 8],
+        penetration=[None, 0.75],
+        strategy=["Flat", "Martingale", "Paroli", "D'Alembert"],
+        bet_type=["Player", "Banker", "Tie"],
+        initial_bankroll=[50, 100, 500],
+    )
+    results = run_sweep(cells, output="sweep.csv")
+    print(results.groupby(["strategy", "bet_type"])[["ruin_rate", "mean_net"]].mean())
@@ -0,0 +1,152 @@
+# Multi-seat table simulation.
+# In strategies.py every strategy run deals its own hands for a single bettor. Here we deal each hand once
+# and settle it against a whole population of bettors at the same time, each with its own bet type,
+# progression state and bankroll. All the per-seat work is done with NumPy, so the cost of dealing a hand
+# is shared by every seat at the table.
+
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from bacc import OUTCOME_CODES
+from payouts import outcome_payouts
+from shuffles import generate_outcomes
+
+BET_TYPES = ["Player", "Banker", "Tie"]
+STRATEGIES = ["Flat", "Martingale", "Paroli", "D'Alembert"]
+
+
+def payout_table(commission=0.05):
+    # Rows are bet types, columns are outcomes (Player, Banker, Tie); same numbers as settle_bet in strategies.py.
+    return outcome_payouts(commission, BET_TYPES)
+
+
+# Building a population of bettors: every combination of the given bet types, strategies, base bets and bankrolls.
+def bettor_grid(bet_types=BET_TYPES, strategies=STRATEGIES, base_bets=(1,), bankrolls=(100,)):
+    rows = list(itertools.product(bet_types, strategies, base_bets, bankrolls))
+    return {
+        "bet_type": np.array([r[0] for r in rows]),
+        "strategy": np.array([r[1] for r in rows]),
+        "base_bet": np.array([r[2] for r in rows], dtype=float),
+        "bankroll": np.array([r[3] for r in rows], dtype=float),
+    }
+
+
+def deal_outcomes(hands_number, number_of_decks=8, shuffle=None):
+    # shuffle: a shuffle model or spec from shuffles.py; None is the uniform random.shuffle.
+    return generate_outcomes(hands_number, shuffle, number_of_decks)
+
+
+# The table simulator. The progression rules are exactly the ones from simulate_flat, simulate_martingale,
+# simulate_paroli and simulate_dalembert, so every seat follows the same path as the single-bettor version
+# would on the same outcomes.
+# outcomes is either one sequence dealt to the whole table, or a (hands, seats) array in which every seat
+# plays its own sequence (sweep.py uses this to run many independent simulations in one pass).
+def simulate_table(outcomes, bettors, commission=0.05):
+    bet_index = np.array([BET_TYPES.index(b) for b in bettors["bet_type"]])
+    strategy_index = np.array([STRATEGIES.index(s) for s in bettors["strategy"]])
+    n = len(bet_index)
+
+    # We sort the seats by strategy, so that each progression rule only touches one contiguous slice.
+    order = np.argsort(strategy_index, kind="stable")
+    bet_index = bet_index[order]
+    strategy_index = strategy_index[order]
+    base_bet = np.asarray(bettors["base_bet"], dtype=float)[order]
+    initial_bankroll = np.asarray(bettors["bankroll"], dtype=float)[order]
+    bounds = np.searchsorted(strategy_index, np.arange(len(STRATEGIES) + 1))
+    flat, martingale, paroli, dalembert = (slice(bounds[k], bounds[k + 1]) for k in range(len(STRATEGIES)))
+
+    # Payout of every seat for each of the three outcomes, computed once instead of once per hand.
+    seat_payouts = payout_table(commission)[bet_index].T.copy()
+
+    per_seat = np.ndim(outcomes) == 2
+    if per_seat:
+        outcomes = np.asarray(outcomes)[:, order]
+        seat_columns = np.arange(n)
+
+    bankroll = initial_bankroll.copy()
+    current_bet = base_bet.copy()
+    peak = bankroll.copy()
+    drawdown = np.zeros(n)
+    wagered = np.zeros(n)
+    hands_played = np.zeros(n, dtype=np.int64)
+    ruin_hand = np.full(n, -1, dtype=np.int64)
+    casino_win = 0.0
+    hand = 0
+
+    for hand, outcome in enumerate(outcomes, start=1):
+        if per_seat:
+            payouts = seat_payouts[outcome, seat_columns]
+        else:
+            payouts = seat_payouts[OUTCOME_CODES[outcome] if isinstance(outcome, str) else outcome]
+        alive = bankroll > 0
+
+        # Flat betting always stakes the base bet, the other systems never bet more than the bankroll.
+        stake = np.minimum(current_bet, bankroll)
+        stake[flat] = base_bet[flat]
+        stake[~alive] = 0.0
+
+        profit = stake * payouts
+        bankroll += profit
+        wagered += stake
+        hands_played += alive
+        casino_win -= float(profit.sum())
+        np.maximum(peak, bankroll, out=peak)
+        np.maximum(drawdown, peak - np.maximum(bankroll, 0.0), out=drawdown)
+
+        broke = alive & (bankroll <= 0)
+        ruin_hand[broke] = hand
+
+        win = profit > 0
+        w = win[martingale]
+        current_bet[martingale] = np.where(w, base_bet[martingale],
+                                           np.minimum(current_bet[martingale] * 2, bankroll[martingale]))
+        w = win[paroli]
+        current_bet[paroli] = np.where(w, np.minimum(current_bet[paroli] * 2, initial_bankroll[paroli]),
+                                       base_bet[paroli])
+        w = win[dalembert]
+        current_bet[dalembert] = np.where(w, np.maximum(base_bet[dalembert], current_bet[dalembert] - 1),
+                                          current_bet[dalembert] + 1)
+
+    # A ruined bettor leaves the table with 0, like the paths in strategies.py.
+    final_bankroll = np.where(ruin_hand > 0, 0.0, bankroll)
+
+    inverse = np.empty(n, dtype=np.int64)
+    inverse[order] = np.arange(n)
+    seats = pd.DataFrame({
+        "bet_type": np.asarray(bettors["bet_type"]),
+        "strategy": np.asarray(bettors["strategy"]),
+        "base_bet": base_bet[inverse],
+        "initial_bankroll": initial_bankroll[inverse],
+        "final_bankroll": final_bankroll[inverse],
+        "peak_bankroll": peak[inverse],
+        "max_drawdown": drawdown[inverse],
+        "ruin_hand": ruin_hand[inverse],
+        "hands_played": hands_played[inverse],
+        "wagered": wagered[inverse],
+    })
+    seats["net"] = seats["final_bankroll"] - seats["initial_bankroll"]
+
+    total_wagered = float(wagered.sum())
+    casino = {
+        "seats": n,
+        "hands": hand,
+        "casino_win": casino_win,
+        "total_wagered": total_wagered,
+        "hold": casino_win / total_wagered if total_wagered > 0 else 0.0,
+        "ruined_seats": int((ruin_hand > 0).sum()),
+    }
+    return seats, casino
+
+
+if __name__ == "__main__":
+    import time
+
+    bettors = bettor_grid(base_bets=(1, 2, 5), bankrolls=(50, 100, 500, 1000))
+    outcomes = deal_outcomes(10000)
+    start = time.time()
+    seats, casino = simulate_table(outcomes, bettors)
+    print(f"{casino['seats']} seats x {casino['hands']} hands in {time.time() - start:.2f}s")
+    print(f"Casino win: {casino['casino_win']:.2f}, hold: {casino['hold'] * 100:.3f}%, ruined seats: {casino['ruined_seats']}")
+    print(seats.groupby(["bet_type", "strategy"])[["net", "ruin_hand"]].mean())
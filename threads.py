@@ -0,0 +1,303 @@
+# Running the engines on threads.
+# The parallel runs (corpus.py, sweep.py, background.py) use process pools, because with the GIL only one
+# thread runs Python code at a time. Processes cost a fork or spawn, and every job and result is pickled,
+# which is a large part of a short simulation. Free-threaded builds of CPython (3.13t and later) run threads
+# in parallel, and a thread pool then has none of those costs.
+#
+# A run here is a job dealt in chunks. The chunks are split between the workers up front (chunk i goes to
+# worker i % workers), and every worker keeps its own accumulator, so the workers never take a lock or
+# share a counter. The accumulators are merged once, when all workers are done. Every chunk has its own
+# random streams, seeded from (seed, chunk index):
+#   - a NumPy Generator for the vectorized engines (batch_bacc, rules.deal_batch),
+#   - a random.Random for the list engines (bacc, strategies, progressions), which otherwise all shuffle
+#     with the random module's one shared state (see ShuffleModel.bind).
+# A chunk also builds its own shoes, so nothing mutable is shared between threads, and the result of a run
+# doesn't depend on the number of workers or on threads vs processes (only the bootstrap intervals of
+# run_counting do, because every worker draws its own bootstrap weights).
+#
+# executor="auto" uses threads when the GIL is disabled and falls back to processes otherwise. The same jobs
+# run in both, so nothing else changes. scaling_report times a job at several worker counts.
+
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from background import CHUNK_HANDS, EVAccumulator, BinAccumulator, _ev_chunk, _counting_chunk, split_hands
+from corpus import outcome_ev
+from rules import COUNTING, STANDARD, generate_outcomes
+
+
+def gil_enabled():
+    # sys._is_gil_enabled exists from 3.13 on; older versions always have the GIL. A free-threaded build turns
+    # the GIL back on when it imports an extension module that doesn't support running without it, so this
+    # is asked when a run starts, not at import time.
+    check = getattr(sys, "_is_gil_enabled", None)
+    return True if check is None else bool(check())
+
+
+def resolve_executor(executor="auto"):
+    if executor in (None, "auto"):
+        return "process" if gil_enabled() else "thread"
+    if executor not in ("thread", "process"):
+        raise ValueError(f"Unknown executor: {executor}")
+    return executor
+
+
+def chunk_random(seed, chunk_index):
+    # The random.Random of a chunk, seeded from (seed, chunk index) like the chunk's NumPy Generator.
+    state = np.random.SeedSequence([seed, chunk_index]).generate_state(4)
+    return random.Random(int.from_bytes(state.tobytes(), "little"))
+
+
+# JOBS
+# A job has chunk(hands, chunk_index), which deals one chunk, and accumulator(worker), a new accumulator with
+# add(chunk result), merge(other accumulator) and result(). Jobs are plain classes, so a process pool can
+# pickle them.
+
+
+class EVJob:
+    # EV and standard error of every bet type, with the vectorized engine (background.start_ev).
+
+    def __init__(self, rules=STANDARD, seed=0):
+        self.rules = rules
+        self.seed = seed
+
+    def accumulator(self, worker):
+        return EVAccumulator(self.rules)
+
+    def chunk(self, hands, chunk_index):
+        return _ev_chunk(hands, self.rules, self.seed, chunk_index)
+
+
+class CountingJob:
+    # The per-bin Tie table of a counting system, with the vectorized engine (background.start_counting).
+
+    def __init__(self, system="Even-Good", method="true", bin_width=None, count_range=None, rules=COUNTING,
+                 seed=0, replicates=200):
+        from batch_bacc import count_weight_matrix
+        from contunt_2 import COUNTING_SYSTEMS
+
+        if method not in ("true", "running"):
+            raise ValueError(f"Unknown counting method: {method}")
+        self.method = method
+        self.bin_width = bin_width or (1.0 if method == "true" else 5)
+        self.min_count, self.max_count = count_range or ((-10, 10) if method == "true" else (-60, 60))
+        self.weights = count_weight_matrix([COUNTING_SYSTEMS[system]])
+        self.rules = rules
+        self.seed = seed
+        self.replicates = replicates
+
+    def accumulator(self, worker):
+        return BinAccumulator(self.bin_width, self.min_count, self.replicates, [self.seed, worker])
+
+    def chunk(self, hands, chunk_index):
+        return _counting_chunk(hands, self.rules, self.weights, self.seed, chunk_index, self.method,
+                               self.bin_width, self.min_count, self.max_count)
+
+
+class OutcomeAccumulator:
+
+    def __init__(self, commission=0.05):
+        self.commission = commission
+        self.counts = np.zeros(3, dtype=np.int64)
+
+    def add(self, counts):
+        self.counts += counts
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def result(self):
+        return outcome_ev(self.counts, self.commission)
+
+
+class OutcomeJob:
+    # Outcome counts and EV per bet from the reference list engine (bacc.play_bacc_code), every chunk on a
+    # list shoe of its own. This is pure Python, so it only runs in parallel on threads without the GIL.
+
+    def __init__(self, rules=STANDARD, seed=0):
+        self.rules = rules
+        self.seed = seed
+
+    def accumulator(self, worker):
+        return OutcomeAccumulator(self.rules.commission)
+
+    def chunk(self, hands, chunk_index):
+        outcomes = generate_outcomes(hands, self.rules, rng=chunk_random(self.seed, chunk_index))
+        return np.bincount(np.frombuffer(outcomes, dtype=np.int8), minlength=3)
+
+
+class SessionAccumulator:
+
+    def __init__(self, paths=False):
+        self.sessions = []
+        self.paths = {} if paths else None
+
+    def add(self, chunk):
+        sessions, history = chunk
+        self.sessions.append(sessions)
+        if self.paths is not None:
+            self.paths[int(sessions["session"].iloc[0])] = history
+
+    def merge(self, other):
+        self.sessions.extend(other.sessions)
+        if self.paths is not None:
+            self.paths.update(other.paths)
+        return self
+
+    def result(self):
+        # One row per seat and session, in session order; with paths also the bankroll of every seat after
+        # every hand, shape (sessions, hands, seats).
+        table = pd.concat(self.sessions).sort_values(["session", "seat"], ignore_index=True) \
+            if self.sessions else pd.DataFrame()
+        if self.paths is None:
+            return table
+        return table, np.array([self.paths[session] for session in sorted(self.paths)])
+
+
+class ProgressionJob:
+    # Betting progressions (progressions.simulate_progressions): every chunk is one session of `hands` hands
+    # from the list engine, played by all seats. Flat, Martingale, Paroli and D'Alembert are the systems of
+    # strategies.py (simulate_flat & co. hand for hand), and Fibonacci is strategies.simulate_fibonacci.
+
+    def __init__(self, seats, rules=STANDARD, seed=0, paths=False):
+        from progressions import PROGRESSIONS
+
+        self.seats = seats
+        self.rules = rules
+        self.seed = seed
+        self.paths = paths
+        # The progression tables are built here, before any thread could race to build them.
+        for progression in seats["progression"]:
+            (PROGRESSIONS[progression] if isinstance(progression, str) else progression).compile()
+
+    def accumulator(self, worker):
+        return SessionAccumulator(self.paths)
+
+    def outcomes(self, hands, chunk_index):
+        # The outcomes of a session; the same on any thread, process or serial run.
+        return np.frombuffer(generate_outcomes(hands, self.rules, rng=chunk_random(self.seed, chunk_index)),
+                             dtype=np.int8)
+
+    def chunk(self, hands, chunk_index):
+        from progressions import simulate_progressions
+
+        sessions, history = simulate_progressions(self.outcomes(hands, chunk_index), self.seats,
+                                                  self.rules.commission, paths=True)
+        sessions.insert(0, "session", chunk_index)
+        sessions.insert(1, "seat", np.arange(len(sessions)))
+        return sessions, history if self.paths else None
+
+
+# RUNNING
+
+
+def _work(job, worker, chunks):
+    # One worker: its chunks, one after the other, into its own accumulator.
+    accumulator = job.accumulator(worker)
+    for hands, chunk_index in chunks:
+        accumulator.add(job.chunk(hands, chunk_index))
+    return accumulator
+
+
+def run_job(job, chunk_sizes, workers=None, executor="auto"):
+    # Deals the chunks (a list of hands per chunk) on `workers` threads or processes. Returns a dict with the
+    # merged result and the timing:
+    #   result, executor, workers, gil_enabled, hands, seconds, hands_per_second
+    executor = resolve_executor(executor)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(chunk_sizes)))
+    plan = [[(size, i) for i, size in enumerate(chunk_sizes) if i % workers == worker] for worker in range(workers)]
+    pool_class = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+
+    start = time.perf_counter()
+    with pool_class(max_workers=workers) as pool:
+        futures = [pool.submit(_work, job, worker, chunks) for worker, chunks in enumerate(plan)]
+        accumulators = [future.result() for future in futures]
+    accumulator = accumulators[0]
+    for other in accumulators[1:]:
+        accumulator.merge(other)
+    result = accumulator.result()
+    seconds = time.perf_counter() - start
+
+    hands = int(sum(chunk_sizes))
+    return {
+        "result": result,
+        "executor": executor,
+        "workers": workers,
+        "gil_enabled": gil_enabled(),
+        "hands": hands,
+        "seconds": seconds,
+        "hands_per_second": hands / seconds if seconds > 0 else float("inf"),
+    }
+
+
+def run_ev(hands=10_000_000, rules=STANDARD, seed=0, chunk_hands=CHUNK_HANDS, workers=None, executor="auto"):
+    # The result rows of background.start_ev.
+    return run_job(EVJob(rules, seed), split_hands(hands, chunk_hands), workers, executor)
+
+
+def run_counting(system="Even-Good", method="true", hands=10_000_000, bin_width=None, count_range=None,
+                 rules=COUNTING, seed=0, chunk_hands=CHUNK_HANDS, replicates=200, workers=None, executor="auto"):
+    # The bin table of background.start_counting / contunt_2.compare_methods.
+    job = CountingJob(system, method, bin_width, count_range, rules, seed, replicates)
+    return run_job(job, split_hands(hands, chunk_hands), workers, executor)
+
+
+def run_outcomes(hands=1_000_000, rules=STANDARD, seed=0, chunk_hands=50_000, workers=None, executor="auto"):
+    # The EV summary of corpus.corpus_ev, from the reference engine.
+    return run_job(OutcomeJob(rules, seed), split_hands(hands, chunk_hands), workers, executor)
+
+
+def progression_seats(progressions=None, bet_type="Banker", bankroll=100, base_bet=1):
+    from progressions import PROGRESSIONS
+
+    names = list(PROGRESSIONS) if progressions is None else list(progressions)
+    return {"progression": names, "bet_type": [bet_type] * len(names), "base_bet": [base_bet] * len(names),
+            "bankroll": [bankroll] * len(names)}
+
+
+def run_progressions(sessions=100, hands=10_000, progressions=None, bet_type="Banker", bankroll=100, base_bet=1,
+                     rules=STANDARD, seed=0, workers=None, executor="auto", paths=False):
+    # `sessions` sessions of `hands` hands, each played by every progression (by default all of
+    # progressions.PROGRESSIONS); one row per seat and session, as progressions.simulate_progressions.
+    # paths=True also returns every bankroll path (see SessionAccumulator.result).
+    job = ProgressionJob(progression_seats(progressions, bet_type, bankroll, base_bet), rules, seed, paths)
+    return run_job(job, [hands] * sessions, workers, executor)
+
+
+def scaling_report(run=run_ev, workers=None, executors=("auto",), **options):
+    # Times run (run_ev, run_counting, run_outcomes or run_progressions, with **options) at every worker
+    # count (by default 1, 2, 4, ... up to the number of CPUs). speedup is relative to the first worker count
+    # of the same executor, efficiency is speedup per worker added.
+    cpus = os.cpu_count() or 1
+    workers = workers or sorted({2 ** k for k in range(cpus.bit_length())} | {cpus})
+    rows = []
+    for executor in executors:
+        first = None
+        for n in workers:
+            timing = run(workers=n, executor=executor, **options)
+            first = first or timing
+            speedup = first["seconds"] / timing["seconds"]
+            rows.append({
+                "executor": timing["executor"],
+                "workers": timing["workers"],
+                "gil_enabled": timing["gil_enabled"],
+                "hands": timing["hands"],
+                "seconds": timing["seconds"],
+                "hands_per_second": timing["hands_per_second"],
+                "speedup": speedup,
+                "efficiency": speedup * first["workers"] / timing["workers"],
+            })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    print(f"GIL enabled: {gil_enabled()}, running on {resolve_executor()}s")
+    print(scaling_report(run_outcomes, hands=2_000_000).to_string(index=False))
+    print(scaling_report(run_ev, hands=20_000_000).to_string(index=False))
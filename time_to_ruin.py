@@ -1,7 +1,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from bacc import build_shoe, play_bacc
+from shuffles import generate_outcomes
 from strategies import simulate_flat, simulate_dalembert, simulate_martingale, simulate_paroli
+from survival import RuinSurvival
 
 # --- Settings ---
 hands_per_sim = 10000      # number of hands per simulation for plotting
@@ -10,6 +11,7 @@ initial_bankroll = 100
 base_bet = 1
 bet_type = "Banker"        
 window_var = 100           
+shuffle = None             # or a shuffle spec from shuffles.py, for example "hand" or "csm"
 
 strategies = {
     "Flat": simulate_flat,
@@ -32,16 +34,20 @@ def truncate_at_ruin(path):
     return path
 
 
+# The average below only uses the runs that went broke. The survival estimate (see survival.py) also counts the
+# runs that were still alive after hands_per_sim hands, so it doesn't underestimate how long a bankroll lasts.
 average_ruin_times = {}
+survival = {}
 for name, fn in strategies.items():
     ruin_times = []
+    survival[name] = RuinSurvival(hands_per_sim)
     for sim in range(num_simulations):
-        shoe = build_shoe()
-        outcomes = [play_bacc(shoe) for _ in range(hands_per_sim)]
+        outcomes = generate_outcomes(hands_per_sim, shuffle)
         path = fn(outcomes, initial_bankroll, base_bet, bet_type)
         t = ruin_time(path)
         if t is not None:
             ruin_times.append(t)
+        survival[name].add([t], hands_per_sim)
     average_ruin_times[name] = (sum(ruin_times)/len(ruin_times)) if ruin_times else None
 
 
@@ -52,3 +58,11 @@ for name, avg_time in average_ruin_times.items():
         print(f"{name}: {avg_time:.1f} hands")
     else:
         print(f"{name}: no ruin observed in {num_simulations} simulations")
+
+print(f"Survival estimate (runs still alive after {hands_per_sim} hands are censored):")
+for name, s in survival.items():
+    summary = s.summary()
+    median = summary["median_ruin_hand"]
+    median = f"{median} hands" if median is not None else f"more than {hands_per_sim} hands"
+    print(f"{name}: P(ruin) = {summary['ruin_probability']:.2f}, median time to ruin {median}, "
+          f"expected hands within the horizon {summary['restricted_mean']:.0f}")